@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+KeePass Git Sync benchmark
+
+Measures change-detection latency, end-to-end sync latency, throughput under
+repeated saves and repository growth over many commits. Every run works on a
+throwaway repository whose remote is a local bare repository, so no network
+access is needed, and the database is replaced by synthetic KDBX-sized files.
+
+Results are printed as a summary and written as JSON for tracking regressions:
+
+    python benchmark-sync.py --sizes 1,10,50 --output benchmark-results.json
+"""
+
+import os
+import time
+import json
+import queue
+import shutil
+import hashlib
+import platform
+import tempfile
+import threading
+import subprocess
+import importlib.util
+from datetime import datetime
+from pathlib import Path
+
+
+def kdbx_header():
+    """KDBX 4.0 header (signature, version, cipher and end fields) followed by
+    its SHA-256 and a stand-in HMAC, so the file passes the integrity check"""
+    header = bytes.fromhex("03d9a29a67fb4bb5") + (0).to_bytes(2, 'little') + (4).to_bytes(2, 'little')
+    for field_id, data in ((2, bytes.fromhex("31c1f2e6bf714350be5805216afc5aff")), (0, b"\r\n\r\n")):
+        header += bytes([field_id]) + len(data).to_bytes(4, 'little') + data
+    return header + hashlib.sha256(header).digest() + os.urandom(32)
+
+
+# The payload is random, like an encrypted database that is re-encrypted on every save
+KDBX_HEADER = kdbx_header()
+DB_FILENAME = "Passwords.kdbx"
+MB = 1024 * 1024
+
+
+def load_app():
+    """Import keepass-sync-tray.py (hyphenated, so not importable by name)"""
+    script = Path(__file__).resolve().with_name("keepass-sync-tray.py")
+    spec = importlib.util.spec_from_file_location("keepass_sync_tray", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def git(args, cwd):
+    return subprocess.run(["git"] + args, cwd=str(cwd), check=True, capture_output=True, text=True,
+                          env=dict(os.environ, LC_ALL='C', GIT_TERMINAL_PROMPT='0')).stdout
+
+
+def prepare_database(path, size):
+    """Write a new synthetic database next to path, the way KeePass saves"""
+    tmp_file = path.with_name(path.name + ".tmp")
+    with open(tmp_file, 'wb') as f:
+        f.write(KDBX_HEADER)
+        # HMAC blocks of up to 1 MiB (32-byte MAC, length, data), then an empty end block
+        remaining = size - len(KDBX_HEADER) - 36
+        while remaining > 36:
+            chunk = min(remaining - 36, MB)
+            f.write(os.urandom(32) + chunk.to_bytes(4, 'little') + os.urandom(chunk))
+            remaining -= chunk + 36
+        f.write(os.urandom(32) + (0).to_bytes(4, 'little'))
+    return tmp_file
+
+
+def save_database(path, size):
+    """Save a new version of the database: write a temp file, rename it over"""
+    os.replace(prepare_database(path, size), path)
+
+
+def make_repository(root, size):
+    """Create remote.git (bare) and a clone in work/ holding the database"""
+    remote = root / "remote.git"
+    work = root / "work"
+    git(["init", "--quiet", "--bare", str(remote)], root)
+    git(["init", "--quiet", str(work)], root)
+    git(["config", "user.name", "Benchmark"], work)
+    git(["config", "user.email", "benchmark@localhost"], work)
+    git(["remote", "add", "origin", str(remote)], work)
+    with open(work / ".gitattributes", 'w', encoding='utf-8') as f:
+        f.write(f"{DB_FILENAME} binary -delta\n")
+    db_file = work / DB_FILENAME
+    save_database(db_file, size)
+    git(["add", "--", ".gitattributes", DB_FILENAME], work)
+    git(["commit", "--quiet", "-m", "Initial database"], work)
+    git(["push", "--quiet", "-u", "origin", "HEAD"], work)
+    return work, db_file
+
+
+def summarize(samples):
+    """count/mean/min/p50/p95/max of a list of seconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"count": len(ordered), "mean": sum(ordered) / len(ordered), "min": ordered[0],
+            "p50": percentile(0.5), "p95": percentile(0.95), "max": ordered[-1]}
+
+
+def bench_detection(app, config, db_file, size, backend, rounds):
+    """Time from the rename that completes a save until the watcher reports it,
+    including the stat comparison monitor_loop does for every reported path"""
+    config = json.loads(json.dumps(config))
+    config['database']['watcher'] = backend
+    watcher = app.create_watcher(config, [db_file])
+    detected = queue.Queue()
+    stopping = threading.Event()
+
+    def watch():
+        last = app.file_signature(db_file)
+        while not stopping.is_set():
+            changed = watcher.wait()
+            if db_file not in {Path(path) for path in changed}:
+                continue
+            key = app.file_signature(db_file)
+            if key != last:
+                last = key
+                detected.put(time.perf_counter())
+
+    thread = threading.Thread(target=watch, daemon=True)
+    thread.start()
+    samples = []
+    try:
+        for _ in range(rounds):
+            tmp_file = prepare_database(db_file, size)
+            time.sleep(0.1)
+            # Drop events from writing the temp file
+            while not detected.empty():
+                detected.get_nowait()
+            started = time.perf_counter()
+            os.replace(tmp_file, db_file)
+            try:
+                samples.append(detected.get(timeout=config['database']['poll_max_interval'] * 2 + 5) - started)
+            except queue.Empty:
+                print(f"  {backend}: change not detected")
+    finally:
+        stopping.set()
+        watcher.stop()
+        thread.join(timeout=5)
+        watcher.close()
+    result = {"backend": watcher.name, "latency": summarize(samples)}
+    if hasattr(watcher, "poll_rate"):
+        result["polls_per_minute"] = round(watcher.poll_rate(), 2)
+    return result
+
+
+def bench_sync(app, config, work, db_file, size, rounds):
+    """Full pull/stage/commit/push run after each save"""
+    engine = app.GitSyncEngine(work, db_file, config)
+    totals = []
+    phases = {}
+    for _ in range(rounds):
+        save_database(db_file, size)
+        started = time.perf_counter()
+        result = engine.sync(publish=True)
+        totals.append(time.perf_counter() - started)
+        for phase, seconds in result.phases.items():
+            phases.setdefault(phase, []).append(seconds)
+    return {"total": summarize(totals),
+            "phases": {phase: summarize(samples) for phase, samples in phases.items()}}
+
+
+def bench_script(work, db_file, size, rounds, timeout):
+    """The same as bench_sync, through the sync-keepass.sh shim"""
+    script = Path(__file__).resolve().with_name("sync-keepass.sh")
+    # The shim is checked out with CRLF line endings for Git Bash; plain bash needs LF
+    with open(script, 'rb') as f:
+        content = f.read().replace(b'\r\n', b'\n')
+    with open(work / script.name, 'wb') as f:
+        f.write(content)
+    totals = []
+    for _ in range(rounds):
+        save_database(db_file, size)
+        started = time.perf_counter()
+        subprocess.run(["bash", script.name], cwd=str(work), check=True, capture_output=True, timeout=timeout)
+        totals.append(time.perf_counter() - started)
+    (work / script.name).unlink()
+    return {"total": summarize(totals)}
+
+
+def bench_check(app, db_file, rounds):
+    """Cost of the pre-commit KDBX integrity check"""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        problem = app.check_kdbx(db_file)
+        samples.append(time.perf_counter() - started)
+        if problem:
+            raise RuntimeError(f"synthetic database failed the integrity check: {problem}")
+    return summarize(samples)
+
+
+def bench_throughput(app, config, work, db_file, size, saves, interval):
+    """Saves every `interval` seconds through the scheduler; local commits only,
+    as between two pushes of the push queue"""
+    from concurrent.futures import ThreadPoolExecutor
+    engine = app.GitSyncEngine(work, db_file, config)
+    commits = []
+
+    def sync_func(pending):
+        result = engine.sync(publish=False)
+        if result.committed:
+            commits.append(time.perf_counter())
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    scheduler = app.SyncScheduler(sync_func, executor,
+                                  settle_time=config['sync']['settle_time'],
+                                  max_settle_wait=config['sync']['max_settle_wait'])
+    started = time.perf_counter()
+    for _ in range(saves):
+        save_database(db_file, size)
+        scheduler.request(db_file, "change")
+        time.sleep(interval)
+    while scheduler.busy:
+        time.sleep(0.01)
+    elapsed = (commits[-1] if commits else time.perf_counter()) - started
+    executor.shutdown()
+    return {"saves": saves, "interval": interval, "commits": len(commits), "seconds": elapsed,
+            "saves_per_second": saves / elapsed if elapsed else None}
+
+
+def bench_growth(app, config, work, db_file, size, commits):
+    """Repository size over N local commits, before and after gc"""
+    engine = app.GitSyncEngine(work, db_file, config)
+    maintenance = app.RepositoryMaintenance(engine, lambda: None, config)
+
+    def total(report):
+        return report['loose'] + report['packs']
+
+    before = maintenance.repo_size()
+    started = time.perf_counter()
+    for _ in range(commits):
+        save_database(db_file, size)
+        engine.commit(app.SyncResult(), engine.deadline())
+    commit_seconds = time.perf_counter() - started
+    after = maintenance.repo_size()
+    started = time.perf_counter()
+    git(["gc", "--quiet"], work)
+    gc_seconds = time.perf_counter() - started
+    packed = maintenance.repo_size()
+    return {"commits": commits, "commit_seconds": commit_seconds,
+            "bytes_before": total(before), "bytes_after": total(after), "bytes_after_gc": total(packed),
+            "bytes_per_commit": (total(after) - total(before)) / commits if commits else None,
+            "gc_seconds": gc_seconds}
+
+
+def main():
+    """Main entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark KeePass Git Sync against a local bare remote')
+    parser.add_argument('--sizes', type=str, default='1,10,50', help='Database sizes in MB (default: 1,10,50)')
+    parser.add_argument('--rounds', type=int, default=5, help='Measured rounds for detection and sync latency')
+    parser.add_argument('--saves', type=int, default=20, help='Saves in the throughput run')
+    parser.add_argument('--save-interval', type=float, default=0.25, help='Seconds between saves in the throughput run')
+    parser.add_argument('--commits', type=int, default=10, help='Commits in the repository growth run')
+    parser.add_argument('--no-script', action='store_true', help='Skip the sync-keepass.sh benchmark')
+    parser.add_argument('--no-poll', action='store_true', help='Skip the polling watcher detection benchmark')
+    parser.add_argument('--output', type=str, default='benchmark-results.json', help='JSON results file')
+    args = parser.parse_args()
+
+    app = load_app()
+    config = app.load_default_config()
+    config['notifications']['enabled'] = False
+    config['git']['commit_message_format'] = "Benchmark save at {timestamp}"
+    config['sync']['timeout'] = 600
+    config['log'] = dict(config.get('log', {}), file='')
+    sizes = [float(size) for size in args.sizes.split(',')]
+    run_script = not args.no_script and platform.system() != "Windows" and shutil.which("bash")
+
+    results = {
+        "benchmark": "keepass-git-sync",
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git": subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": vars(args),
+        "detection": [],
+        "sizes": [],
+    }
+
+    for index, size_mb in enumerate(sizes):
+        size = int(size_mb * MB)
+        print(f"Database size {size_mb:g} MB")
+        with tempfile.TemporaryDirectory(prefix="keepass-sync-bench-") as tmp:
+            work, db_file = make_repository(Path(tmp), size)
+            entry = {"size_mb": size_mb}
+
+            if index == 0:
+                # Detection latency does not depend on the file size
+                backends = ["auto"] if args.no_poll else ["auto", "poll"]
+                for backend in backends:
+                    detection = bench_detection(app, config, db_file, size, backend, args.rounds)
+                    results["detection"].append(detection)
+                    print(f"  detection ({detection['backend']}): "
+                          f"p50 {detection['latency'].get('p50', 0) * 1000:.1f} ms, "
+                          f"p95 {detection['latency'].get('p95', 0) * 1000:.1f} ms")
+
+            entry["check"] = bench_check(app, db_file, args.rounds)
+            print(f"  integrity check: p50 {entry['check']['p50'] * 1000:.3f} ms, "
+                  f"p95 {entry['check']['p95'] * 1000:.3f} ms")
+
+            entry["sync"] = bench_sync(app, config, work, db_file, size, args.rounds)
+            print(f"  end-to-end sync: p50 {entry['sync']['total']['p50']:.3f}s, "
+                  f"p95 {entry['sync']['total']['p95']:.3f}s")
+            if run_script:
+                entry["script"] = bench_script(work, db_file, size, args.rounds, config['sync']['timeout'])
+                print(f"  sync-keepass.sh: p50 {entry['script']['total']['p50']:.3f}s, "
+                      f"p95 {entry['script']['total']['p95']:.3f}s")
+
+            entry["throughput"] = bench_throughput(app, config, work, db_file, size,
+                                                   args.saves, args.save_interval)
+            print(f"  throughput: {entry['throughput']['saves']} saves -> "
+                  f"{entry['throughput']['commits']} commits in {entry['throughput']['seconds']:.2f}s")
+
+            entry["growth"] = bench_growth(app, config, work, db_file, size, args.commits)
+            print(f"  growth: {app.format_size(entry['growth']['bytes_per_commit'])} per commit, "
+                  f"{app.format_size(entry['growth']['bytes_after_gc'])} after gc "
+                  f"({entry['growth']['gc_seconds']:.2f}s)")
+            results["sizes"].append(entry)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,34 +6,2752 @@ Monitors KeePass database for changes and auto-syncs with Git
 
 import os
 import sys
+import copy
 import time
 import threading
 import subprocess
+import select
 import json
 import socket
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-import pystray
-from PIL import Image, ImageDraw
-from plyer import notification
+# pystray, PIL and plyer are imported where they are used, so --headless,
+# --setup and --create-config never load the GUI stack
+
+
+def file_signature(path):
+    """(mtime_ns, size, inode) of a file from a single stat call, None if it is missing"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def write_json_atomic(path, data, private=False):
+    """Replace a JSON file in one step, so a reader or a crash never sees it
+    half-written; a private file is readable by the owner only"""
+    path = Path(path)
+    tmp_file = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 if private else 0o666)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_file, path)
+
+
+class PollingWatcher:
+    """Fallback watcher that polls the watched files on an adaptive interval.
+
+    Each poll is one stat per file, and only files whose (mtime_ns, size,
+    inode) changed are reported. A change drops the interval to min_interval;
+    every quiet poll doubles it up to max_interval, so an idle database costs
+    one stat every max_interval seconds while a busy one is picked up quickly.
+    """
+    name = "poll"
+    RATE_WINDOW = 300  # seconds over which the effective poll rate is measured
+
+    def __init__(self, min_interval=1, max_interval=15):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.paths = set()
+        self._signatures = {}
+        self._polls = deque()  # monotonic times of the polls in the rate window
+        self._started = time.monotonic()
+        self._closed = threading.Event()
+
+    def add(self, path):
+        """Start watching a file"""
+        path = Path(path)
+        self.paths.add(path)
+        self._signatures[path] = file_signature(path)
+
+    def wait(self, timeout=None):
+        """Sleep one poll interval and report the watched files that changed"""
+        delay = self.interval if timeout is None else min(self.interval, timeout)
+        if self._closed.wait(delay):
+            return set()
+        now = time.monotonic()
+        self._polls.append(now)
+        while self._polls[0] < now - self.RATE_WINDOW:
+            self._polls.popleft()
+        
+        changed = set()
+        for path in self.paths:
+            signature = file_signature(path)
+            if signature != self._signatures.get(path):
+                self._signatures[path] = signature
+                changed.add(path)
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(max(self.interval * 2, 0.1), self.max_interval)
+        return changed
+
+    def poll_rate(self):
+        """Effective polls per minute over the last RATE_WINDOW seconds"""
+        elapsed = min(self.RATE_WINDOW, time.monotonic() - self._started)
+        return len(self._polls) * 60 / elapsed if elapsed > 0 else 0.0
+
+    def stop(self):
+        """Wake up any pending wait(); safe to call from any thread"""
+        self._closed.set()
+
+    def close(self):
+        """Release watcher resources"""
+        self._closed.set()
+
+
+class InotifyWatcher:
+    """Linux watcher using inotify on the parent directory of each file"""
+    name = "inotify"
+
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE)
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wake_r, self._wake_w = os.pipe()
+        self._dirs = {}  # watch descriptor -> {filename: path}
+        self.paths = set()
+        self._closed = False
+
+    def add(self, path):
+        """Start watching a file through its parent directory"""
+        import ctypes
+        path = Path(path).absolute()
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(path.parent)), self.WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path.parent}")
+        self._dirs.setdefault(wd, {})[path.name] = path
+        self.paths.add(path)
+
+    def wait(self, timeout=None):
+        """Block until a watched file is written, replaced or removed"""
+        import struct
+        while not self._closed:
+            ready, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+            if not ready or self._wake_r in ready:
+                return set()
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            changed = set()
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                offset += 16 + length
+                if mask & self.IN_Q_OVERFLOW:
+                    return set(self.paths)
+                path = self._dirs.get(wd, {}).get(os.fsdecode(name))
+                if path is not None:
+                    changed.add(path)
+            if changed:
+                return changed
+        return set()
+
+    def stop(self):
+        """Wake up any pending wait(); safe to call from any thread"""
+        if not self._closed:
+            self._closed = True
+            os.write(self._wake_w, b'x')
+
+    def close(self):
+        """Release the inotify descriptor and wake-up pipe"""
+        self._closed = True
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class KqueueWatcher:
+    """macOS/BSD watcher using kqueue vnode events on each file and its directory"""
+    name = "kqueue"
+
+    def __init__(self):
+        self._kq = select.kqueue()
+        self._wake_r, self._wake_w = os.pipe()
+        self._kq.control([select.kevent(self._wake_r, filter=select.KQ_FILTER_READ,
+                                        flags=select.KQ_EV_ADD)], 0, 0)
+        self._fds = {}  # fd -> (path, is_directory)
+        self._file_fds = {}  # path -> fd of the file itself
+        self.paths = set()
+        self._closed = False
+
+    def _open_flags(self):
+        # O_EVTONLY on macOS watches without keeping the volume busy
+        return getattr(os, 'O_EVTONLY', os.O_RDONLY)
+
+    def _register(self, fd, fflags):
+        self._kq.control([select.kevent(fd, filter=select.KQ_FILTER_VNODE,
+                                        flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                                        fflags=fflags)], 0, 0)
+
+    def _watch_file(self, path):
+        """(Re)open the watched file itself so in-place writes are seen too"""
+        old_fd = self._file_fds.pop(path, None)
+        if old_fd is not None:
+            self._fds.pop(old_fd, None)
+            os.close(old_fd)
+        try:
+            fd = os.open(str(path), self._open_flags())
+        except OSError:
+            return  # not there yet, the directory watch will tell us when it appears
+        self._register(fd, select.KQ_NOTE_WRITE | select.KQ_NOTE_EXTEND | select.KQ_NOTE_ATTRIB |
+                       select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME)
+        self._fds[fd] = (path, False)
+        self._file_fds[path] = fd
+
+    def add(self, path):
+        """Start watching a file and its parent directory"""
+        path = Path(path).absolute()
+        if not any(is_dir and p.parent == path.parent for p, is_dir in self._fds.values()):
+            fd = os.open(str(path.parent), self._open_flags())
+            self._register(fd, select.KQ_NOTE_WRITE)
+            self._fds[fd] = (path, True)
+        self.paths.add(path)
+        self._watch_file(path)
+
+    def wait(self, timeout=None):
+        """Block until a watched file or its directory changes"""
+        while not self._closed:
+            events = self._kq.control(None, 16, timeout)
+            if not events:
+                return set()
+            changed = set()
+            for event in events:
+                if event.ident == self._wake_r:
+                    return set()
+                path, is_dir = self._fds.get(event.ident, (None, False))
+                if path is None:
+                    continue
+                if is_dir:
+                    # An entry in the directory changed (e.g. temp file renamed over the database)
+                    for watched in self.paths:
+                        if watched.parent == path.parent:
+                            changed.add(watched)
+                            self._watch_file(watched)
+                else:
+                    changed.add(path)
+                    if event.fflags & (select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME):
+                        self._watch_file(path)
+            if changed:
+                return changed
+        return set()
+
+    def stop(self):
+        """Wake up any pending wait(); safe to call from any thread"""
+        if not self._closed:
+            self._closed = True
+            os.write(self._wake_w, b'x')
+
+    def close(self):
+        """Release the kqueue and all watched descriptors"""
+        self._closed = True
+        for fd in list(self._fds) + [self._wake_r, self._wake_w]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds.clear()
+        self._file_fds.clear()
+        self._kq.close()
+
+
+class WindowsChangeWatcher:
+    """Windows watcher using directory change notification handles"""
+    name = "win32"
+
+    FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+    FILE_NOTIFY_CHANGE_SIZE = 0x00000008
+    FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+    WAIT_OBJECT_0 = 0x00000000
+    WAIT_TIMEOUT = 0x00000102
+    INFINITE = 0xFFFFFFFF
+
+    def __init__(self):
+        import ctypes
+        from ctypes import wintypes
+        self._ctypes = ctypes
+        # INVALID_HANDLE_VALUE as a HANDLE (c_void_p) return value: 0xFFFF...FFFF, not -1
+        self._invalid_handle = ctypes.c_void_p(-1).value
+        self._kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self._kernel32.FindFirstChangeNotificationW.restype = wintypes.HANDLE
+        self._kernel32.FindFirstChangeNotificationW.argtypes = [wintypes.LPCWSTR, wintypes.BOOL, wintypes.DWORD]
+        self._kernel32.CreateEventW.restype = wintypes.HANDLE
+        self._kernel32.WaitForMultipleObjects.argtypes = [wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE),
+                                                          wintypes.BOOL, wintypes.DWORD]
+        self._kernel32.WaitForMultipleObjects.restype = wintypes.DWORD
+        self._kernel32.FindNextChangeNotification.argtypes = [wintypes.HANDLE]
+        self._kernel32.FindCloseChangeNotification.argtypes = [wintypes.HANDLE]
+        self._kernel32.SetEvent.argtypes = [wintypes.HANDLE]
+        self._kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self._wake_event = self._kernel32.CreateEventW(None, True, False, None)
+        if not self._wake_event:
+            raise ctypes.WinError(ctypes.get_last_error())
+        self._handles = []  # change handles, index-aligned with self._dirs
+        self._dirs = []
+        self.paths = set()
+        self._closed = False
+
+    def add(self, path):
+        """Start watching a file through its parent directory"""
+        path = Path(path).absolute()
+        self.paths.add(path)
+        if path.parent in self._dirs:
+            return
+        handle = self._kernel32.FindFirstChangeNotificationW(
+            str(path.parent), False,
+            self.FILE_NOTIFY_CHANGE_FILE_NAME | self.FILE_NOTIFY_CHANGE_SIZE |
+            self.FILE_NOTIFY_CHANGE_LAST_WRITE)
+        if handle is None or handle == self._invalid_handle:
+            raise self._ctypes.WinError(self._ctypes.get_last_error())
+        self._handles.append(handle)
+        self._dirs.append(path.parent)
+
+    def wait(self, timeout=None):
+        """Block until something changes in a watched directory"""
+        from ctypes import wintypes
+        handles = (wintypes.HANDLE * (len(self._handles) + 1))(self._wake_event, *self._handles)
+        millis = self.INFINITE if timeout is None else int(timeout * 1000)
+        result = self._kernel32.WaitForMultipleObjects(len(handles), handles, False, millis)
+        if self._closed or result == self.WAIT_TIMEOUT or result == self.WAIT_OBJECT_0:
+            return set()
+        index = result - self.WAIT_OBJECT_0 - 1
+        if not 0 <= index < len(self._handles):
+            raise self._ctypes.WinError(self._ctypes.get_last_error())
+        self._kernel32.FindNextChangeNotification(self._handles[index])
+        return {p for p in self.paths if p.parent == self._dirs[index]}
+
+    def stop(self):
+        """Wake up any pending wait(); safe to call from any thread"""
+        if not self._closed:
+            self._closed = True
+            self._kernel32.SetEvent(self._wake_event)
+
+    def close(self):
+        """Release the notification handles"""
+        self._closed = True
+        for handle in self._handles:
+            self._kernel32.FindCloseChangeNotification(handle)
+        self._handles = []
+        self._kernel32.CloseHandle(self._wake_event)
+
+
+def create_watcher(config, paths, backend=None):
+    """Create the best available watcher for the given files, falling back to polling"""
+    backend = backend or config['database']['watcher']
+    if backend != 'poll':
+        import platform
+        system = platform.system()
+        watcher = None
+        try:
+            if system == "Linux":
+                watcher = InotifyWatcher()
+            elif system == "Windows":
+                watcher = WindowsChangeWatcher()
+            elif hasattr(select, 'kqueue'):
+                watcher = KqueueWatcher()
+            if watcher is not None:
+                for path in paths:
+                    watcher.add(path)
+                return watcher
+        except Exception as e:
+            print(f"Change notifications unavailable ({e}), falling back to polling")
+            if watcher is not None:
+                watcher.close()
+    watcher = PollingWatcher(config['database']['monitor_interval'], config['database']['poll_max_interval'])
+    for path in paths:
+        watcher.add(path)
+    return watcher
+
+
+FSMONITOR_HOOK = """#!/bin/sh
+# git fsmonitor hook (protocol version 2) written by KeePass Git Sync. It replays
+# the answer prepared by the running application from its own watcher; for any
+# token that answer does not cover it reports "/", i.e. everything may have changed.
+state="$(dirname "$0")/keepass-sync-fsmonitor"
+read -r base current 2>/dev/null < "$state.token" || { printf 'none\\0/\\0'; exit 0; }
+case "$2" in
+"${base%%:*}":*)
+    if [ "${2##*:}" -ge "${base##*:}" ] 2>/dev/null; then
+        printf '%s\\0' "$current"
+        cat "$state.paths"
+        exit 0
+    fi ;;
+esac
+printf '%s\\0/\\0' "$current"
+"""
+
+# git commands that refresh the index from the working tree
+FSMONITOR_COMMANDS = ("add", "commit", "merge", "checkout", "diff", "status", "reset")
+
+
+class FsmonitorProvider:
+    """git fsmonitor data for one repository, fed by an inotify watch on every
+    directory of its working tree, so that git stats only the files that
+    changed instead of the whole tree on each sync.
+
+    Events queue up in the kernel and are drained by prepare() right before a
+    git command, which makes the answer complete up to that moment. The hook
+    is only passed to the application's own git commands (-c core.fsmonitor),
+    never written to the repository config, so other git clients keep their
+    usual behaviour. Tokens are "<instance>:<sequence>"; after a queue
+    overflow or a moved directory the instance changes and git rescans once.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ISDIR = 0x40000000
+    IN_IGNORED = 0x00008000
+    WATCH_MASK = InotifyWatcher.WATCH_MASK | IN_MODIFY
+    MAX_PATHS = 1000  # beyond this many changed paths a full rescan is cheaper
+
+    def __init__(self, engine):
+        import ctypes
+        import ctypes.util
+        self.repo_dir = engine.repo_dir.absolute()
+        engine.git_dirs()  # raises outside a git repository
+        self.hook = engine.state_path("keepass-sync-fsmonitor.sh")
+        self._state = engine.state_path("keepass-sync-fsmonitor")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._lock = threading.Lock()
+        self._dirs = {}  # watch descriptor -> directory relative to the repository ('' or 'a/b/')
+        self._paths = {}  # changed path -> None, in the order first seen
+        self._sequence = 0
+        self._base = None  # oldest token the current path list covers
+        try:
+            self._watch_tree('')
+            self._reset()
+            with open(self.hook, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(FSMONITOR_HOOK)
+            os.chmod(self.hook, 0o755)
+        except Exception:
+            self.close()
+            raise
+        import shlex
+        self.options = ["-c", f"core.fsmonitor={shlex.quote(str(self.hook))}",
+                        "-c", "core.fsmonitorHookVersion=2"]
+
+    def _watch_tree(self, relative):
+        """Watch a directory and everything below it, skipping .git"""
+        import ctypes
+        top = self.repo_dir / relative if relative else self.repo_dir
+        for dirpath, dirnames, _files in os.walk(top):
+            if dirpath == str(self.repo_dir):
+                dirnames[:] = [name for name in dirnames if name != '.git']
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self.WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {dirpath}")
+            rel = os.path.relpath(dirpath, self.repo_dir).replace(os.sep, '/')
+            self._dirs[wd] = '' if rel == '.' else rel + '/'
+
+    def _reset(self):
+        """Start a new token instance: git rescans the whole tree once"""
+        self._instance = os.urandom(4).hex()
+        self._paths = {}
+        self._base = f"{self._instance}:{self._sequence}"
+
+    def _drain(self):
+        """Read every queued inotify event into the changed path list"""
+        import struct
+        while self._fd is not None:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = struct.unpack_from('iIII', data, offset)
+                name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+                offset += 16 + length
+                if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                    self._reset()
+                    continue
+                if mask & self.IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                parent = self._dirs.get(wd)
+                if parent is None or (parent == '' and name == '.git'):
+                    continue
+                path = parent + name
+                if mask & self.IN_ISDIR:
+                    path += '/'
+                    if mask & InotifyWatcher.IN_MOVED_FROM:
+                        # Watches below a moved directory keep their old names
+                        self._reset()
+                        continue
+                    if mask & (InotifyWatcher.IN_CREATE | InotifyWatcher.IN_MOVED_TO):
+                        self._watch_tree(path)
+                self._paths[path] = None
+            if len(self._paths) > self.MAX_PATHS:
+                self._reset()
+
+    def prepare(self):
+        """Bring the hook's answer up to date before a git command runs and
+        return the token it hands out"""
+        with self._lock:
+            self._drain()
+            self._sequence += 1
+            current = f"{self._instance}:{self._sequence}"
+            # Paths first: a hook reading the old token with the new list
+            # reports a superset, which is always safe
+            self._write("paths", ''.join(path + '\0' for path in self._paths))
+            self._write("token", f"{self._base} {current}\n")
+            return current
+
+    def acknowledge(self, token):
+        """git has stored token in the index: drop the changes it already covers.
+        If it did not store it after all, its next query falls back to "/"."""
+        with self._lock:
+            instance, sequence = token.split(':')
+            if instance == self._instance and sequence == str(self._sequence):
+                self._paths = {}
+                self._base = token
+
+    def _write(self, suffix, text):
+        tmp_file = self._state.with_name(f"{self._state.name}.{suffix}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(text)
+        os.replace(tmp_file, self._state.with_name(f"{self._state.name}.{suffix}"))
+
+    def close(self):
+        """Stop watching; the hook answers "/" to every later query"""
+        with self._lock:
+            if self._fd is None:
+                return
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+            self._reset()
+        for suffix in ("token", "paths"):
+            try:
+                self._state.with_name(f"{self._state.name}.{suffix}").unlink()
+            except OSError:
+                pass
+
+
+def create_fsmonitor(config, engine):
+    """fsmonitor provider for the engine's repository, or None where git keeps
+    stat()ing the whole tree (setting disabled, not Linux, or watches unavailable)"""
+    import platform
+    if not config['git']['fsmonitor'] or platform.system() != "Linux":
+        return None
+    try:
+        return FsmonitorProvider(engine)
+    except Exception as e:
+        print(f"fsmonitor unavailable for {engine.repo_dir} ({e})")
+        return None
+
+
+class ProcessCancelled(subprocess.SubprocessError):
+    """A child process was killed (or never started) because the runtime is shutting down"""
+
+    def __init__(self, cmd):
+        super().__init__(f"Command {cmd[0]!r} cancelled at shutdown")
+        self.cmd = cmd
+
+
+class AsyncRuntime:
+    """asyncio event loop on its own thread that runs the sync schedulers and
+    every child process.
+
+    Blocking code (the git engine on the worker pool, the watchers) hands work
+    to the loop with submit() or run_process(). Each child is started in its
+    own process group, so a timeout or shutdown kills git together with the
+    ssh or credential helpers it started instead of leaving them holding the
+    index lock. shutdown() lets running children finish until a deadline and
+    kills the rest.
+    """
+
+    def __init__(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self._processes = set()  # tasks of the child processes in flight
+        self._closing = False
+        self._thread = threading.Thread(target=self._run_loop, name="keepass-sync-runtime", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        import asyncio
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Run a coroutine on the loop from any thread; returns a concurrent Future"""
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """Run a callback on the loop from any thread"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def run_process(self, cmd, limit=None, timeout=None, **kwargs):
+        """Run a child process on the loop and block the calling thread until it
+        exits; raises TimeoutExpired or ProcessCancelled after killing its group.
+        A stdout file object receives the output instead of the result."""
+        import concurrent.futures
+        if self._closing:
+            raise ProcessCancelled(cmd)
+        future = self.submit(self._process(cmd, limit, timeout, kwargs))
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise ProcessCancelled(cmd) from None
+
+    async def _process(self, cmd, limit, timeout, kwargs):
+        import asyncio
+        task = asyncio.current_task()
+        self._processes.add(task)
+        try:
+            if os.name == 'nt':
+                kwargs['creationflags'] = kwargs.get('creationflags', 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+            else:
+                kwargs['start_new_session'] = True
+            stdout = kwargs.pop('stdout', subprocess.PIPE)
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=subprocess.DEVNULL, stdout=stdout, stderr=subprocess.PIPE, **kwargs)
+            outputs = [BoundedOutput(limit), BoundedOutput(limit)]
+            drains = [output.drain(stream) for output, stream in zip(outputs, (process.stdout, process.stderr))
+                      if stream is not None]
+            try:
+                # The pipes are part of the deadline: a grandchild that keeps them open counts as running
+                await asyncio.wait_for(asyncio.gather(process.wait(), *drains), timeout)
+            except asyncio.TimeoutError:
+                await self._kill_group(process)
+                raise subprocess.TimeoutExpired(cmd, timeout, outputs[0].text(), outputs[1].text()) from None
+            except asyncio.CancelledError:
+                await self._kill_group(process)
+                raise
+            return subprocess.CompletedProcess(cmd, process.returncode, outputs[0].text(), outputs[1].text())
+        finally:
+            self._processes.discard(task)
+
+    async def _kill_group(self, process):
+        """Kill a child and every process it started"""
+        import asyncio
+        try:
+            if os.name == 'nt':
+                # taskkill walks the process tree; the group flag alone does not kill it
+                killer = await asyncio.create_subprocess_exec(
+                    "taskkill", "/F", "/T", "/PID", str(process.pid),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                await killer.wait()
+            else:
+                import signal
+                os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+
+    def shutdown(self, timeout):
+        """Refuse new children, give running ones until the deadline, then kill
+        them and stop the loop"""
+        import asyncio
+
+        async def drain():
+            running = set(self._processes)
+            if not running:
+                return
+            _, late = await asyncio.wait(running, timeout=timeout)
+            if late:
+                print(f"Killing {len(late)} child process(es) still running at shutdown")
+            for task in late:
+                task.cancel()
+            await asyncio.gather(*late, return_exceptions=True)
+
+        self._closing = True
+        try:
+            self.submit(drain()).result(timeout + 10)
+        except Exception as e:
+            print(f"Error stopping child processes: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    """The process-wide AsyncRuntime, started on first use"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AsyncRuntime()
+        return _runtime
+
+
+class SyncScheduler:
+    """Owns all sync requests for one repository: waits for writes to settle,
+    runs one sync at a time and folds triggers that arrive during a sync into
+    a single follow-up run. The scheduling runs as a task on the runtime's
+    event loop; the syncs themselves run on a shared worker pool, so different
+    repositories sync in parallel but the same one never does."""
+
+    def __init__(self, sync_func, executor, settle_time=1.0, max_settle_wait=30, runtime=None):
+        self.sync_func = sync_func
+        self.executor = executor
+        self.settle_time = settle_time
+        self.max_settle_wait = max_settle_wait
+        self.runtime = runtime or get_runtime()
+        self._lock = threading.Lock()
+        self._pending = {}  # database path -> trigger sources waiting for the next run
+        self._settle = False
+        self._busy = False
+        self._stopping = False
+        self._task = None
+        self._wake = None  # asyncio.Event set by stop(), created on the loop
+
+    def request(self, path, source="change", settle=True):
+        """Ask for a sync of one database; returns immediately, from any thread"""
+        with self._lock:
+            if self._stopping:
+                return
+            self._pending.setdefault(Path(path), []).append(source)
+            self._settle = self._settle or settle
+            if not self._busy:
+                self._busy = True
+                self.runtime.call_soon(self._start)
+
+    @property
+    def busy(self):
+        """True while a sync is queued, settling or running"""
+        with self._lock:
+            return self._busy
+
+    def stop(self, timeout=None):
+        """Drop queued requests and wait for an in-flight sync to finish"""
+        import concurrent.futures
+        with self._lock:
+            self._stopping = True
+            self._pending = {}
+        future = self.runtime.submit(self._join())
+        try:
+            future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+
+    async def _join(self):
+        import asyncio
+        if self._wake is not None:
+            self._wake.set()
+        if self._task is not None:
+            # Shielded: giving up on the wait must not cancel the sync
+            await asyncio.shield(self._task)
+
+    def _start(self):
+        import asyncio
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._task = self.runtime.loop.create_task(self._run())
+
+    def _snapshot(self, paths):
+        snapshot = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                snapshot.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                snapshot.append(None)
+        return snapshot
+
+    async def _wait_for_settle(self, paths):
+        """Wait until size and mtime have been unchanged for settle_time seconds"""
+        import asyncio
+        deadline = time.monotonic() + self.max_settle_wait
+        last = self._snapshot(paths)
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.settle_time)
+                return False  # stopping
+            except asyncio.TimeoutError:
+                pass
+            current = self._snapshot(paths)
+            if current == last:
+                return True
+            if time.monotonic() >= deadline:
+                print(f"{', '.join(p.name for p in paths)} still changing after {self.max_settle_wait}s, syncing anyway")
+                return True
+            last = current
+
+    async def _run(self):
+        while True:
+            with self._lock:
+                if self._stopping or not self._pending:
+                    # Release in the same critical section so no request is lost
+                    self._busy = False
+                    return
+                settle = self._settle
+                self._settle = False
+                paths = list(self._pending)
+            if settle and not await self._wait_for_settle(paths):
+                continue
+            with self._lock:
+                # Everything requested up to this point is covered by this run
+                pending = self._pending
+                self._pending = {}
+            count = sum(len(sources) for sources in pending.values())
+            if count > 1:
+                print(f"Coalesced {count} sync requests into one run")
+            try:
+                await self.runtime.loop.run_in_executor(self.executor, self.sync_func, pending)
+            except Exception as e:
+                print(f"Error in sync scheduler: {e}")
+
+
+class BoundedOutput:
+    """Collects one output stream of a child process, keeping only the first
+    and last limit/2 bytes so a chatty command cannot grow memory unbounded"""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+
+    async def drain(self, stream):
+        """Read an asyncio stream until EOF"""
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                return
+            self.append(chunk)
+
+    def append(self, chunk):
+        if self.limit is None:
+            self.head += chunk
+            return
+        half = self.limit // 2
+        room = half - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        self.tail += chunk
+        excess = len(self.tail) - (self.limit - half)
+        if excess > 0:
+            del self.tail[:excess]
+            self.dropped += excess
+
+    def text(self):
+        def decode(data):
+            return data.decode('utf-8', errors='replace').replace('\r\n', '\n')
+        if not self.dropped:
+            return decode(self.head + self.tail)
+        return f"{decode(self.head)}\n... [{self.dropped} bytes of output truncated] ...\n{decode(self.tail)}"
+
+
+def run_bounded(cmd, limit=None, timeout=None, **kwargs):
+    """subprocess.run(capture_output=True, text=True) replacement that streams
+    stdout and stderr, keeps at most `limit` bytes of each (None: all) and
+    kills the whole process group on timeout or shutdown"""
+    return get_runtime().run_process(cmd, limit, timeout, **kwargs)
+
+
+class SyncLog:
+    """Structured sync log: records (level, database, phase, duration, commit
+    SHA, message) go to the console, a fixed-size ring buffer for the tray
+    menu and, optionally, a size-rotated JSON-lines file"""
+
+    LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+    def __init__(self, path=None, max_bytes=1048576, backup_count=3, capacity=200):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=capacity)
+        self._file = None
+        if path:
+            import logging
+            import logging.handlers
+            try:
+                handler = logging.handlers.RotatingFileHandler(
+                    path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+            except OSError as e:
+                print(f"Cannot open sync log file {path}: {e}")
+            else:
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self._file = logging.getLogger(f"keepass-sync.{path}")
+                self._file.propagate = False
+                self._file.setLevel(logging.DEBUG)
+                self._file.addHandler(handler)
+
+    def record(self, level, message, database=None, phase=None, duration=None, sha=None):
+        """Add one record; debug records (raw git output) only go to the file"""
+        record = {"time": datetime.now().isoformat(timespec='seconds'), "level": level,
+                  "database": database, "phase": phase,
+                  "duration": round(duration, 3) if duration is not None else None,
+                  "sha": sha, "message": message}
+        if self._file is not None:
+            self._file.log(self.LEVELS[level], json.dumps(
+                {key: value for key, value in record.items() if value is not None}))
+        if level == "debug":
+            return
+        with self._lock:
+            self._records.append(record)
+        print(self.format(record))
+
+    def debug(self, message, **fields):
+        self.record("debug", message, **fields)
+
+    def info(self, message, **fields):
+        self.record("info", message, **fields)
+
+    def warning(self, message, **fields):
+        self.record("warning", message, **fields)
+
+    def error(self, message, **fields):
+        self.record("error", message, **fields)
+
+    def recent(self, count=None):
+        """The newest records first"""
+        with self._lock:
+            records = list(self._records)
+        records.reverse()
+        return records[:count] if count else records
+
+    @staticmethod
+    def format(record, with_time=False):
+        text = f"[{record['phase']}] {record['message']}" if record['phase'] else record['message']
+        if record['level'] in ("warning", "error"):
+            text = f"{record['level'].upper()}: {text}"
+        details = []
+        if record['duration'] is not None:
+            details.append(f"{record['duration']:.2f}s")
+        if record['sha']:
+            details.append(record['sha'])
+        if details:
+            text += f" ({', '.join(details)})"
+        if record['database']:
+            text = f"{record['database']}: {text}"
+        if with_time:
+            text = f"{record['time'][11:]} {text}"
+        return text
+
+
+class GitCommandError(Exception):
+    """A git command in the sync pipeline failed"""
+
+    def __init__(self, phase, returncode, output):
+        super().__init__(f"git {phase} failed with return code {returncode}")
+        self.phase = phase
+        self.returncode = returncode
+        self.output = output
+
+    NETWORK_ERRORS = ("Could not resolve host", "unable to access", "Could not read from remote repository",
+                      "Connection refused", "Connection timed out", "Network is unreachable")
+
+    @property
+    def is_network_error(self):
+        """True if the remote could not be reached, as opposed to a local git problem"""
+        return any(marker in self.output for marker in self.NETWORK_ERRORS)
+
+
+class SyncResult:
+    """Outcome of one run of the sync pipeline"""
+
+    def __init__(self):
+        self.committed = False
+        self.commit_sha = None
+        self.pushed = False
+        self.log = []  # (phase, output) pairs for the console
+        self.phases = {}  # phase -> seconds spent in git for that phase
+        self.merge = None  # None, "fast-forward", "git", "kdbx" or "keep-both" after a pull
+        self.conflict_copies = []  # side-by-side copies of remote databases ("keep-both")
+        self.bytes_pushed = None  # size of the pack sent by the last push
+
+
+class KdbxMerger:
+    """Entry-level three-way merge of KeePass databases, for when two machines
+    both changed the database since their last common commit. Requires the
+    optional pykeepass package and the database credentials."""
+
+    def __init__(self, password=None, keyfile=None):
+        self.password = password
+        self.keyfile = keyfile
+
+    @staticmethod
+    def available():
+        try:
+            import pykeepass  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def open(self, path):
+        from pykeepass import PyKeePass
+        return PyKeePass(str(path), password=self.password, keyfile=self.keyfile)
+
+    def merge(self, base_file, ours_file, theirs_file, output_file):
+        """Merge the changes between base and theirs into ours and save the result
+        to output_file; returns the number of added/updated/deleted/conflicting entries.
+
+        Entries are matched by UUID and compared by content and group. When both
+        sides edited an entry the newer edit wins and the other one is kept in
+        the entry history, so nothing is lost.
+        """
+        base, ours, theirs = (self.open(path) for path in (base_file, ours_file, theirs_file))
+        stats = {"added": 0, "updated": 0, "deleted": 0, "conflicts": 0}
+        base_entries = {entry.uuid: entry for entry in base.entries}
+        our_entries = {entry.uuid: entry for entry in ours.entries}
+        their_entries = {entry.uuid: entry for entry in theirs.entries}
+
+        for uuid, theirs_entry in their_entries.items():
+            base_entry = base_entries.get(uuid)
+            ours_entry = our_entries.get(uuid)
+            changed_there = base_entry is None or self._state(theirs_entry) != self._state(base_entry)
+            if ours_entry is None:
+                # New there, or deleted here but edited there since: keep it
+                if changed_there:
+                    group = self._group(ours, theirs, theirs_entry.group)
+                    group._element.append(self._import(ours, theirs, theirs_entry._element))
+                    stats["added"] += 1
+                continue
+            if not changed_there or self._state(ours_entry) == self._state(theirs_entry):
+                continue
+            changed_here = base_entry is None or self._state(ours_entry) != self._state(base_entry)
+            if changed_here:
+                stats["conflicts"] += 1
+                if ours_entry.mtime > theirs_entry.mtime:
+                    self._add_history(ours_entry._element, self._import(ours, theirs, theirs_entry._element))
+                    continue
+            element = self._import(ours, theirs, theirs_entry._element)
+            if changed_here:
+                self._add_history(element, copy.deepcopy(ours_entry._element))
+            moved_there = base_entry is not None and theirs_entry.group.uuid != base_entry.group.uuid
+            moved_here = base_entry is not None and ours_entry.group.uuid != base_entry.group.uuid
+            if moved_there and not moved_here:
+                ours_entry._element.getparent().remove(ours_entry._element)
+                self._group(ours, theirs, theirs_entry.group)._element.append(element)
+            else:
+                ours_entry._element.getparent().replace(ours_entry._element, element)
+            stats["updated"] += 1
+
+        for uuid, ours_entry in our_entries.items():
+            base_entry = base_entries.get(uuid)
+            if (uuid not in their_entries and base_entry is not None
+                    and self._state(ours_entry) == self._state(base_entry)):
+                # Deleted there and not edited here
+                ours_entry._element.getparent().remove(ours_entry._element)
+                stats["deleted"] += 1
+
+        self._merge_deleted_objects(ours, theirs)
+        ours.save(str(output_file))
+        return stats
+
+    @staticmethod
+    def _state(entry):
+        """What an edit changes: the entry's fields and its group, without
+        timestamps and history"""
+        element = copy.deepcopy(entry._element)
+        for child in element.findall('Times') + element.findall('History'):
+            element.remove(child)
+        fields = sorted((child.tag, child.findtext('Key'), child.findtext('Value'), child.text)
+                        for child in element)
+        return fields, entry.group.uuid
+
+    def _import(self, ours, theirs, element):
+        """Copy an entry element from theirs, re-adding its attachments to ours"""
+        element = copy.deepcopy(element)
+        for value in element.iter('Value'):
+            ref = value.get('Ref')
+            if ref is not None and value.getparent().tag == 'Binary':
+                value.set('Ref', str(ours.add_binary(theirs.binaries[int(ref)])))
+        return element
+
+    def _add_history(self, element, snapshot):
+        for history in snapshot.findall('History'):
+            snapshot.remove(history)
+        history = element.find('History')
+        if history is None:
+            history = element.makeelement('History', {})
+            element.append(history)
+        history.append(snapshot)
+
+    def _group(self, ours, theirs, theirs_group):
+        """The group in ours matching a group of theirs, created if it is new"""
+        if theirs_group.is_root_group:
+            return ours.root_group
+        group = ours.find_groups(uuid=theirs_group.uuid, first=True)
+        if group is not None:
+            return group
+        parent = self._group(ours, theirs, theirs_group.group)
+        element = copy.deepcopy(theirs_group._element)
+        for child in element.findall('Entry') + element.findall('Group'):
+            element.remove(child)
+        parent._element.append(element)
+        return ours.find_groups(uuid=theirs_group.uuid, first=True)
+
+    def _merge_deleted_objects(self, ours, theirs):
+        """Union of the deletion records KeePass uses for its own synchronization"""
+        ours_deleted = ours._xpath('/KeePassFile/Root/DeletedObjects', first=True)
+        theirs_deleted = theirs._xpath('/KeePassFile/Root/DeletedObjects', first=True)
+        if ours_deleted is None or theirs_deleted is None:
+            return
+        known = {item.findtext('UUID') for item in ours_deleted}
+        for item in theirs_deleted:
+            if item.findtext('UUID') not in known:
+                ours_deleted.append(copy.deepcopy(item))
+
+
+def pushed_bytes(output):
+    """Pack size from the "Writing objects: 100% (n/n), 1.20 MiB | ..." line of git push --progress"""
+    import re
+    match = re.search(r"Writing objects: 100% \(\d+/\d+\), ([\d.]+) (bytes|KiB|MiB|GiB)", output)
+    if match is None:
+        return 0
+    units = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+    return int(float(match.group(1)) * units[match.group(2)])
+
+
+# Refs on the remote used by the application itself (history compaction marker)
+COMPACTED_REFS = "refs/keepass-sync/"
+
+
+class GitSyncEngine:
+    """In-process pull/stage/commit/push pipeline driven directly by the loaded
+    configuration, with exactly one git invocation per phase. The git directory
+    and the upstream branch are resolved once and cached, so a sync spends no
+    extra git processes on bookkeeping."""
+
+    def __init__(self, repo_dir, db_file, config):
+        self.repo_dir = Path(repo_dir)
+        self.db_file = Path(db_file)
+        self.config = config
+        # Force untranslated git output so results can be parsed, and never
+        # block a background sync on an interactive credential prompt
+        self.env = dict(os.environ, LC_ALL='C', GIT_TERMINAL_PROMPT='0')
+        self.creationflags = 0
+        import platform
+        if platform.system() == "Windows":
+            self.creationflags = 0x08000000  # CREATE_NO_WINDOW: no console flash per git call
+        self.killed_git = False  # set when a timeout or shutdown killed a git run here
+        self.fsmonitor = None  # FsmonitorProvider of the repository, if any
+        self.databases = [self.db_file]  # every configured database in the repository
+        self._git_dirs = None  # (git directory, common git directory), resolved once
+        self._upstream = None  # ((HEAD ref, config signature), upstream) of the last lookup
+
+    def relative(self, path):
+        """Path relative to the repository, as git expects it"""
+        return os.path.relpath(path, self.repo_dir).replace(os.sep, '/')
+
+    @property
+    def db_path(self):
+        """Database path relative to the repository, as git expects it"""
+        return self.relative(self.db_file)
+
+    def run_git(self, args, timeout=None, env=None, full_output=False):
+        """Run one git command in the repository and return the CompletedProcess.
+
+        Output is truncated to log.output_limit bytes per stream unless
+        full_output is set for commands whose output is parsed in full.
+        """
+        fsmonitor = self.fsmonitor if args[0] in FSMONITOR_COMMANDS else None
+        options = []
+        if fsmonitor is not None:
+            token = fsmonitor.prepare()
+            options = fsmonitor.options
+        try:
+            completed = run_bounded(
+                ["git"] + options + args,
+                limit=None if full_output else self.config['log']['output_limit'],
+                cwd=str(self.repo_dir),
+                env=dict(self.env, **env) if env else self.env,
+                timeout=timeout,
+                creationflags=self.creationflags
+            )
+        except (subprocess.TimeoutExpired, ProcessCancelled):
+            # A killed git may leave its index.lock behind
+            self.killed_git = True
+            raise
+        if fsmonitor is not None and completed.returncode == 0:
+            fsmonitor.acknowledge(token)
+        return completed
+
+    def commit_message(self):
+        """Format the commit message the same way on every platform"""
+        message_format = self.config['git']['commit_message_format']
+        return (message_format
+                .replace('{hostname}', socket.gethostname())
+                .replace('{timestamp}', datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def deadline(self):
+        """Return a function giving the time left for git calls in this sync"""
+        timeout = self.config['sync']['timeout']
+        deadline = time.monotonic() + timeout
+
+        def remaining():
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise subprocess.TimeoutExpired("git", timeout)
+            return left
+        return remaining
+
+    def run_phase(self, result, phase, args, remaining):
+        """Run the git command of one pipeline phase and record how long it took"""
+        started = time.perf_counter()
+        try:
+            return self.run_git(args, remaining())
+        finally:
+            result.phases[phase] = result.phases.get(phase, 0) + time.perf_counter() - started
+
+    def git_dirs(self):
+        """(git directory, common git directory) of the working tree, resolved
+        once. They differ for a linked worktree, whose .git is a file."""
+        if self._git_dirs is None:
+            found = self.run_git(["rev-parse", "--absolute-git-dir", "--git-common-dir"],
+                                 self.config['sync']['timeout'])
+            lines = found.stdout.splitlines()
+            if found.returncode != 0 or len(lines) != 2:
+                raise GitCommandError("rev-parse", found.returncode, found.stdout + found.stderr)
+            git_dir = Path(lines[0])
+            self._git_dirs = (git_dir, (self.repo_dir / lines[1]).resolve())
+        return self._git_dirs
+
+    def git_path(self, name):
+        """Path of a per-worktree file in the git directory: the index, merge and
+        rebase state, and the application's own state files"""
+        return self.git_dirs()[0] / name
+
+    def state_path(self, name):
+        """Path of one of the application's state files: in the git directory,
+        or in the repository directory if it is not a git repository (yet)"""
+        try:
+            return self.git_path(name)
+        except (GitCommandError, OSError):
+            return self.repo_dir / name
+
+    def recover(self, result, remaining):
+        """Abort a merge or rebase left behind by an interrupted run, so a
+        half-merged repository does not make every later sync fail"""
+        if self.killed_git:
+            self.killed_git = False
+            # Only removed after we killed a git here; a lock held by any other git is left alone
+            index_lock = self.git_path("index.lock")
+            if index_lock.exists():
+                index_lock.unlink()
+                result.log.append(("recover", "Removed index.lock left by a killed git process\n"))
+        for marker, abort in (("MERGE_HEAD", ["merge", "--abort"]),
+                              ("rebase-merge", ["rebase", "--abort"]),
+                              ("rebase-apply", ["rebase", "--abort"])):
+            if self.git_path(marker).exists():
+                undo = self.run_git(abort, remaining())
+                result.log.append(("recover", f"Aborted unfinished {abort[0]}\n" + undo.stdout + undo.stderr))
+
+    def upstream(self, timeout):
+        """(remote, branch ref on the remote, remote-tracking ref) of the current
+        branch, or None if it has no upstream. Cached until HEAD switches to
+        another branch or the repository config changes."""
+        git_dir, common_dir = self.git_dirs()
+        try:
+            with open(git_dir / "HEAD", 'r', encoding='utf-8') as f:
+                head = f.read().strip()
+        except OSError:
+            return None
+        if not head.startswith("ref: "):
+            return None  # detached HEAD
+        ref = head[5:]
+        key = (ref, file_signature(common_dir / "config"))
+        if self._upstream is not None and self._upstream[0] == key:
+            return self._upstream[1]
+        info = self.run_git(["for-each-ref", "--format=%(upstream:remotename)%00%(upstream:remoteref)%00%(upstream)",
+                             ref], timeout)
+        if info.returncode != 0:
+            return None
+        parts = info.stdout.strip().split('\0')
+        upstream = tuple(parts) if len(parts) == 3 and all(parts) else None
+        self._upstream = (key, upstream)
+        return upstream
+
+    def remote_moved(self):
+        """Ask the remote (ls-remote, no objects transferred) whether its branch
+        has commits that are not in HEAD yet; raises GitCommandError if unreachable"""
+        timeout = self.config['sync']['timeout']
+        upstream = self.upstream(timeout)
+        if upstream is None:
+            return False
+        remote, branch, _ = upstream
+        ls_remote = self.run_git(["ls-remote", "--exit-code", remote, branch], timeout)
+        if ls_remote.returncode != 0:
+            raise GitCommandError("ls-remote", ls_remote.returncode, ls_remote.stdout + ls_remote.stderr)
+        sha = ls_remote.stdout.split()[0]
+        # Unknown objects (not fetched yet) also fail the ancestry check
+        known = self.run_git(["merge-base", "--is-ancestor", sha, "HEAD"], timeout)
+        return known.returncode != 0
+
+    def pull(self, result, remaining, fast_forward_only=False):
+        """Fetch and integrate the upstream branch: fast-forward when possible and
+        merge on divergence (unless fast_forward_only). Raises GitCommandError if
+        the remote is unreachable or the branches cannot be integrated, never
+        leaving a half-merged repository."""
+        upstream = self.upstream(remaining())
+        if upstream is None:
+            result.log.append(("pull", "No upstream branch configured, skipping pull"))
+            return
+        remote, branch, upstream = upstream
+
+        # Only the one branch (updating the remote-tracking ref as well) and the
+        # marker a history compaction leaves on the remote
+        fetch = self.run_phase(result, "pull", ["fetch", "--quiet", remote, branch,
+                                                f"+{COMPACTED_REFS}*:{COMPACTED_REFS}remotes/{remote}/*"],
+                               remaining)
+        output = fetch.stdout + fetch.stderr
+        result.log.append(("pull", output))
+        if fetch.returncode != 0:
+            raise GitCommandError("pull", fetch.returncode, output)
+
+        counts = self.run_phase(result, "pull", ["rev-list", "--left-right", "--count", f"HEAD...{upstream}"],
+                                remaining)
+        if counts.returncode != 0:
+            raise GitCommandError("pull", counts.returncode, counts.stdout + counts.stderr)
+        ahead, behind = (int(count) for count in counts.stdout.split())
+        if ahead and behind and not fast_forward_only and self.adopt_compacted_history(result, remaining,
+                                                                                        remote, upstream):
+            counts = self.run_phase(result, "pull", ["rev-list", "--left-right", "--count", f"HEAD...{upstream}"],
+                                    remaining)
+            if counts.returncode != 0:
+                raise GitCommandError("pull", counts.returncode, counts.stdout + counts.stderr)
+            ahead, behind = (int(count) for count in counts.stdout.split())
+        if behind == 0:
+            return
+        if ahead == 0:
+            merge = self.run_phase(result, "pull", ["merge", "--ff-only", upstream], remaining)
+            output = merge.stdout + merge.stderr
+            result.log.append(("pull", output))
+            if merge.returncode != 0:
+                raise GitCommandError("pull", merge.returncode, output)
+            result.merge = "fast-forward"
+            return
+        if fast_forward_only:
+            result.log.append(("pull", f"Diverged from {upstream} ({ahead} local, {behind} remote commits), "
+                                       "leaving the merge to the next push"))
+            return
+        self.merge_diverged(result, remaining, upstream)
+
+    def adopt_compacted_history(self, result, remaining, remote, upstream):
+        """Move HEAD onto an upstream branch whose history another machine
+        compacted, instead of merging the dropped history back in. Returns
+        True if HEAD moved.
+
+        The compacting machine pushes a marker blob "<old head> <new head>".
+        A clone that does not contain the new head yet is still on the old
+        history: without commits of its own it is reset to the upstream
+        branch; otherwise its current tree is re-committed on top of the new
+        head, and the usual merge takes it from there.
+        """
+        marker = self.run_git(["cat-file", "blob", f"{COMPACTED_REFS}remotes/{remote}/compacted"], remaining())
+        if marker.returncode != 0:
+            return False
+        try:
+            old_head, new_head = marker.stdout.split()
+        except ValueError:
+            return False
+        if (self.run_git(["merge-base", "--is-ancestor", new_head, "HEAD"], remaining()).returncode == 0 or
+                self.run_git(["merge-base", "--is-ancestor", new_head, upstream], remaining()).returncode != 0):
+            return False  # already moved, or the marker belongs to another branch
+        if self.run_git(["merge-base", "--is-ancestor", "HEAD", old_head], remaining()).returncode == 0:
+            reset = self.run_phase(result, "pull", ["reset", "--keep", upstream], remaining)
+            if reset.returncode != 0:
+                raise GitCommandError("pull", reset.returncode, reset.stdout + reset.stderr)
+            result.log.append(("pull", f"{upstream} was compacted on another machine, moved to it\n"))
+            return True
+        head = self.run_git(["rev-parse", "HEAD"], remaining()).stdout.strip()
+        carried = self.run_git(["commit-tree", "HEAD^{tree}", "-p", new_head, "-m",
+                                "Local changes carried over a history compaction"], remaining())
+        if carried.returncode != 0:
+            raise GitCommandError("pull", carried.returncode, carried.stdout + carried.stderr)
+        update = self.run_git(["update-ref", "-m", "keepass-sync: adopt compacted history", "HEAD",
+                               carried.stdout.strip(), head], remaining())
+        if update.returncode != 0:
+            raise GitCommandError("pull", update.returncode, update.stdout + update.stderr)
+        result.log.append(("pull", f"{upstream} was compacted on another machine, local changes carried over\n"))
+        return True
+
+    def merge_diverged(self, result, remaining, upstream):
+        """Merge an upstream branch that diverged from ours. Conflicts on the
+        configured databases of the repository are resolved with an entry-level
+        KDBX merge when possible and otherwise by keeping both versions; a
+        conflict on any other file aborts the merge with a "conflict" error."""
+        merge = self.run_phase(result, "pull", ["merge", "--no-edit", upstream], remaining)
+        output = merge.stdout + merge.stderr
+        result.log.append(("merge", output))
+        if merge.returncode == 0:
+            result.merge = "git"
+            return
+        completed = False
+        try:
+            conflicts = self.run_git(["diff", "--name-only", "--diff-filter=U"], remaining()).stdout.split('\n')
+            conflicts = [path for path in conflicts if path]
+            databases = {self.relative(db_file): db_file for db_file in self.databases}
+            unresolvable = [path for path in conflicts if path not in databases]
+            if unresolvable or not conflicts:
+                raise GitCommandError("conflict", merge.returncode,
+                                      "Cannot merge automatically: " + ", ".join(unresolvable or ["unknown files"]) +
+                                      "\n" + output)
+            for path in conflicts:
+                self.resolve_database_conflict(result, remaining, databases[path])
+            result.merge = "keep-both" if result.conflict_copies else "kdbx"
+            add = self.run_phase(result, "pull", ["add", "--"] + conflicts + result.conflict_copies, remaining)
+            if add.returncode != 0:
+                raise GitCommandError("merge", add.returncode, add.stdout + add.stderr)
+            commit = self.run_phase(result, "pull", ["commit", "--no-edit", "--no-verify"], remaining)
+            if commit.returncode != 0:
+                raise GitCommandError("merge", commit.returncode, commit.stdout + commit.stderr)
+            result.log.append(("merge", commit.stdout + commit.stderr))
+            completed = True
+        finally:
+            if not completed:
+                # Never leave a half-merged repository behind; the local commit is kept
+                self.run_git(["merge", "--abort"], self.config['sync']['timeout'])
+                for conflict_copy in result.conflict_copies:
+                    (self.repo_dir / conflict_copy).unlink(missing_ok=True)
+                result.conflict_copies = []
+                result.merge = None
+
+    def export_blob(self, spec, dest, timeout):
+        """Write a blob (e.g. ":3:Passwords.kdbx") to a file; False if it does not exist"""
+        with open(dest, 'wb') as f:
+            export = run_bounded(["git", "cat-file", "blob", spec], limit=self.config['log']['output_limit'],
+                                 cwd=str(self.repo_dir), stdout=f, env=self.env, timeout=timeout,
+                                 creationflags=self.creationflags)
+        return export.returncode == 0
+
+    def merger(self):
+        """A KdbxMerger with the configured credentials, or None if merging is unavailable"""
+        git = self.config['git']
+        if git['merge_strategy'] != 'auto' or not KdbxMerger.available():
+            return None
+        password = os.environ.get(git['merge_password_env'])
+        keyfile = git['merge_keyfile']
+        keyfile = str(self.repo_dir / keyfile) if keyfile else None
+        if password is None and keyfile is None:
+            return None
+        return KdbxMerger(password, keyfile)
+
+    def resolve_database_conflict(self, result, remaining, db_file):
+        """Put a resolved database in the working tree during a conflicted merge"""
+        import tempfile
+        merger = self.merger()
+        db_path = self.relative(db_file)
+        with tempfile.TemporaryDirectory(prefix="keepass-sync-merge-") as tmp:
+            tmp = Path(tmp)
+            base, ours, theirs = tmp / "base.kdbx", tmp / "ours.kdbx", tmp / "theirs.kdbx"
+            has_base = self.export_blob(f":1:{db_path}", base, remaining())
+            if not (self.export_blob(f":2:{db_path}", ours, remaining())
+                    and self.export_blob(f":3:{db_path}", theirs, remaining())):
+                raise GitCommandError("merge", 1, "Could not read both versions of the database")
+            if merger is not None and has_base:
+                try:
+                    merged = tmp / "merged.kdbx"
+                    stats = merger.merge(base, ours, theirs, merged)
+                except Exception as e:
+                    result.log.append(("merge", f"KDBX merge failed ({e}), keeping both versions"))
+                else:
+                    tmp_file = db_file.with_name(db_file.name + ".merge-tmp")
+                    with open(merged, 'rb') as src, open(tmp_file, 'wb') as dst:
+                        dst.write(src.read())
+                    os.replace(tmp_file, db_file)
+                    result.log.append(("merge", f"Merged {db_path} entries: " +
+                                       ", ".join(f"{count} {kind}" for kind, count in stats.items())))
+                    return
+
+            # Keep our version in place and the remote one next to it
+            copy_name = (f"{db_file.stem} (conflict {datetime.now().strftime('%Y-%m-%d %H%M%S')})"
+                         f"{db_file.suffix}")
+            copy_path = db_file.with_name(copy_name)
+            with open(theirs, 'rb') as src, open(copy_path, 'wb') as dst:
+                dst.write(src.read())
+            checkout = self.run_git(["checkout", "--ours", "--", db_path], remaining())
+            if checkout.returncode != 0:
+                copy_path.unlink(missing_ok=True)
+                raise GitCommandError("merge", checkout.returncode, checkout.stdout + checkout.stderr)
+            conflict_copy = self.relative(copy_path)
+            result.conflict_copies.append(conflict_copy)
+            result.log.append(("merge", f"Kept both versions: remote database saved as {conflict_copy}"))
+
+    def commit(self, result, remaining):
+        """Stage and commit the database locally; no network access"""
+        # Committing with a pathspec stages the database itself (a separate add
+        # would hash it twice) and only records it, whatever else is staged
+        args = ["commit", "-m", self.commit_message(), "--", self.db_path]
+        commit = self.run_phase(result, "commit", args, remaining)
+        output = commit.stdout + commit.stderr
+        if commit.returncode != 0 and "did not match any file(s) known to git" in output:
+            # Not tracked yet: the first sync has to add it
+            add = self.run_phase(result, "stage", ["add", "--", self.db_path], remaining)
+            if add.returncode != 0:
+                raise GitCommandError("add", add.returncode, add.stdout + add.stderr)
+            commit = self.run_phase(result, "commit", args, remaining)
+            output = commit.stdout + commit.stderr
+        result.log.append(("commit", output))
+        if commit.returncode != 0:
+            if any(text in output for text in ("nothing to commit", "nothing added to commit",
+                                               "no changes added to commit")):
+                return
+            raise GitCommandError("commit", commit.returncode, output)
+        result.committed = True
+        # First line looks like "[main 1a2b3c4] Update from host at ..."
+        header = output.split(']', 1)[0]
+        result.commit_sha = header.rsplit(' ', 1)[-1] if header.startswith('[') else None
+
+    def push(self, result, remaining, pull=False):
+        """Push all pending local commits. With pull set, the push is tried
+        first and only a push the remote rejects for lack of its newer commits
+        pulls them and pushes again: when nobody else pushed, which is nearly
+        always, the sync takes one git call and one round trip instead of a
+        fetch, a rev-list and a push."""
+        push = self.run_phase(result, "push", ["push", "--progress"], remaining)
+        # Keep only the final state of each carriage-return progress line
+        output = "\n".join(line.rsplit('\r', 1)[-1] for line in (push.stdout + push.stderr).split('\n'))
+        if push.returncode != 0 and pull and ("(fetch first)" in output or "(non-fast-forward)" in output):
+            result.log.append(("push", output))
+            self.pull(result, remaining)
+            push = self.run_phase(result, "push", ["push", "--progress"], remaining)
+            output = "\n".join(line.rsplit('\r', 1)[-1] for line in (push.stdout + push.stderr).split('\n'))
+        result.log.append(("push", output))
+        if push.returncode != 0:
+            raise GitCommandError("push", push.returncode, output)
+        result.pushed = True
+        result.bytes_pushed = pushed_bytes(output)
+
+    def sync(self, publish=True, result=None):
+        """Stage and commit the database, then pull and push when publish is
+        set; raises GitCommandError on failure"""
+        remaining = self.deadline()
+        result = result if result is not None else SyncResult()
+        self.recover(result, remaining)
+        # Committing first means the local save is safe in history before
+        # anything from the remote is merged into it
+        self.commit(result, remaining)
+        if publish:
+            self._publish(result, remaining)
+        return result
+
+    def update(self, result=None):
+        """Fast-forward to the remote branch without committing or pushing"""
+        remaining = self.deadline()
+        result = result if result is not None else SyncResult()
+        self.recover(result, remaining)
+        self.pull(result, remaining, fast_forward_only=True)
+        return result
+
+    def publish(self, result=None):
+        """Pull and push without committing, used to flush queued commits"""
+        remaining = self.deadline()
+        result = result if result is not None else SyncResult()
+        self.recover(result, remaining)
+        self._publish(result, remaining)
+        return result
+
+    def _publish(self, result, remaining):
+        if self.config['git']['auto_push']:
+            self.push(result, remaining, pull=self.config['git']['auto_pull'])
+        elif self.config['git']['auto_pull']:
+            self.pull(result, remaining)
+
+    def unpushed_count(self):
+        """Number of local commits not yet on the upstream branch (0 if there is none)"""
+        result = self.run_git(["rev-list", "--count", "@{upstream}..HEAD"], self.config['sync']['timeout'])
+        try:
+            return int(result.stdout.strip()) if result.returncode == 0 else 0
+        except ValueError:
+            return 0
+
+
+class PushQueue:
+    """Batches pushes of local commits for one repository and retries failed
+    pushes with exponential backoff and jitter.
+
+    Commits are made right away; the push is deferred by push_window seconds
+    so one push carries every commit made in that window. The queue state is
+    kept in .git/keepass-sync-push.json so pending pushes survive a restart.
+    """
+
+    def __init__(self, engine, trigger, window=10, retry_base=5, retry_max=600):
+        self.engine = engine
+        self.trigger = trigger  # asks the repository scheduler for a "push" run
+        self.window = window
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.state_file = engine.state_path("keepass-sync-push.json")
+        self.pending_count = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._held = False  # waiting for the user after a conflict that cannot be merged
+        self._state = {"pending": False, "attempts": 0, "next_attempt": 0}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self._state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def _save(self):
+        try:
+            write_json_atomic(self.state_file, self._state)
+        except OSError as e:
+            print(f"Error saving push queue {self.state_file}: {e}")
+
+    def _arm(self, delay):
+        """(Re)start the timer that triggers the next push attempt"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(0, delay), self.trigger)
+        self._timer.daemon = True
+        self._timer.start()
+
+    @property
+    def attempts(self):
+        """Failed push attempts since the last successful push"""
+        return self._state["attempts"]
+
+    def resume(self):
+        """Re-arm a push left pending by a previous run"""
+        self.refresh_count()
+        with self._lock:
+            if not self._held and (self._state["pending"] or self.pending_count):
+                self._state["pending"] = True
+                self._arm(self._state["next_attempt"] - time.time())
+
+    def committed(self):
+        """A local commit was made: push it at the end of the current window"""
+        self.refresh_count()
+        with self._lock:
+            if self._state["pending"] and not self._held:
+                return  # already scheduled, or backing off after a failure
+            self._held = False
+            self._state.update(pending=True, next_attempt=time.time() + self.window)
+            self._save()
+            self._arm(self.window)
+
+    def succeeded(self):
+        """The pending commits reached the remote"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._held = False
+            self._state.update(pending=False, attempts=0, next_attempt=0)
+            self._save()
+        # The push took every local commit along
+        if self.engine.config['git']['auto_push']:
+            self.pending_count = 0
+
+    def failed(self):
+        """The push failed: retry after an exponentially growing, jittered delay"""
+        import random
+        with self._lock:
+            self._state["attempts"] += 1
+            delay = min(self.retry_max, self.retry_base * 2 ** (self._state["attempts"] - 1))
+            delay = random.uniform(delay / 2, delay)
+            self._state.update(pending=True, next_attempt=time.time() + delay)
+            self._save()
+            self._arm(delay)
+        print(f"Push failed, retrying in {delay:.0f}s (attempt {self._state['attempts']})")
+        self.refresh_count()
+
+    def hold(self):
+        """The push needs a merge only the user can do: stop retrying until the
+        next local commit or a manual sync"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._held = True
+            self._state.update(pending=True, next_attempt=0)
+            self._save()
+        self.refresh_count()
+
+    def refresh_count(self):
+        """Update the number of commits waiting to be pushed"""
+        if self.engine.config['git']['auto_push']:
+            self.pending_count = self.engine.unpushed_count()
+
+    def cancel(self):
+        """Stop the timer; the pending state stays on disk for the next start"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+KDBX_SIGNATURE = 0x9AA2D903
+KDBX_FORMATS = (0xB54BFB67, 0xB54BFB66)  # KDBX 2.x to 4.x, KDBX 2.x pre-release
+KDB_FORMAT = 0xB54BFB65  # KeePass 1.x
+CHACHA20_UUID = bytes.fromhex("d6038a2b8b6f4cb5a524339a31dbb59a")
+
+
+def check_kdbx(path):
+    """Check without decrypting that a file is a complete KDBX database.
+    
+    Reads the signature, version and header fields, then for KDBX 4 compares
+    the header's SHA-256 with the stored one and walks the payload's
+    HMAC-block framing to its empty end block, which must end the file. KDBX 3
+    keeps its header hash inside the encrypted payload, so there the payload
+    must hold at least the stream start bytes and whole cipher blocks. Only the
+    header and 36 bytes per payload block (1 MiB by default) are read.
+    Returns None if the file looks complete, otherwise the reason it does not.
+    """
+    import hashlib
+    import struct
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            start = f.read(12)
+            if len(start) < 12:
+                return f"only {size} bytes"
+            signature, file_format, minor, major = struct.unpack('<IIHH', start)
+            if signature == KDBX_SIGNATURE and file_format == KDB_FORMAT:
+                return None  # KeePass 1.x: no structure to check without the key
+            if signature != KDBX_SIGNATURE or file_format not in KDBX_FORMATS:
+                return "no KDBX signature"
+            if major not in (2, 3, 4):
+                return f"unsupported KDBX version {major}.{minor}"
+            
+            # Header fields: 1-byte id, length (2 bytes before KDBX 4, 4 since), data; id 0 ends it
+            length_format = '<BI' if major >= 4 else '<BH'
+            length_size = struct.calcsize(length_format)
+            header_hash = hashlib.sha256(start)
+            fields = {}
+            while True:
+                raw = f.read(length_size)
+                if len(raw) < length_size:
+                    return "truncated header"
+                field_id, length = struct.unpack(length_format, raw)
+                data = f.read(length)
+                if len(data) < length:
+                    return "truncated header"
+                header_hash.update(raw)
+                header_hash.update(data)
+                if field_id == 0:
+                    break
+                fields[field_id] = data
+            cipher = fields.get(2)
+            if cipher is None:
+                return "header without cipher"
+            
+            if major >= 4:
+                if f.read(32) != header_hash.digest():
+                    return "header hash mismatch"
+                f.seek(32, os.SEEK_CUR)  # header HMAC, needs the key
+                while True:
+                    block = f.read(36)  # 32-byte block HMAC, signed 32-bit length
+                    if len(block) < 36:
+                        return "truncated payload"
+                    (length,) = struct.unpack('<i', block[32:])
+                    if length == 0:
+                        break
+                    if length < 0 or f.tell() + length > size:
+                        return "truncated payload"
+                    f.seek(length, os.SEEK_CUR)
+                if f.tell() != size:
+                    return "data after the end of the payload"
+            else:
+                payload = size - f.tell()
+                if payload < 32:
+                    return "truncated payload"
+                if cipher != CHACHA20_UUID and payload % 16:
+                    return "payload is not a whole number of cipher blocks"
+    except OSError as e:
+        return f"cannot read: {e}"
+    return None
+
+
+def database_in_use(db_file):
+    """True while a KeePass client has the database open or is writing it"""
+    db_file = Path(db_file)
+    lock_files = [
+        db_file.with_name(db_file.name + ".lock"),        # KeePass 2.x while saving, KeePass 1.x
+        db_file.with_name(f".{db_file.name}.lock"),       # KeePassXC while the database is open
+    ]
+    if any(lock_file.exists() for lock_file in lock_files):
+        return True
+    if sys.platform == "win32":
+        # KeePass opens the file without write sharing while it reads or saves it
+        try:
+            with open(db_file, 'r+b'):
+                pass
+        except PermissionError:
+            return True
+        except OSError:
+            pass
+    return False
+
+
+def user_idle_seconds():
+    """Seconds since the last keyboard or mouse input where the OS reports it
+    (Windows, macOS), otherwise None"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            class LASTINPUTINFO(ctypes.Structure):
+                _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint)]
+
+            info = LASTINPUTINFO()
+            info.cbSize = ctypes.sizeof(info)
+            if ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+                return ((ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000.0
+        elif sys.platform == "darwin":
+            ioreg = subprocess.run(["ioreg", "-c", "IOHIDSystem", "-d", "4"],
+                                   capture_output=True, text=True, timeout=5)
+            for line in ioreg.stdout.splitlines():
+                if '"HIDIdleTime"' in line:
+                    return int(line.rsplit('=', 1)[1]) / 1e9
+    except (OSError, ValueError, subprocess.SubprocessError):
+        pass
+    return None
+
+
+class RemotePoller:
+    """Checks in the background whether the remote branch has moved, so a
+    machine that is not editing still picks up changes from the others before
+    its next save. Checks every active_interval seconds while the user is
+    active and doubles the interval (up to max_interval) while idle or offline."""
+
+    def __init__(self, engine, trigger, config, log=None):
+        self.engine = engine
+        self.trigger = trigger  # asks the repository scheduler for a "remote" run
+        self.config = config
+        self.log = log  # SyncLog of the application; None prints to the console
+        self.interval = None  # seconds until the next check, None until started
+        self.offline = False
+        self.last_activity = time.monotonic()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _settings(self):
+        return self.config['remote_poll']
+
+    def _arm(self, delay):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self.check)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def start(self):
+        """Schedule the first check shortly after monitoring starts"""
+        if not self._settings()['enabled']:
+            return
+        self.interval = self._settings()['active_interval']
+        self._arm(5)
+
+    def activity(self):
+        """The user changed the database: go back to the active interval"""
+        self.last_activity = time.monotonic()
+        active = self._settings()['active_interval']
+        if self.interval is not None and self.interval > active:
+            self.interval = active
+            self._arm(active)
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.interval = None
+
+    def _error(self, message):
+        if self.log is not None:
+            self.log.error(message, phase="remote")
+        else:
+            print(message)
+
+    def check(self):
+        """Timer callback: ask the remote and trigger a fast-forward if it moved.
+        Re-arms itself whatever happens, unless cancelled meanwhile."""
+        try:
+            moved = self.engine.remote_moved()
+            self.offline = False
+            if moved:
+                self.trigger()
+        except GitCommandError as e:
+            self.offline = e.is_network_error
+            if not self.offline:
+                self._error(f"Remote check failed: {e}")
+        except subprocess.TimeoutExpired:
+            self.offline = True
+        except ProcessCancelled:
+            return  # shutting down
+        except Exception as e:
+            # An unexpected error must not stop the checks for good
+            self._error(f"Remote check failed: {e}")
+        with self._lock:
+            if self._timer is None:
+                return  # cancelled meanwhile
+        self._arm(self.next_interval())
+
+    def next_interval(self):
+        settings = self._settings()
+        active = settings['active_interval']
+        idle_for = user_idle_seconds()
+        if idle_for is None:
+            idle_for = time.monotonic() - self.last_activity
+        if not self.offline and idle_for < settings['active_window']:
+            self.interval = active
+        else:
+            self.interval = min(settings['max_interval'], (self.interval or active) * 2)
+        return self.interval
+
+
+class DatabaseFingerprint:
+    """Tracks the content of the last synced database so syncs only run on real changes.
+
+    The fingerprint is the git blob id of the file, so it can be compared
+    directly with the blob committed at HEAD. A (size, mtime_ns, inode)
+    stat key acts as a pre-filter: the file is only read when it differs.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.state_file = engine.state_path("keepass-sync-state.json")
+        self._state = self._load_state()
+        self._seen = None  # (stat key, blob id) of the last hashed version
+        self._head_blob = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        # Several databases in one repository share the file, so only replace our entry
+        state = self._load_state()
+        state[self.engine.db_path] = self._state[self.engine.db_path]
+        try:
+            write_json_atomic(self.state_file, state)
+        except OSError as e:
+            print(f"Error saving sync state {self.state_file}: {e}")
+
+    def stat_key(self):
+        """Cheap identity of the current file version, or None if it is missing"""
+        try:
+            st = os.stat(self.engine.db_file)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def blob_id(self, algorithm='sha1'):
+        """Stream the database through the same hash git uses for blob ids"""
+        import hashlib
+        with open(self.engine.db_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            digest = hashlib.new(algorithm, b"blob %d\0" % size)
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def head_blob(self):
+        """Blob id of the database at HEAD, resolved once per sync"""
+        if self._head_blob is None:
+            result = self.engine.run_git(["rev-parse", "--verify", "--quiet", f"HEAD:{self.engine.db_path}"],
+                                         timeout=self.engine.config['sync']['timeout'])
+            self._head_blob = result.stdout.strip() if result.returncode == 0 else ""
+        return self._head_blob
+
+    def _current(self):
+        """Stat key and blob id of the file, hashing only if the stat key changed"""
+        key = self.stat_key()
+        if key is None:
+            return None, None
+        if self._seen and self._seen[0] == key:
+            return self._seen
+        algorithm = 'sha256' if len(self.head_blob()) == 64 else 'sha1'
+        self._seen = (key, self.blob_id(algorithm))
+        return self._seen
+
+    def needs_sync(self):
+        """True if the database content differs from both the last sync and HEAD"""
+        entry = self._state.get(self.engine.db_path, {})
+        key = self.stat_key()
+        if key is None or key == entry.get('stat'):
+            return False
+        key, blob = self._current()
+        if blob == entry.get('blob') or blob == self.head_blob():
+            # Touched or rewritten with identical bytes: remember the new stat key
+            self._state[self.engine.db_path] = {'stat': key, 'blob': blob}
+            self._save_state()
+            return False
+        return True
+
+    def record_synced(self, committed=False):
+        """Remember the file as synced if it still matches what is now at HEAD.
+        When the sync committed the file and it has not changed since it was
+        hashed, that hash is the blob at HEAD and git need not be asked."""
+        self._head_blob = None
+        if committed and self._seen and self._seen[0] == self.stat_key():
+            self._head_blob = self._seen[1]
+        key, blob = self._current()
+        if key is None or blob != self.head_blob():
+            return  # changed again since the commit, the next trigger will pick it up
+        self._state[self.engine.db_path] = {'stat': key, 'blob': blob}
+        self._save_state()
+
+
+def format_size(size):
+    """Human readable byte count"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class RepositoryMaintenance:
+    """Keeps a repository of full-size encrypted database blobs from growing
+    without bound: runs gc/repack when the app has been idle, optionally
+    compacts old history, and reports repository size before and after."""
+
+    # The branch tip before the last compaction, kept until the next run
+    BACKUP_REF = f"{COMPACTED_REFS}pre-compaction"
+
+    def __init__(self, engine, trigger, config):
+        self.engine = engine
+        self.trigger = trigger  # asks the repository scheduler for a "maintenance" run
+        self.config = config
+        self.state_file = engine.state_path("keepass-sync-maintenance.json")
+        self._timer = None
+        self._lock = threading.Lock()
+        self.last_report = None
+
+    def _settings(self):
+        return self.config['maintenance']
+
+    def _last_run(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('last_run', 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save(self, report):
+        try:
+            write_json_atomic(self.state_file, {'last_run': time.time(), 'last_report': report})
+        except OSError as e:
+            print(f"Error saving maintenance state {self.state_file}: {e}")
+
+    def arm(self):
+        """(Re)start the idle timer; called after every sync of the repository"""
+        settings = self._settings()
+        if not settings['enabled']:
+            return
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(settings['idle_time'], self.trigger)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        """Stop the idle timer"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def due(self):
+        """True if the last maintenance run is older than the configured interval"""
+        interval = self._settings()['interval_hours'] * 3600
+        return time.time() - self._last_run() >= interval
+
+    def repo_size(self):
+        """Object store size in bytes as {'loose': n, 'packs': n}"""
+        result = self.engine.run_git(["count-objects", "-v"], self.engine.config['sync']['timeout'])
+        values = {}
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition(':')
+            if value.strip().isdigit():
+                values[key.strip()] = int(value.strip())
+        return {'loose': values.get('size', 0) * 1024, 'packs': values.get('size-pack', 0) * 1024}
+
+    def run(self):
+        """Compact history if enabled, then gc; returns the size report"""
+        settings = self._settings()
+        timeout = settings['timeout']
+        before = self.repo_size()
+        # The history dropped by the previous compaction has been kept for a
+        # whole maintenance interval; release it now
+        backup = self.engine.run_git(["rev-parse", "--quiet", "--verify", self.BACKUP_REF], timeout)
+        released = backup.returncode == 0
+        if released:
+            self.engine.run_git(["update-ref", "-d", self.BACKUP_REF], timeout)
+        compacted = 0
+        if settings['compact_history']:
+            compacted = self.compact_history(settings['keep_all_days'], timeout)
+        prune = ["--prune=now"] if released else []
+        gc = self.engine.run_git(["gc", "--quiet"] + prune, timeout)
+        if gc.returncode != 0:
+            raise GitCommandError("gc", gc.returncode, gc.stdout + gc.stderr)
+        after = self.repo_size()
+        report = {'before': before, 'after': after, 'compacted_commits': compacted}
+        self._save(report)
+        self.last_report = report
+        return report
+
+    def compact_history(self, keep_all_days, timeout):
+        """Keep every commit of the last keep_all_days days and one snapshot per
+        day before that. Returns the number of commits dropped.
+
+        The rewritten branch is force-pushed with a lease before the local
+        branch moves, so a failed push leaves both sides untouched.
+        """
+        fields = "%H%x1f%T%x1f%an%x1f%ae%x1f%ad%x1f%cn%x1f%ce%x1f%cd%x1f%ct%x1f%B%x1e"
+        log = self.engine.run_git(["log", "--first-parent", "--reverse", "--date=raw",
+                                   f"--format={fields}", "HEAD"], timeout, full_output=True)
+        if log.returncode != 0:
+            raise GitCommandError("log", log.returncode, log.stdout + log.stderr)
+        commits = []
+        for record in log.stdout.split('\x1e'):
+            parts = record.strip('\n').split('\x1f')
+            if len(parts) == 10:
+                commits.append(parts)
+        if not commits:
+            return 0
+
+        cutoff = time.time() - keep_all_days * 86400
+        kept = []
+        for i, commit in enumerate(commits):
+            commit_time = int(commit[8])
+            if commit_time >= cutoff:
+                kept.append(commit)
+                continue
+            # Older than the cutoff: keep only the last commit of each day
+            day = datetime.fromtimestamp(commit_time).date()
+            next_day = datetime.fromtimestamp(int(commits[i + 1][8])).date() if i + 1 < len(commits) else None
+            if next_day != day:
+                kept.append(commit)
+        dropped = len(commits) - len(kept)
+        if not dropped:
+            return 0
+
+        branch = self.engine.run_git(["symbolic-ref", "--quiet", "HEAD"], timeout).stdout.strip()
+        if not branch:
+            print("Skipping history compaction: HEAD is not on a branch")
+            return 0
+        old_head = commits[-1][0]
+        parent = None
+        for sha, tree, an, ae, ad, cn, ce, cd, _ct, message in kept:
+            env = {'GIT_AUTHOR_NAME': an, 'GIT_AUTHOR_EMAIL': ae, 'GIT_AUTHOR_DATE': ad,
+                   'GIT_COMMITTER_NAME': cn, 'GIT_COMMITTER_EMAIL': ce, 'GIT_COMMITTER_DATE': cd}
+            args = ["commit-tree", tree, "-m", message.rstrip('\n') or "(no message)"]
+            if parent:
+                args += ["-p", parent]
+            created = self.engine.run_git(args, timeout, env=env)
+            if created.returncode != 0:
+                raise GitCommandError("commit-tree", created.returncode, created.stdout + created.stderr)
+            parent = created.stdout.strip()
+
+        upstream = self.engine.upstream(timeout)
+        if self.engine.config['git']['auto_push'] and upstream is not None:
+            remote, remote_ref, _ = upstream
+            # Tells the other machines to move to the new history (see adopt_compacted_history)
+            marker_file = self.engine.state_path("keepass-sync-compacted.tmp")
+            with open(marker_file, 'w', encoding='utf-8') as f:
+                f.write(f"{old_head} {parent}\n")
+            try:
+                marker = self.engine.run_git(["hash-object", "-w", "--", str(marker_file)], timeout)
+            finally:
+                marker_file.unlink(missing_ok=True)
+            if marker.returncode != 0:
+                raise GitCommandError("hash-object", marker.returncode, marker.stdout + marker.stderr)
+            push = self.engine.run_git(["push", "--atomic", f"--force-with-lease={remote_ref}:{old_head}", remote,
+                                        f"{parent}:{remote_ref}",
+                                        f"+{marker.stdout.strip()}:{COMPACTED_REFS}compacted"], timeout)
+            if push.returncode != 0:
+                raise GitCommandError("push", push.returncode, push.stdout + push.stderr)
+        update = self.engine.run_git(["update-ref", "-m", "keepass-sync: compact history",
+                                      branch, parent, old_head], timeout)
+        if update.returncode != 0:
+            raise GitCommandError("update-ref", update.returncode, update.stdout + update.stderr)
+        # The old history stays recoverable from the backup ref until the next
+        # maintenance run; the reflogs of the branch would keep it for months
+        self.engine.run_git(["update-ref", self.BACKUP_REF, old_head], timeout)
+        rewritten = [branch, "HEAD"] + ([upstream[2]] if upstream is not None else [])
+        self.engine.run_git(["reflog", "expire", "--expire=now"] + rewritten, timeout)
+        print(f"Compacted history: dropped {dropped} of {len(commits)} commits (previous head {old_head}, "
+              f"kept as {self.BACKUP_REF} until the next maintenance run)")
+        return dropped
+
+
+class SyncMetrics:
+    """Per-phase sync timings: Prometheus-style counters and histograms, plus a
+    window of recent samples for the p50/p95 figures shown in the tray"""
+
+    PHASES = ("detection", "pull", "stage", "commit", "push", "total")
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    RECENT_SAMPLES = 200
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}  # (database, outcome) -> count
+        self._histograms = {}  # (database, phase) -> [bucket counts..., +Inf count, sum]
+        self._recent = {phase: deque(maxlen=self.RECENT_SAMPLES) for phase in self.PHASES}
+        self._gauges = {}  # name -> (help text, function returning the value or None)
+
+    def gauge(self, name, help_text, read):
+        """Export a value that is read when the metrics are rendered"""
+        self._gauges[name] = (help_text, read)
+
+    def record(self, database, outcome, phases):
+        """Record one sync run; phases maps phase name to seconds"""
+        with self._lock:
+            self._runs[(database, outcome)] = self._runs.get((database, outcome), 0) + 1
+            for phase, seconds in phases.items():
+                histogram = self._histograms.setdefault((database, phase), [0] * (len(self.BUCKETS) + 2))
+                for i, bound in enumerate(self.BUCKETS):
+                    if seconds <= bound:
+                        histogram[i] += 1
+                histogram[len(self.BUCKETS)] += 1
+                histogram[-1] += seconds
+                self._recent.setdefault(phase, deque(maxlen=self.RECENT_SAMPLES)).append(seconds)
+
+    def percentiles(self, phase, quantiles=(0.5, 0.95)):
+        """Percentiles of the recent samples of a phase, or None without samples"""
+        with self._lock:
+            samples = sorted(self._recent.get(phase, ()))
+        if not samples:
+            return None
+        return [samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles]
+
+    def summary(self, phases=("detection", "push", "total")):
+        """Short p50/p95 text for the tray status, empty before the first sync"""
+        parts = []
+        for phase in phases:
+            values = self.percentiles(phase)
+            if values:
+                parts.append(f"{phase} {values[0]:.2f}/{values[1]:.2f}s")
+        return ", ".join(parts)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+        out = ["# HELP keepass_sync_runs_total Sync runs by outcome.",
+               "# TYPE keepass_sync_runs_total counter"]
+        with self._lock:
+            for (database, outcome), count in sorted(self._runs.items()):
+                out.append(f'keepass_sync_runs_total{{database="{escape(database)}",outcome="{outcome}"}} {count}')
+            out += ["# HELP keepass_sync_phase_duration_seconds Time spent in each sync phase.",
+                    "# TYPE keepass_sync_phase_duration_seconds histogram"]
+            for (database, phase), histogram in sorted(self._histograms.items()):
+                labels = f'database="{escape(database)}",phase="{phase}"'
+                for bound, count in zip(self.BUCKETS, histogram):
+                    out.append(f'keepass_sync_phase_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                out.append(f'keepass_sync_phase_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram[len(self.BUCKETS)]}')
+                out.append(f'keepass_sync_phase_duration_seconds_sum{{{labels}}} {histogram[-1]:.6f}')
+                out.append(f'keepass_sync_phase_duration_seconds_count{{{labels}}} {histogram[len(self.BUCKETS)]}')
+        for name, (help_text, read) in sorted(self._gauges.items()):
+            value = read()
+            if value is not None:
+                out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value:g}"]
+        return "\n".join(out) + "\n"
+
+    def write_textfile(self, path):
+        """Write the metrics atomically for the node_exporter textfile collector"""
+        path = Path(path)
+        tmp_file = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_file, path)
+        except OSError as e:
+            print(f"Error writing metrics file {path}: {e}")
+
+    def serve(self, port):
+        """Serve /metrics on localhost in a background thread; returns the server"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the console
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving sync metrics on http://127.0.0.1:{server.server_address[1]}/metrics")
+        return server
+
+
+class SyncJournal:
+    """On-disk history of every sync attempt, in an SQLite database in WAL mode.
+
+    record() only appends to an in-memory batch; a writer thread inserts the
+    batch in one transaction once history.flush_interval seconds have passed
+    (or BATCH_SIZE records are waiting), so journaling adds no time to a sync.
+    Readers such as --history never block the writer.
+    """
+
+    BATCH_SIZE = 100
+    # Outcomes that are not failures: nothing was wrong, there was just nothing to sync (yet)
+    NOT_FAILED = ("success", "postponed", "skipped")
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS syncs (
+            id INTEGER PRIMARY KEY,
+            time REAL NOT NULL,
+            database TEXT NOT NULL,
+            sources TEXT NOT NULL,
+            outcome TEXT NOT NULL,
+            sha TEXT,
+            bytes_pushed INTEGER,
+            duration REAL,
+            phases TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS syncs_time ON syncs (time);
+    """
+
+    def __init__(self, path, config):
+        self.path = Path(path)
+        self.config = config
+        self._batch = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self.connect(self.path).close()  # create it now so errors show at startup
+        self._thread = threading.Thread(target=self._run, name="keepass-sync-journal", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def connect(cls, path):
+        """Open (and create if needed) a journal database"""
+        import sqlite3
+        conn = sqlite3.connect(str(path), timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(cls.SCHEMA)
+        return conn
+
+    def record(self, database, sources, outcome, result):
+        """Queue one sync attempt for the next batch"""
+        phases = json.dumps({phase: round(seconds, 4) for phase, seconds in result.phases.items()})
+        row = (time.time(), database, ",".join(dict.fromkeys(sources)), outcome, result.commit_sha,
+               result.bytes_pushed, result.phases.get("total"), phases)
+        with self._cond:
+            if self._closing:
+                return
+            self._batch.append(row)
+            self._cond.notify()
+
+    def close(self, timeout=5):
+        """Write what is still batched and stop the writer"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        import sqlite3
+        conn = None
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._batch or self._closing)
+                # Give the batch time to fill up
+                self._cond.wait_for(lambda: self._closing or len(self._batch) >= self.BATCH_SIZE,
+                                    self.config['history']['flush_interval'])
+                batch, self._batch = self._batch, []
+                closing = self._closing
+            if batch:
+                try:
+                    if conn is None:
+                        conn = self.connect(self.path)
+                    with conn:
+                        conn.executemany("INSERT INTO syncs (time, database, sources, outcome, sha, bytes_pushed, "
+                                         "duration, phases) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                except sqlite3.Error as e:
+                    print(f"Error writing sync history {self.path}: {e}")
+            if closing:
+                if conn is not None:
+                    conn.close()
+                return
+
+    @staticmethod
+    def totals(conn):
+        """database -> (successful syncs, time of the last one)"""
+        rows = conn.execute("SELECT database, COUNT(*), MAX(time) FROM syncs "
+                            "WHERE outcome = 'success' GROUP BY database")
+        return {database: (count, last) for database, count, last in rows}
+
+    @staticmethod
+    def recent(conn, limit, failures_only=False):
+        """The last `limit` attempts, newest first"""
+        where = f"WHERE outcome NOT IN ({', '.join('?' * len(SyncJournal.NOT_FAILED))})" if failures_only else ""
+        parameters = SyncJournal.NOT_FAILED if failures_only else ()
+        return conn.execute(f"SELECT time, database, sources, outcome, sha, bytes_pushed, duration, phases "
+                            f"FROM syncs {where} ORDER BY time DESC LIMIT ?", (*parameters, limit)).fetchall()
+
+    @staticmethod
+    def per_day(conn, days):
+        """(day, runs, failures, p50, p95, max, bytes pushed) for the last `days` days"""
+        since = time.time() - days * 86400
+        rows = conn.execute("SELECT date(time, 'unixepoch', 'localtime'), outcome, duration, bytes_pushed "
+                            "FROM syncs WHERE time >= ? ORDER BY time", (since,))
+        days_seen = {}
+        for day, outcome, duration, pushed in rows:
+            entry = days_seen.setdefault(day, {"runs": 0, "failures": 0, "durations": [], "pushed": 0})
+            entry["runs"] += 1
+            if outcome not in SyncJournal.NOT_FAILED:
+                entry["failures"] += 1
+            if outcome == "success" and duration is not None:
+                entry["durations"].append(duration)
+            entry["pushed"] += pushed or 0
+        summary = []
+        for day, entry in days_seen.items():
+            durations = sorted(entry["durations"])
+            def percentile(q):
+                return durations[min(len(durations) - 1, int(q * len(durations)))] if durations else None
+            summary.append((day, entry["runs"], entry["failures"], percentile(0.5), percentile(0.95),
+                            durations[-1] if durations else None, entry["pushed"]))
+        return summary
+
+
+class NotificationDispatcher:
+    """Shows desktop notifications from a background thread so a slow or hung
+    notification service never holds up a sync.
+
+    Urgency decides how a notification is treated:
+    - "normal": shown as soon as possible; notifications posted with the same
+      key within notifications.coalesce_window seconds are merged into one
+      summary ("5 syncs completed")
+    - "error": at most one per title every notifications.error_interval
+      seconds; the suppressed ones are counted in the next one shown
+    - "critical": always shown
+    Normal notifications are dropped instead of blocking the caller when
+    notifications.queue_size of them are already waiting to be shown.
+    """
+
+    def __init__(self, show, config):
+        self.show = show  # blocking show(title, message), called on the dispatcher thread
+        self.config = config
+        self.dropped = 0
+        self._cond = threading.Condition()
+        self._queue = deque()  # (title, message) waiting to be shown
+        self._groups = {}  # key -> [deadline, count, title, message, summary]
+        self._last_error = {}  # title -> monotonic time the last error was shown
+        self._suppressed = {}  # title -> errors not shown since then
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="keepass-sync-notify", daemon=True)
+        self._thread.start()
+
+    def _settings(self):
+        return self.config['notifications']
+
+    def post(self, title, message, urgency='normal', key=None, summary=None):
+        """Queue a notification; never blocks. summary is the merged text for a
+        key, with {count} replaced by the number of merged notifications"""
+        now = time.monotonic()
+        with self._cond:
+            if self._closing:
+                return
+            if urgency == 'error':
+                if now - self._last_error.get(title, float('-inf')) < self._settings()['error_interval']:
+                    self._suppressed[title] = self._suppressed.get(title, 0) + 1
+                    return
+                self._last_error[title] = now
+                suppressed = self._suppressed.pop(title, 0)
+                if suppressed:
+                    message += f"\n({suppressed} similar error(s) since the last notification)"
+            elif urgency == 'normal':
+                if key is not None:
+                    group = self._groups.get(key)
+                    if group is None:
+                        self._groups[key] = [now + self._settings()['coalesce_window'], 1, title, message, summary]
+                        self._cond.notify()
+                    else:
+                        group[1] += 1
+                    return
+                if len(self._queue) >= self._settings()['queue_size']:
+                    self.dropped += 1
+                    return
+            self._queue.append((title, message))
+            self._cond.notify()
+
+    def close(self, timeout=2):
+        """Show what is still queued or being merged, then stop"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _merged(self, everything=False):
+        """Take the merged notification of every group whose window has ended"""
+        now = time.monotonic()
+        merged = []
+        for key, (deadline, count, title, message, summary) in list(self._groups.items()):
+            if everything or deadline <= now:
+                del self._groups[key]
+                merged.append((title, summary.format(count=count) if count > 1 and summary else message))
+        return merged
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    items = list(self._queue) + self._merged(everything=self._closing)
+                    self._queue.clear()
+                    if items or self._closing:
+                        break
+                    deadlines = [group[0] for group in self._groups.values()]
+                    self._cond.wait(max(0, min(deadlines) - time.monotonic()) if deadlines else None)
+                closing = self._closing
+            for title, message in items:
+                try:
+                    self.show(title, message)
+                except Exception as e:
+                    print(f"Notification error: {e}")
+            if closing:
+                return
+
+
+class InstanceLock:
+    """Exclusive per-repository lock held while an instance runs, so two copies
+    of the application never watch and sync the same repository. The OS drops
+    the lock when the process exits, so a crash cannot leave it stale."""
+
+    def __init__(self, engine):
+        self.path = engine.state_path("keepass-sync-instance.lock")
+        self.control_file = engine.state_path("keepass-sync-control.json")
+        self._file = None
+
+    def acquire(self):
+        """Take the lock without blocking; False if another instance holds it"""
+        f = open(self.path, 'a+b')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def held_elsewhere(self):
+        """True if a running instance holds the lock"""
+        if not self.path.exists():
+            return False
+        if not self.acquire():
+            return True
+        self.release()
+        return False
+
+    def release(self):
+        """Drop the lock and the control endpoint details"""
+        if self._file is None:
+            return
+        try:
+            self.control_file.unlink()
+        except OSError:
+            pass
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        self._file.close()
+        self._file = None
+
+    def publish(self, address, authkey):
+        """Record where and how the control endpoint of this instance is reached"""
+        info = {"pid": os.getpid(), "address": address, "authkey": authkey.hex()}
+        # The auth key grants control of the instance: readable by the owner only
+        write_json_atomic(self.control_file, info, private=True)
+
+    def endpoint(self):
+        """(address, authkey) of the instance holding the lock, or None"""
+        try:
+            with open(self.control_file, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            return info['address'], bytes.fromhex(info['authkey'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def control_address(engine):
+    """Control endpoint of the instance syncing the engine's repository: a
+    named pipe on Windows, otherwise a Unix domain socket in the git directory
+    (or the temp directory when that path is too long for a socket address)"""
+    import hashlib
+    digest = hashlib.sha1(str(engine.repo_dir.resolve()).encode('utf-8')).hexdigest()[:16]
+    if os.name == 'nt':
+        return rf"\\.\pipe\keepass-sync-{digest}"
+    path = engine.state_path("keepass-sync.sock")
+    if not path.parent.is_dir() or len(os.fsencode(str(path))) > 100:
+        import tempfile
+        path = Path(tempfile.gettempdir()) / f"keepass-sync-{os.getuid()}-{digest}.sock"
+    return str(path)
+
+
+def control_family():
+    """multiprocessing.connection family of the control endpoint"""
+    return 'AF_PIPE' if os.name == 'nt' else 'AF_UNIX'
+
+
+class ControlServer:
+    """Local control endpoint of a running instance. Each connection carries
+    one JSON request such as {"command": "status"} and gets one JSON reply;
+    clients authenticate with the key published next to the instance lock.
+    Every connection is served on its own thread, so a client that stalls in
+    the handshake or never sends its request cannot block the others."""
+
+    REQUEST_TIMEOUT = 5  # seconds an authenticated client has to send its request
+
+    def __init__(self, address, handler):
+        self.address = address
+        self.handler = handler
+        self.authkey = os.urandom(32)
+        self._listener = None
+        self._closed = False
+        self._handler_lock = threading.Lock()  # one command at a time, e.g. pause and resume
+
+    def start(self):
+        """Listen on the address and serve requests on a daemon thread"""
+        from multiprocessing.connection import Listener
+        family = control_family()
+        if family == 'AF_UNIX' and os.path.exists(self.address):
+            # Left behind by a crashed instance; the instance lock says it is ours now
+            os.unlink(self.address)
+        # No authkey here: Listener.accept() would run the handshake on the accepting thread
+        self._listener = Listener(self.address, family)
+        if family == 'AF_UNIX':
+            os.chmod(self.address, 0o600)
+        threading.Thread(target=self._serve, name="keepass-sync-control", daemon=True).start()
+
+    def _serve(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except OSError as e:
+                if not self._closed:
+                    print(f"Control endpoint stopped: {e}")
+                return
+            threading.Thread(target=self._handle, args=(conn,), name="keepass-sync-control-client",
+                             daemon=True).start()
+
+    def _handle(self, conn):
+        """Authenticate one client, then answer its request"""
+        from multiprocessing.connection import AuthenticationError, answer_challenge, deliver_challenge
+        with conn:
+            try:
+                deliver_challenge(conn, self.authkey)
+                answer_challenge(conn, self.authkey)
+                if not conn.poll(self.REQUEST_TIMEOUT):
+                    return
+                request = conn.recv_bytes(4096)
+            except (AuthenticationError, OSError, EOFError):
+                return
+            try:
+                with self._handler_lock:
+                    reply = self.handler(json.loads(request))
+            except Exception as e:
+                reply = {"ok": False, "message": f"Error: {e}"}
+            try:
+                conn.send_bytes(json.dumps(reply).encode('utf-8'))
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop serving and remove the endpoint"""
+        if self._listener is None or self._closed:
+            return
+        self._closed = True
+        # accept() does not notice close() on every platform: wake it with a connection
+        try:
+            from multiprocessing.connection import Client
+            Client(self.address, control_family(), authkey=self.authkey).close()
+        except Exception:
+            pass
+        self._listener.close()
+
+
+class InstanceRunningError(RuntimeError):
+    """Another instance already syncs one of the configured repositories"""
+
+
+class DatabaseTarget:
+    """One database file, the repository it lives in and its sync status"""
+
+    def __init__(self, name, repo_dir, db_file, config):
+        self.name = name
+        self.repo_dir = Path(repo_dir)
+        self.db_file = Path(db_file)
+        self.engine = GitSyncEngine(self.repo_dir, self.db_file, config)
+        self.fingerprint = DatabaseFingerprint(self.engine)
+        self.last_signature = None  # (mtime_ns, size, inode) last seen by the monitor
+        self.last_sync_time = None
+        self.sync_count = 0
+        self.sync_problem = None  # None, "error" or "offline" after a failed sync
+        self.syncing = False
+        self.detected_at = None  # monotonic time of the first unsynced change
+        self.updating = False  # True while the working copy is fast-forwarded to the remote
+
 
 class KeePassSyncTray:
-    def __init__(self, config_file=None):
-        # Handle both development and PyInstaller bundled execution
-        if getattr(sys, 'frozen', False):
-            # Running as PyInstaller bundle
-            # Scripts are bundled in temp dir, database stays in exe directory
-            self.script_dir = Path(sys._MEIPASS)
-            self.base_dir = Path(sys.executable).parent
-        else:
-            # Running as Python script - everything in same directory
-            self.script_dir = Path(__file__).parent
-            self.base_dir = Path(__file__).parent
+    WATCHER_MAX_ERRORS = 5  # consecutive watcher errors before falling back to polling
+    
+    def __init__(self, config_file=None, headless=False):
+        self.headless = headless
+        self._shutdown = threading.Event()
+        self.script_dir, self.base_dir = application_dirs()
         
         # Load configuration
         self.config = self.load_config(config_file)
         
-        self.db_file = self.base_dir / self.config['database']['filename']
+        # Structured sync log: console, ring buffer for the tray menu, rotated file
+        log_config = self.config['log']
+        log_file = log_config['file']
+        self.log = SyncLog(self.base_dir / log_file if log_file else None,
+                           max_bytes=log_config['max_bytes'],
+                           backup_count=log_config['backup_count'],
+                           capacity=log_config['buffer_size'])
+        
         # Choose appropriate sync script based on platform
         import platform
         if platform.system() == "Windows":
@@ -43,217 +2761,471 @@ class KeePassSyncTray:
             self.sync_script = self.script_dir / "sync-keepass.sh"
             self.shell_cmd = ["bash"]
         
+        self.targets = self.load_targets()
+        # One running instance per repository
+        self.instance_locks = []
+        for repo_dir, engine in {target.repo_dir: target.engine for target in self.targets}.items():
+            lock = InstanceLock(engine)
+            if not lock.acquire():
+                self.release_instance_locks()
+                raise InstanceRunningError(f"Another instance is already syncing {repo_dir}")
+            self.instance_locks.append(lock)
+        self.control_server = None
+        self.notifications = NotificationDispatcher(self.show_notification, self.config)
+        self.journal = self.open_journal()
         self.is_running = False
         self.sync_thread = None
-        self.last_sync_time = None
-        self.sync_count = 0
-        self.last_mtime = 0
+        self.watcher = None
+        
+        # One scheduler per repository on the runtime's event loop; syncs run on a
+        # shared, bounded worker pool
+        self.runtime = get_runtime()
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=self.config['sync']['max_workers'],
+                                           thread_name_prefix="keepass-sync")
+        self.schedulers = {}
+        for target in self.targets:
+            if target.repo_dir not in self.schedulers:
+                self.schedulers[target.repo_dir] = SyncScheduler(
+                    self.sync_pending, self.executor,
+                    settle_time=self.config['sync']['settle_time'],
+                    max_settle_wait=self.config['sync']['max_settle_wait'],
+                    runtime=self.runtime)
+        # Local commits are pushed in batches, one queue per repository
+        self.push_queues = {}
+        for target in self.targets:
+            if target.repo_dir not in self.push_queues:
+                self.push_queues[target.repo_dir] = PushQueue(
+                    target.engine,
+                    lambda t=target: self.request_background(t, "push"),
+                    window=self.config['git']['push_window'],
+                    retry_base=self.config['git']['push_retry_base'],
+                    retry_max=self.config['git']['push_retry_max'])
+        # Background gc/repack once a repository has been idle for a while
+        self.maintenance = {}
+        for target in self.targets:
+            if target.repo_dir not in self.maintenance:
+                self.maintenance[target.repo_dir] = RepositoryMaintenance(
+                    target.engine,
+                    lambda t=target: self.request_background(t, "maintenance"),
+                    self.config)
+        # Background checks for commits pushed by other machines
+        self.remote_pollers = {}
+        for target in self.targets:
+            if target.repo_dir not in self.remote_pollers:
+                self.remote_pollers[target.repo_dir] = RemotePoller(
+                    target.engine,
+                    lambda t=target: self.scheduler_for(t).request(t.db_file, "remote", settle=False),
+                    self.config, log=self.log)
+        # git learns which files changed from our own watcher instead of stat()ing the tree
+        self.fsmonitors = {}
+        if self.config['sync']['engine'] == 'builtin':
+            for target in self.targets:
+                if target.repo_dir not in self.fsmonitors:
+                    self.fsmonitors[target.repo_dir] = create_fsmonitor(self.config, target.engine)
+                target.engine.fsmonitor = self.fsmonitors[target.repo_dir]
+            self.fsmonitors = {repo_dir: fsmonitor for repo_dir, fsmonitor in self.fsmonitors.items()
+                               if fsmonitor is not None}
+        self._icon_lock = threading.Lock()
+        
+        # Per-phase sync timings, optionally exported for Prometheus
+        self.metrics = SyncMetrics()
+        self.metrics.gauge("keepass_sync_poll_interval_seconds", "Current interval of the polling watcher.",
+                           lambda: self.watcher.interval if isinstance(self.watcher, PollingWatcher) else None)
+        self.metrics.gauge("keepass_sync_polls_per_minute", "Effective poll rate of the polling watcher.",
+                           lambda: self.watcher.poll_rate() if isinstance(self.watcher, PollingWatcher) else None)
+        self.metrics_server = None
+        metrics_port = self.config['metrics']['port']
+        if metrics_port:
+            try:
+                self.metrics_server = self.metrics.serve(metrics_port)
+            except OSError as e:
+                print(f"Could not serve metrics on port {metrics_port}: {e}")
         
         # Debug output for troubleshooting
         print(f"Base directory: {self.base_dir}")
-        print(f"Database file: {self.db_file}")
+        print(f"Sync engine: {self.config['sync']['engine']}")
         print(f"Sync script: {self.sync_script}")
-        print(f"DB file exists: {self.db_file.exists()}")
         print(f"Sync script exists: {self.sync_script.exists()}")
+        for target in self.targets:
+            print(f"Database file: {target.db_file} (exists: {target.db_file.exists()})")
+            print(f"  Repository: {target.repo_dir}")
         
-        # Create icon
+        # Create icon (none in headless mode)
         self.icon = None
-        self.create_icon()
+        if not self.headless:
+            self.create_icon()
     
     def load_config(self, config_file=None):
-        """Load configuration from JSON file with defaults"""
-        default_config = {
-            "database": {
-                "filename": "Passwords.kdbx",
-                "monitor_interval": 2
-            },
-            "git": {
-                "auto_pull": True,
-                "auto_push": True,
-                "commit_message_format": "Update from {hostname} at {timestamp}"
-            },
-            "notifications": {
-                "enabled": True,
-                "timeout": 3
-            },
-            "sync": {
-                "timeout": 30
-            }
-        }
-        
+        """Load configuration from JSON file with defaults; raises ConfigError
+        for an invalid file rather than silently running on the defaults"""
         if config_file is None:
             config_file = self.base_dir / "config.json"
         else:
             config_file = Path(config_file)
         
+        self.config_file = config_file
+        self._config_stamp = self.config_stamp()
+        
         if config_file.exists():
             try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    user_config = json.load(f)
-                # Merge user config with defaults
-                config = default_config.copy()
-                config.update(user_config)
-                print(f"Loaded configuration from {config_file}")
-                return config
-            except Exception as e:
-                print(f"Error loading config file {config_file}: {e}")
-                print("Using default configuration")
+                config = load_config_file(config_file)
+            except (ConfigError, OSError) as e:
+                raise ConfigError(f"Error in config file {config_file}: {e}") from None
+            print(f"Loaded configuration from {config_file}")
+            return config
         else:
             print(f"Config file {config_file} not found, using defaults")
             print(f"You can create {config_file} to customize settings")
         
-        return default_config
+        return load_default_config()
+    
+    def config_stamp(self):
+        """Identifies the current version of the config file on disk"""
+        return file_signature(self.config_file)
+    
+    def reload_config(self):
+        """Re-read the config file after it changed and apply it without a restart.
+        
+        The sections are replaced inside the existing config dict, which the
+        engines, pollers and maintenance read on every use; the few values the
+        schedulers, push queues and watcher copy are pushed to them here. An
+        invalid file is reported and the running configuration is kept.
+        """
+        stamp = self.config_stamp()
+        if stamp is None or stamp == self._config_stamp:
+            return
+        self._config_stamp = stamp
+        try:
+            config = load_config_file(self.config_file)
+        except (ConfigError, OSError) as e:
+            self.log.error(f"Config not reloaded, keeping current settings: {e}")
+            self.notify("KeePass Sync Config Error", str(e), urgency='critical')
+            return
+        
+        changed = changed_settings(self.config, config)
+        if not changed:
+            return
+        for key in list(self.config):
+            if key not in config:
+                del self.config[key]
+        self.config.update(config)
+        self.apply_config()
+        self.log.info(f"Reloaded configuration: {', '.join(changed)}")
+        restart = [name for name in changed if name.startswith(RESTART_SETTINGS)]
+        if restart:
+            self.log.warning(f"Restart to apply: {', '.join(restart)}")
+    
+    def apply_config(self):
+        """Hand the current settings to the objects that keep their own copy"""
+        sync = self.config['sync']
+        for scheduler in self.schedulers.values():
+            scheduler.settle_time = sync['settle_time']
+            scheduler.max_settle_wait = sync['max_settle_wait']
+        git = self.config['git']
+        for queue in self.push_queues.values():
+            queue.window = git['push_window']
+            queue.retry_base = git['push_retry_base']
+            queue.retry_max = git['push_retry_max']
+        if isinstance(self.watcher, PollingWatcher):
+            self.watcher.min_interval = self.config['database']['monitor_interval']
+            self.watcher.max_interval = self.config['database']['poll_max_interval']
+            self.watcher.interval = self.watcher.min_interval
+    
+    def load_targets(self):
+        """Build the list of databases to sync from the configuration.
+        
+        "databases" is an optional list of {"filename", "repo", "name"} entries;
+        without it the single database.filename in the base directory is used.
+        """
+        targets = []
+        for name, repo_dir, db_file in database_entries(self.config, self.base_dir):
+            targets.append(DatabaseTarget(name, repo_dir, db_file, self.config))
+        # A merge resolves conflicts on every database of the repository at once
+        for target in targets:
+            target.engine.databases = [t.db_file for t in targets if t.repo_dir == target.repo_dir]
+        return targets
+    
+    def open_journal(self):
+        """Open the sync history and restore the sync counters from it"""
+        history_file = self.config['history']['file']
+        if not history_file:
+            return None
+        import sqlite3
+        path = self.base_dir / history_file
+        try:
+            journal = SyncJournal(path, self.config)
+            conn = SyncJournal.connect(path)
+            try:
+                totals = SyncJournal.totals(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Sync history {path} unavailable: {e}")
+            return None
+        for target in self.targets:
+            if target.name in totals:
+                count, last = totals[target.name]
+                target.sync_count = count
+                target.last_sync_time = datetime.fromtimestamp(last)
+        return journal
+    
+    def release_instance_locks(self):
+        """Let other instances sync these repositories again"""
+        for lock in self.instance_locks:
+            lock.release()
+        self.instance_locks = []
+    
+    def start_control_server(self):
+        """Serve --sync-now, --status, --pause and --resume from the command line"""
+        server = ControlServer(control_address(self.targets[0].engine), self.handle_control)
+        try:
+            server.start()
+            for lock in self.instance_locks:
+                lock.publish(server.address, server.authkey)
+        except OSError as e:
+            server.close()
+            print(f"Control endpoint unavailable: {e}")
+            return
+        self.control_server = server
+    
+    def handle_control(self, request):
+        """Run one command received on the control endpoint"""
+        command = request.get('command')
+        if command == 'sync-now':
+            self.sync_now()
+            return {"ok": True, "message": f"Sync queued for {len(self.targets)} database(s)"}
+        if command == 'status':
+            return {"ok": True, "running": self.is_running, "message": self.status_text(self.targets)}
+        if command == 'pause':
+            if not self.is_running:
+                return {"ok": True, "message": "Sync is already paused"}
+            self.stop_sync()
+            return {"ok": True, "message": "Sync paused"}
+        if command == 'resume':
+            if self.is_running:
+                return {"ok": True, "message": "Sync is already running"}
+            self.start_sync()
+            return {"ok": True, "message": "Sync resumed"}
+        return {"ok": False, "message": f"Unknown command: {command}"}
+    
+    def request_background(self, target, source):
+        """Queue a push or maintenance run from its timer. Dropped while sync
+        is stopped, also when a sync still running re-armed the timer after
+        stop_sync; start_sync arms the timers again."""
+        if self.is_running:
+            self.scheduler_for(target).request(target.db_file, source, settle=False)
+    
+    def scheduler_for(self, target):
+        """The scheduler that serializes syncs of the target's repository"""
+        return self.schedulers[target.repo_dir]
+    
+    def push_queue_for(self, target):
+        """The queue of commits waiting to be pushed from the target's repository"""
+        return self.push_queues[target.repo_dir]
+    
+    def maintenance_for(self, target):
+        """The maintenance scheduler of the target's repository"""
+        return self.maintenance[target.repo_dir]
+    
+    def remote_poller_for(self, target):
+        """The remote change poller of the target's repository"""
+        return self.remote_pollers[target.repo_dir]
+    
+    def pending_push_count(self):
+        """Local commits waiting to be pushed, over all repositories"""
+        return sum(queue.pending_count for queue in self.push_queues.values())
+    
+    # Overlay colors for the PNG icon and (background, key) colors for the drawn fallback
+    ICON_STATES = {
+        "syncing": ((255, 193, 7, 128), (255, 193, 7, 255), (255, 152, 0, 255)),    # Yellow
+        "running": ((76, 175, 80, 96), (76, 175, 80, 255), (56, 142, 60, 255)),     # Green
+        "stopped": ((158, 158, 158, 128), (158, 158, 158, 255), (97, 97, 97, 255)),  # Gray
+        "error": ((244, 67, 54, 128), (244, 67, 54, 255), (183, 28, 28, 255)),      # Red
+        "offline": ((96, 125, 139, 128), (96, 125, 139, 255), (55, 71, 79, 255)),   # Blue gray
+    }
+    
+    def load_base_icon(self):
+        """Load and resize keepass_icon.png once; None if it is not available"""
+        if self._base_icon is False:
+            from PIL import Image
+            try:
+                image = Image.open(self.base_dir / "keepass_icon.png")
+                # Resize to 64x64 for tray icon
+                self._base_icon = image.resize((64, 64), Image.Resampling.LANCZOS).convert('RGBA')
+            except Exception:
+                self._base_icon = None
+        return self._base_icon
+    
+    def draw_fallback_icon(self, bg_color=(0, 119, 204, 255), key_color=(255, 193, 7, 255),
+                           teeth_color=(255, 235, 59, 255)):
+        """Draw the key icon used when keepass_icon.png is missing"""
+        from PIL import Image, ImageDraw
+        width = 64
+        height = 64
+        
+        # Create image with transparent background
+        image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        
+        # Draw background circle
+        padding = width // 16
+        draw.ellipse([padding, padding, width-padding, height-padding], 
+                    fill=bg_color)
+        
+        # Draw key
+        key_width = width // 3
+        key_height = height // 2
+        key_x = width // 2 - key_width // 2
+        key_y = height // 2 - key_height // 4
+        
+        # Key handle (circular part)
+        handle_size = key_width // 2
+        handle_x = key_x + key_width // 4
+        handle_y = key_y
+        draw.ellipse([handle_x, handle_y, 
+                     handle_x + handle_size, handle_y + handle_size],
+                    fill=key_color)
+        
+        # Key shaft
+        shaft_width = key_width // 2
+        shaft_height = key_height // 2
+        shaft_x = handle_x + handle_size // 4
+        shaft_y = handle_y + handle_size
+        draw.rectangle([shaft_x, shaft_y,
+                       shaft_x + shaft_width, shaft_y + shaft_height],
+                      fill=key_color)
+        
+        if teeth_color is None:
+            return image
+        
+        # Key handle hole
+        hole_size = handle_size // 2
+        hole_x = handle_x + handle_size // 4
+        hole_y = handle_y + handle_size // 4
+        draw.ellipse([hole_x, hole_y,
+                     hole_x + hole_size, hole_y + hole_size],
+                    fill=(0, 0, 0, 0))  # Transparent hole
+        
+        # Key teeth
+        teeth_width = shaft_width // 4
+        teeth_height = shaft_height // 4
+        for i in range(2):
+            tooth_x = shaft_x + shaft_width - teeth_width
+            tooth_y = shaft_y + shaft_height - (i+1) * teeth_height * 2
+            draw.rectangle([tooth_x, tooth_y,
+                          tooth_x + teeth_width, tooth_y + teeth_height],
+                         fill=teeth_color)
+        return image
+    
+    def render_icon(self, state):
+        """Return the tray image for a state, rendering it only the first time"""
+        image = self._icon_cache.get(state)
+        if image is not None:
+            return image
+        
+        base_icon = self.load_base_icon()
+        if state == "default":
+            image = base_icon if base_icon is not None else self.draw_fallback_icon()
+        else:
+            overlay_color, bg_color, key_color = self.ICON_STATES[state]
+            if base_icon is not None:
+                from PIL import Image
+                # Apply color overlay
+                overlay = Image.new('RGBA', (64, 64), overlay_color)
+                image = Image.alpha_composite(base_icon, overlay)
+            else:
+                # Fallback to simple colored icons
+                image = self.draw_fallback_icon(bg_color, key_color, teeth_color=None)
+        
+        self._icon_cache[state] = image
+        return image
     
     def create_icon(self):
         """Create system tray icon"""
-        # Try to load the icon file, fall back to generated icon if not found
-        try:
-            # Load the created icon
-            image = Image.open(self.base_dir / "keepass_icon.png")
-            # Resize to 64x64 for tray icon
-            image = image.resize((64, 64), Image.Resampling.LANCZOS)
-        except Exception:
-            # Fallback to generated icon
-            width = 64
-            height = 64
-            
-            # Create image with transparent background
-            image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(image)
-            
-            # Define colors
-            bg_color = (0, 119, 204, 255)  # KeePass blue
-            key_color = (255, 193, 7, 255)  # Golden yellow for key
-            teeth_color = (255, 235, 59, 255)  # Lighter yellow for key teeth
-            
-            # Draw background circle
-            padding = width // 16
-            draw.ellipse([padding, padding, width-padding, height-padding], 
-                        fill=bg_color)
-            
-            # Draw key
-            key_width = width // 3
-            key_height = height // 2
-            key_x = width // 2 - key_width // 2
-            key_y = height // 2 - key_height // 4
-            
-            # Key handle (circular part)
-            handle_size = key_width // 2
-            handle_x = key_x + key_width // 4
-            handle_y = key_y
-            draw.ellipse([handle_x, handle_y, 
-                         handle_x + handle_size, handle_y + handle_size],
-                        fill=key_color)
-            
-            # Key handle hole
-            hole_size = handle_size // 2
-            hole_x = handle_x + handle_size // 4
-            hole_y = handle_y + handle_size // 4
-            draw.ellipse([hole_x, hole_y,
-                         hole_x + hole_size, hole_y + hole_size],
-                        fill=(0, 0, 0, 0))  # Transparent hole
-            
-            # Key shaft
-            shaft_width = key_width // 2
-            shaft_height = key_height // 2
-            shaft_x = handle_x + handle_size // 4
-            shaft_y = handle_y + handle_size
-            draw.rectangle([shaft_x, shaft_y,
-                           shaft_x + shaft_width, shaft_y + shaft_height],
-                          fill=key_color)
-            
-            # Key teeth
-            teeth_width = shaft_width // 4
-            teeth_height = shaft_height // 4
-            for i in range(2):
-                tooth_x = shaft_x + shaft_width - teeth_width
-                tooth_y = shaft_y + shaft_height - (i+1) * teeth_height * 2
-                draw.rectangle([tooth_x, tooth_y,
-                              tooth_x + teeth_width, tooth_y + teeth_height],
-                             fill=teeth_color)
-        
-        menu = pystray.Menu(
+        import pystray
+        self._base_icon = False  # not loaded yet
+        self._icon_cache = {}
+        self._icon_state = "default"
+        image = self.render_icon("default")
+        
+        menu_items = [
             pystray.MenuItem("KeePass Auto-Sync", self.show_status, default=True),
             pystray.Menu.SEPARATOR,
             pystray.MenuItem("Start Sync", self.start_sync, visible=lambda item: not self.is_running),
             pystray.MenuItem("Stop Sync", self.stop_sync, visible=lambda item: self.is_running),
             pystray.MenuItem("Sync Now", self.sync_now, visible=lambda item: self.is_running),
+            pystray.MenuItem(lambda item: f"{self.pending_push_count()} commit(s) waiting to be pushed", None,
+                             enabled=False, visible=lambda item: self.pending_push_count() > 0),
             pystray.Menu.SEPARATOR,
+        ]
+        if len(self.targets) > 1:
+            # Per-database entries when several databases are managed
+            for target in self.targets:
+                menu_items.append(pystray.MenuItem(target.name, pystray.Menu(
+                    pystray.MenuItem("Sync Now", self.target_action(self.request_manual_sync, target),
+                                     visible=lambda item: self.is_running),
+                    pystray.MenuItem("Status", self.target_action(self.show_targets_status, target)),
+                    pystray.MenuItem("Last Sync", self.target_action(self.show_targets_last_sync, target)),
+                )))
+            menu_items.append(pystray.Menu.SEPARATOR)
+        menu_items += [
             pystray.MenuItem("Status", self.show_status),
             pystray.MenuItem("Last Sync", self.show_last_sync),
+            pystray.MenuItem("Recent Activity", pystray.Menu(self.recent_activity_items)),
             pystray.Menu.SEPARATOR,
             pystray.MenuItem("Exit", self.quit_app)
-        )
+        ]
+        menu = pystray.Menu(*menu_items)
         
         self.icon = pystray.Icon("keepass-sync", image, "KeePass Auto-Sync", menu)
+        # Render the remaining states up front so no image work happens during a sync
+        for state in self.ICON_STATES:
+            self.render_icon(state)
     
-    def update_icon_color(self, syncing=False):
-        """Update icon color based on sync status"""
-        try:
-            # Load the base icon and apply color overlay
-            base_icon = Image.open(self.base_dir / "keepass_icon.png")
-            base_icon = base_icon.resize((64, 64), Image.Resampling.LANCZOS)
-            
-            # Create colored overlay
-            if syncing:
-                overlay_color = (255, 193, 7, 128)  # Semi-transparent yellow
-            elif self.is_running:
-                overlay_color = (76, 175, 80, 96)   # Semi-transparent green
-            else:
-                overlay_color = (158, 158, 158, 128)  # Semi-transparent gray
-            
-            # Apply color overlay
-            overlay = Image.new('RGBA', (64, 64), overlay_color)
-            image = Image.alpha_composite(base_icon.convert('RGBA'), overlay)
-            
-        except Exception:
-            # Fallback to simple colored icons
-            width = 64
-            height = 64
-            
-            if syncing:
-                bg_color = (255, 193, 7, 255)  # Yellow
-                key_color = (255, 152, 0, 255)  # Orange
-            elif self.is_running:
-                bg_color = (76, 175, 80, 255)   # Green
-                key_color = (56, 142, 60, 255)  # Dark green
-            else:
-                bg_color = (158, 158, 158, 255)  # Gray
-                key_color = (97, 97, 97, 255)   # Dark gray
-            
-            # Create image with transparent background
-            image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(image)
-            
-            # Draw background circle
-            padding = width // 16
-            draw.ellipse([padding, padding, width-padding, height-padding], 
-                        fill=bg_color)
-            
-            # Draw simple key shape
-            key_width = width // 3
-            key_height = height // 2
-            key_x = width // 2 - key_width // 2
-            key_y = height // 2 - key_height // 4
-            
-            # Key handle
-            handle_size = key_width // 2
-            handle_x = key_x + key_width // 4
-            handle_y = key_y
-            draw.ellipse([handle_x, handle_y, 
-                         handle_x + handle_size, handle_y + handle_size],
-                        fill=key_color)
-            
-            # Key shaft
-            shaft_width = key_width // 2
-            shaft_height = key_height // 2
-            shaft_x = handle_x + handle_size // 4
-            shaft_y = handle_y + handle_size
-            draw.rectangle([shaft_x, shaft_y,
-                           shaft_x + shaft_width, shaft_y + shaft_height],
-                          fill=key_color)
+    def recent_activity_items(self):
+        """Menu entries for the newest sync log records, rebuilt each time the menu opens"""
+        import pystray
+        records = self.log.recent(15)
+        if not records:
+            return [pystray.MenuItem("No activity yet", None, enabled=False)]
+        items = []
+        for record in records:
+            text = SyncLog.format(record, with_time=True)
+            if len(text) > 90:
+                text = text[:87] + "..."
+            items.append(pystray.MenuItem(text, None, enabled=False))
+        return items
+    
+    def target_action(self, method, target):
+        """Bind a menu callback to one database"""
+        return lambda icon, item: method([target])
+    
+    def update_icon_color(self):
+        """Update icon color based on the sync status of all databases"""
+        if self.icon is None:
+            return
+        problems = [target.sync_problem for target in self.targets if target.sync_problem]
+        if any(target.syncing for target in self.targets):
+            state = "syncing"
+        elif not self.is_running:
+            state = "stopped"
+        elif problems:
+            state = "error" if "error" in problems else "offline"
+        else:
+            state = "running"
         
-        self.icon.icon = image
+        pending = self.pending_push_count()
+        title = f"KeePass Auto-Sync ({pending} commit(s) waiting to be pushed)" if pending else "KeePass Auto-Sync"
+        
+        # Only swap the tray image and tooltip when they actually change
+        with self._icon_lock:
+            if title != self.icon.title:
+                self.icon.title = title
+            if state == self._icon_state:
+                return
+            self._icon_state = state
+            self.icon.icon = self.render_icon(state)
     
     def start_sync(self, icon=None, item=None):
         """Start the auto-sync monitoring"""
@@ -261,6 +3233,12 @@ class KeePassSyncTray:
             self.is_running = True
             self.sync_thread = threading.Thread(target=self.monitor_loop, daemon=True)
             self.sync_thread.start()
+            for queue in self.push_queues.values():
+                queue.resume()
+            for maintenance in self.maintenance.values():
+                maintenance.arm()
+            for poller in self.remote_pollers.values():
+                poller.start()
             self.update_icon_color()
             self.notify("KeePass Auto-Sync", "Monitoring started")
     
@@ -268,141 +3246,634 @@ class KeePassSyncTray:
         """Stop the auto-sync monitoring"""
         if self.is_running:
             self.is_running = False
+            if self.watcher:
+                self.watcher.stop()
+            # Pending pushes stay on disk; start_sync re-arms them and the maintenance timers
+            for queue in self.push_queues.values():
+                queue.cancel()
+            for maintenance in self.maintenance.values():
+                maintenance.cancel()
+            for poller in self.remote_pollers.values():
+                poller.cancel()
             if self.sync_thread:
                 self.sync_thread.join(timeout=3)
+                if self.sync_thread.is_alive():
+                    print("Monitor thread did not stop within 3s")
             self.update_icon_color()
             self.notify("KeePass Auto-Sync", "Monitoring stopped")
     
     def sync_now(self, icon=None, item=None):
         """Perform immediate sync"""
-        threading.Thread(target=self.perform_sync, daemon=True).start()
+        self.request_manual_sync(self.targets)
+    
+    def request_manual_sync(self, targets):
+        """Queue an immediate sync of the given databases"""
+        for target in targets:
+            self.scheduler_for(target).request(target.db_file, "manual", settle=False)
     
     def monitor_loop(self):
-        """Main monitoring loop"""
+        """Main monitoring loop shared by all databases"""
         print(f"Starting KeePass database monitoring...")
-        self.last_mtime = self.get_file_mtime()
+        by_path = {target.db_file.absolute(): target for target in self.targets}
+        watched = list(by_path)
+        # Edits to the config file are picked up by the same watcher
+        config_path = self.config_file.absolute()
+        if self._config_stamp is not None:
+            watched.append(config_path)
+        self.watcher = create_watcher(self.config, watched)
+        print(f"Watching {len(by_path)} database(s) using {self.watcher.name} backend")
+        for target in self.targets:
+            target.last_signature = file_signature(target.db_file)
+            # Catch up on saves made while the app was not running
+            self.scheduler_for(target).request(target.db_file, "startup", settle=False)
         
-        while self.is_running:
-            try:
-                current_mtime = self.get_file_mtime()
-                
-                if current_mtime and current_mtime != self.last_mtime:
-                    print(f"Change detected in {self.db_file.name}")
-                    self.perform_sync()
-                    self.last_mtime = current_mtime
-                
-                time.sleep(self.config['database']['monitor_interval'])  # Check interval from config
-                
-            except KeyboardInterrupt:
-                break
-            except Exception as e:
-                print(f"Error in monitor loop: {e}")
-                time.sleep(5)
-    
-    def get_file_mtime(self):
-        """Get file modification time"""
+        error_delay = 0.1
+        errors = 0
         try:
-            if self.db_file.exists():
-                return self.db_file.stat().st_mtime
-        except Exception as e:
-            print(f"Error checking file: {e}")
-        return None
+            while self.is_running:
+                try:
+                    # Blocks until the watcher reports a change (or one poll interval for the fallback)
+                    changed = self.watcher.wait()
+                    
+                    for path in changed:
+                        path = Path(path).absolute()
+                        if path == config_path:
+                            self.reload_config()
+                            continue
+                        target = by_path.get(path)
+                        if target is None:
+                            continue
+                        current = file_signature(target.db_file)
+                        
+                        if target.updating:
+                            # Written by git during a remote update, not by the user
+                            target.last_signature = current
+                            continue
+                        if current is not None and current != target.last_signature:
+                            print(f"Change detected in {target.db_file.name}")
+                            target.last_signature = current
+                            if target.detected_at is None:
+                                target.detected_at = time.monotonic()
+                            self.remote_poller_for(target).activity()
+                            self.scheduler_for(target).request(target.db_file, "change")
+                    
+                    error_delay = 0.1
+                    errors = 0
+                except KeyboardInterrupt:
+                    break
+                except Exception as e:
+                    # Back off on repeated errors (e.g. a share that went away), recover fast otherwise
+                    print(f"Error in monitor loop: {e}")
+                    errors += 1
+                    if errors >= self.WATCHER_MAX_ERRORS and not isinstance(self.watcher, PollingWatcher):
+                        self.log.warning(f"The {self.watcher.name} watcher failed {errors} times in a row, "
+                                         f"switching to polling")
+                        self.watcher.close()
+                        self.watcher = create_watcher(self.config, watched, "poll")
+                        errors = 0
+                        continue
+                    time.sleep(error_delay)
+                    error_delay = min(error_delay * 2, 5)
+        finally:
+            self.watcher.close()
+    
+    def sync_pending(self, pending):
+        """Scheduler callback: sync every database with queued requests"""
+        by_path = {target.db_file: target for target in self.targets}
+        for path, sources in pending.items():
+            self.perform_sync(by_path[path], sources)
     
-    def perform_sync(self):
-        """Execute the sync script"""
+    def perform_sync(self, target, sources=("manual",)):
+        """Run one sync of a database using the configured engine.
+        
+        Change triggers only commit locally and queue a push; queued "push"
+        runs and Sync Now talk to the remote.
+        """
+        label = f" ({target.name})" if len(self.targets) > 1 else ""
+        if set(sources) == {"maintenance"}:
+            self.run_maintenance(target)
+            return
+        if set(sources) <= {"maintenance", "remote"}:
+            self.run_remote_update(target)
+            return
+        # Other runs commit and, when publishing, pull anyway
+        sources = [source for source in sources if source not in ("maintenance", "remote")]
+        manual = "manual" in sources
+        publish = manual or "push" in sources
+        result = SyncResult()
+        started = time.monotonic()
+        if target.detected_at is not None:
+            # Time from the first detected save until this run picked it up
+            result.phases["detection"] = started - target.detected_at
+            target.detected_at = None
+        outcome = None
         try:
-            # Update icon to show syncing
-            self.update_icon_color(syncing=True)
+            commit = manual or (any(source != "push" for source in sources) and target.fingerprint.needs_sync())
+            if commit and self.config['sync']['verify_database'] and target.db_file.exists():
+                # Never commit a file that KeePass or a cloud client is still writing
+                checked = time.monotonic()
+                problem = check_kdbx(target.db_file)
+                result.phases["check"] = time.monotonic() - checked
+                if problem:
+                    self.log.warning(f"{target.db_file.name} is not a complete KDBX database ({problem}), "
+                                     f"sync postponed until it is written completely", database=target.name,
+                                     phase="check")
+                    if manual:
+                        self.notify("KeePass Sync", f"Sync postponed{label}: {target.db_file.name} is incomplete "
+                                    f"({problem})", urgency='error')
+                    if not publish or self.config['sync']['engine'] == 'script':
+                        outcome = "postponed"
+                        return
+                    commit = False  # still push what was committed before
+            if not commit and not publish:
+                self.log.info("Content unchanged since last sync, skipping", database=target.name)
+                outcome = "skipped"
+                return
             
-            print("Executing sync script...")
-            print(f"Command: {self.shell_cmd + [str(self.sync_script)]}")
-            print(f"Working directory: {self.base_dir}")
-            print(f"Script exists: {self.sync_script.exists()}")
-            
-            result = subprocess.run(
-                self.shell_cmd + [str(self.sync_script)],
-                cwd=str(self.base_dir),
-                capture_output=True,
-                text=True,
-                timeout=self.config['sync']['timeout']
-            )
-            
-            print(f"Return code: {result.returncode}")
-            print(f"Stdout: {result.stdout}")
-            print(f"Stderr: {result.stderr}")
+            # Update icon to show syncing
+            target.syncing = True
+            self.update_icon_color()
             
-            if result.returncode == 0:
-                self.sync_count += 1
-                self.last_sync_time = datetime.now()
-                print("Sync completed successfully")
-                self.notify("KeePass Sync", "Database synchronized successfully")
+            target.sync_problem = None
+            if self.config['sync']['engine'] == 'script':
+                returncode = self.run_sync_script(target)
+                publish = True
             else:
-                print(f"Sync failed with return code {result.returncode}")
-                print(f"Error output: {result.stderr}")
-                self.notify("KeePass Sync Error", f"Sync failed (code {result.returncode}) - check console", urgency='critical')
+                returncode = self.run_sync_engine(target, commit, publish, result)
             
-            # Reset icon color
-            self.update_icon_color(syncing=False)
+            queue = self.push_queue_for(target)
+            outcome = "success" if returncode == 0 else "failure"
+            if returncode == 0:
+                target.fingerprint.record_synced(committed=result.committed)
+                target.sync_count += 1
+                target.last_sync_time = datetime.now()
+                if publish:
+                    self.log.info("Sync completed successfully", database=target.name,
+                                  duration=time.monotonic() - started, sha=result.commit_sha)
+                    self.notify("KeePass Sync", f"Database synchronized successfully{label}",
+                                key="synced", summary="{count} syncs completed")
+                else:
+                    self.log.info(f"Committed locally, {queue.pending_count} commit(s) waiting to be pushed",
+                                  database=target.name, duration=time.monotonic() - started,
+                                  sha=result.commit_sha)
+            else:
+                target.sync_problem = target.sync_problem or "error"
+                self.log.error(f"Sync failed with return code {returncode}", database=target.name,
+                               duration=time.monotonic() - started)
+                # Retried pushes only notify on the first failure of a streak
+                if queue.attempts <= 1:
+                    self.notify("KeePass Sync Error", f"Sync failed (code {returncode}){label} - check console", urgency='error')
             
+        except ProcessCancelled:
+            outcome = "cancelled"
+            self.log.warning("Sync cancelled at shutdown", database=target.name,
+                             duration=time.monotonic() - started)
         except subprocess.TimeoutExpired:
-            print("Sync script timed out")
-            self.notify("KeePass Sync Error", "Sync timed out", urgency='critical')
-            self.update_icon_color(syncing=False)
+            outcome = "timeout"
+            self.log.error("Sync timed out", database=target.name, duration=time.monotonic() - started)
+            target.sync_problem = "offline"
+            if self.push_queue_for(target).attempts <= 1:
+                self.notify("KeePass Sync Error", f"Sync timed out{label}", urgency='error')
         except Exception as e:
-            print(f"Error during sync: {e}")
-            self.notify("KeePass Sync Error", f"Error: {e}", urgency='critical')
-            self.update_icon_color(syncing=False)
+            outcome = "error"
+            self.log.error(f"Error during sync: {e}", database=target.name)
+            target.sync_problem = "error"
+            self.notify("KeePass Sync Error", f"Error{label}: {e}", urgency='error')
+        finally:
+            if outcome is not None:
+                result.phases["total"] = time.monotonic() - started
+                self.record_metrics(target, outcome, result)
+                if self.journal is not None:
+                    self.journal.record(target.name, sources, outcome, result)
+            # Reset icon color
+            target.syncing = False
+            self.update_icon_color()
+            # Maintenance waits until the repository has been idle for a while
+            self.maintenance_for(target).arm()
+    
+    def run_maintenance(self, target):
+        """Run gc (and history compaction, if enabled) when it is due"""
+        maintenance = self.maintenance_for(target)
+        if not maintenance.due():
+            return
+        self.log.info(f"Running repository maintenance in {target.repo_dir}", database=target.name,
+                      phase="maintenance")
+        started = time.monotonic()
+        try:
+            report = maintenance.run()
+        except GitCommandError as e:
+            self.log.error(f"Repository maintenance failed: {e}", database=target.name, phase=e.phase)
+            self.log.debug(e.output, database=target.name, phase=e.phase)
+            return
+        except subprocess.TimeoutExpired:
+            self.log.error("Repository maintenance timed out", database=target.name, phase="maintenance")
+            return
+        before, after = report['before'], report['after']
+        self.log.info(f"Repository size: {format_size(before['loose'] + before['packs'])} -> "
+                      f"{format_size(after['loose'] + after['packs'])} "
+                      f"(packs {format_size(before['packs'])} -> {format_size(after['packs'])})",
+                      database=target.name, phase="maintenance", duration=time.monotonic() - started)
+    
+    def run_remote_update(self, target):
+        """Fast-forward to commits another machine pushed, unless the database
+        is open in KeePass or has a local change that still has to be committed"""
+        repo_targets = [t for t in self.targets if t.repo_dir == target.repo_dir]
+        busy = [t.name for t in repo_targets if database_in_use(t.db_file)]
+        if busy:
+            self.log.info(f"Remote has new commits; waiting until {', '.join(busy)} is closed",
+                          database=target.name, phase="remote")
+            return
+        if any(t.fingerprint.needs_sync() for t in repo_targets):
+            self.log.info("Remote has new commits; they are merged with the next local save",
+                          database=target.name, phase="remote")
+            return
+        started = time.monotonic()
+        for t in repo_targets:
+            t.updating = True
+        try:
+            result = target.engine.update()
+        except GitCommandError as e:
+            self.log.warning(f"Remote update failed: {e}", database=target.name, phase="remote")
+            self.log.debug(e.output, database=target.name, phase="remote")
+            return
+        except subprocess.TimeoutExpired:
+            self.log.warning("Remote update timed out", database=target.name, phase="remote")
+            return
+        finally:
+            for t in repo_targets:
+                t.last_signature = file_signature(t.db_file)
+                t.updating = False
+        for phase, output in result.log:
+            if output.strip():
+                self.log.debug(output.strip(), database=target.name, phase=phase)
+        if result.merge == "fast-forward":
+            for t in repo_targets:
+                t.fingerprint.record_synced()
+            self.log.info("Updated to the latest commits from the remote", database=target.name,
+                          phase="remote", duration=time.monotonic() - started)
+            self.notify("KeePass Sync", f"{target.db_file.name} updated with changes from another machine",
+                        key="remote-update", summary="{count} updates from other machines")
+    
+    def record_metrics(self, target, outcome, result):
+        """Add the timings of one sync run to the metrics and refresh the textfile"""
+        self.metrics.record(target.name, outcome, result.phases)
+        timings = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in result.phases.items())
+        self.log.debug(f"Sync timings ({outcome}): {timings}", database=target.name)
+        textfile = self.config['metrics']['textfile']
+        if textfile:
+            self.metrics.write_textfile(self.base_dir / textfile)
+    
+    def run_sync_engine(self, target, commit=True, publish=True, result=None):
+        """Sync with the built-in git pipeline, returning a process-style return code"""
+        label = f" ({target.name})" if len(self.targets) > 1 else ""
+        self.log.info(f"Syncing {target.engine.db_path} in {target.repo_dir}", database=target.name)
+        queue = self.push_queue_for(target)
+        result = result if result is not None else SyncResult()
+        try:
+            if commit:
+                target.engine.sync(publish=publish, result=result)
+            else:
+                target.engine.publish(result)
+        except GitCommandError as e:
+            self.log_phases(target, result)
+            self.log.error(str(e), database=target.name, phase=e.phase, duration=result.phases.get(e.phase))
+            self.log.debug(e.output, database=target.name, phase=e.phase)
+            if e.is_network_error:
+                target.sync_problem = "offline"
+            if e.phase == "conflict":
+                # Retrying cannot help: wait for the user, then for the next save or Sync Now
+                queue.hold()
+                self.notify("KeePass Sync Conflict", f"Cannot merge changes from another machine{label}: "
+                            f"{e.output.splitlines()[0]}. Resolve the merge in {target.repo_dir} and "
+                            f"use Sync Now", urgency='critical')
+            elif e.phase in ("pull", "merge", "push"):
+                queue.failed()
+            return e.returncode
+        except subprocess.TimeoutExpired:
+            self.log_phases(target, result)
+            if publish:
+                queue.failed()
+            raise
+        
+        self.log_phases(target, result)
+        for conflict_copy in result.conflict_copies:
+            self.log.warning(f"The database was also changed on another machine; both versions were kept, "
+                             f"the other one as {conflict_copy}", database=target.name, phase="merge")
+            self.notify("KeePass Sync Conflict",
+                        f"Both versions kept: open {Path(conflict_copy).name} in KeePass and use "
+                        f"File > Synchronize to merge it", urgency='critical')
+        if result.merge == "kdbx":
+            self.log.info("Merged entries changed on another machine into the database",
+                          database=target.name, phase="merge")
+            self.notify("KeePass Sync", f"Changes from another machine were merged{label}")
+        if publish:
+            queue.succeeded()
+        elif result.committed:
+            queue.committed()
+        return 0
+    
+    def log_phases(self, target, result):
+        """Log the git output of each phase that ran (to the log file) and its duration"""
+        for phase, output in result.log:
+            if output.strip():
+                self.log.debug(output.strip(), database=target.name, phase=phase)
+        for phase, seconds in result.phases.items():
+            if phase in ("detection", "total"):
+                continue
+            sha = result.commit_sha if phase == "commit" else None
+            self.log.info("done" if phase != "commit" or result.committed else "nothing to commit",
+                          database=target.name, phase=phase, duration=seconds, sha=sha)
+    
+    def run_sync_script(self, target):
+        """Sync by running the legacy sync-keepass.sh / sync-keepass.bat script.
+        
+        The repository, the database and its git settings are passed in the
+        environment: run by hand, the scripts read the config.json next to
+        them, which knows nothing of the other configured databases.
+        """
+        command = self.shell_cmd + [str(self.sync_script)]
+        git_config = self.config['git']
+        env = dict(os.environ,
+                   KEEPASS_SYNC_REPO=str(target.repo_dir),
+                   KEEPASS_SYNC_DB=target.engine.db_path,
+                   KEEPASS_SYNC_COMMIT_FORMAT=git_config['commit_message_format'],
+                   KEEPASS_SYNC_AUTO_PULL=str(git_config['auto_pull']).lower(),
+                   KEEPASS_SYNC_AUTO_PUSH=str(git_config['auto_push']).lower())
+        self.log.info(f"Executing sync script {self.sync_script} in {target.repo_dir}",
+                      database=target.name, phase="script")
+        
+        started = time.monotonic()
+        result = run_bounded(
+            command,
+            limit=self.config['log']['output_limit'],
+            cwd=str(target.repo_dir),
+            env=env,
+            timeout=self.config['sync']['timeout']
+        )
+        
+        for output in (result.stdout, result.stderr):
+            if output.strip():
+                self.log.debug(output.strip(), database=target.name, phase="script")
+        self.log.info(f"Sync script exited with code {result.returncode}", database=target.name,
+                      phase="script", duration=time.monotonic() - started)
+        return result.returncode
     
     def show_status(self, icon=None, item=None):
         """Show current status"""
+        self.show_targets_status(self.targets)
+    
+    def show_targets_status(self, targets):
+        """Show the status of the given databases"""
+        self.notify("KeePass Auto-Sync Status", self.status_text(targets))
+    
+    def status_text(self, targets):
+        """Status summary of the given databases"""
         status = "Running" if self.is_running else "Stopped"
-        msg = f"Status: {status}\nSync count: {self.sync_count}"
-        if self.last_sync_time:
-            msg += f"\nLast sync: {self.last_sync_time.strftime('%H:%M:%S')}"
-        self.notify("KeePass Auto-Sync Status", msg)
+        msg = f"Status: {status}"
+        for t in targets:
+            if len(targets) > 1:
+                msg += f"\n{t.name}: {t.sync_count} syncs"
+                if t.last_sync_time:
+                    msg += f", last at {t.last_sync_time.strftime('%H:%M:%S')}"
+            else:
+                msg += f"\nSync count: {t.sync_count}"
+                if t.last_sync_time:
+                    msg += f"\nLast sync: {t.last_sync_time.strftime('%H:%M:%S')}"
+        for repo_dir, maintenance in self.maintenance.items():
+            report = maintenance.last_report
+            if report and any(t.repo_dir == repo_dir for t in targets):
+                after = report['after']
+                msg += f"\nRepository size after maintenance: {format_size(after['loose'] + after['packs'])}"
+        pending = sum(queue.pending_count for repo_dir, queue in self.push_queues.items()
+                      if any(t.repo_dir == repo_dir for t in targets))
+        if pending:
+            msg += f"\n{pending} commit(s) waiting to be pushed"
+        for repo_dir, poller in self.remote_pollers.items():
+            if poller.interval and any(t.repo_dir == repo_dir for t in targets):
+                state = "unreachable, retrying" if poller.offline else "checked"
+                msg += f"\nRemote {state} every {poller.interval:.0f}s"
+        if isinstance(self.watcher, PollingWatcher) and self.is_running:
+            msg += f"\nPolling every {self.watcher.interval:g}s ({self.watcher.poll_rate():.1f} checks/min)"
+        timings = self.metrics.summary()
+        if timings:
+            msg += f"\nSync p50/p95: {timings}"
+        return msg
     
     def show_last_sync(self, icon=None, item=None):
         """Show last sync time"""
-        if self.last_sync_time:
-            time_ago = datetime.now() - self.last_sync_time
-            minutes = int(time_ago.total_seconds() / 60)
-            if minutes < 1:
-                msg = "Just now"
-            elif minutes == 1:
-                msg = "1 minute ago"
-            else:
-                msg = f"{minutes} minutes ago"
-            self.notify("Last Sync", f"{msg}\n{self.last_sync_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        else:
+        self.show_targets_last_sync(self.targets)
+    
+    def show_targets_last_sync(self, targets):
+        """Show the most recent sync among the given databases"""
+        synced = [t for t in targets if t.last_sync_time]
+        if not synced:
             self.notify("Last Sync", "No syncs yet")
+            return
+        latest = max(synced, key=lambda t: t.last_sync_time)
+        time_ago = datetime.now() - latest.last_sync_time
+        minutes = int(time_ago.total_seconds() / 60)
+        if minutes < 1:
+            msg = "Just now"
+        elif minutes == 1:
+            msg = "1 minute ago"
+        else:
+            msg = f"{minutes} minutes ago"
+        if len(self.targets) > 1:
+            msg += f" ({latest.name})"
+        self.notify("Last Sync", f"{msg}\n{latest.last_sync_time.strftime('%Y-%m-%d %H:%M:%S')}")
     
-    def notify(self, title, message, urgency='normal'):
-        """Show desktop notification"""
+    def notify(self, title, message, urgency='normal', key=None, summary=None):
+        """Queue a desktop notification (see NotificationDispatcher for urgency and key)"""
         if not self.config['notifications']['enabled']:
             return
-            
-        try:
-            notification.notify(
-                title=title,
-                message=message,
-                app_name='KeePass Sync',
-                timeout=self.config['notifications']['timeout']
-            )
-        except Exception as e:
-            print(f"Notification error: {e}")
+        self.notifications.post(title, message, urgency, key, summary)
+    
+    def show_notification(self, title, message):
+        """Show one desktop notification; runs on the dispatcher thread"""
+        if self.headless:
+            print(f"{title}: {message}")
+            return
+        
+        from plyer import notification
+        notification.notify(
+            title=title,
+            message=message,
+            app_name='KeePass Sync',
+            timeout=self.config['notifications']['timeout']
+        )
     
     def quit_app(self, icon=None, item=None):
         """Quit the application"""
         self.stop_sync()
-        self.icon.stop()
+        for queue in self.push_queues.values():
+            queue.cancel()
+        for maintenance in self.maintenance.values():
+            maintenance.cancel()
+        for poller in self.remote_pollers.values():
+            poller.cancel()
+        # In-flight syncs get until the deadline to finish; their git processes are killed after it
+        deadline = time.monotonic() + self.config['sync']['timeout']
+        for scheduler in self.schedulers.values():
+            scheduler.stop(timeout=max(0, deadline - time.monotonic()))
+        self.runtime.shutdown(timeout=max(0, deadline - time.monotonic()))
+        self.executor.shutdown(wait=False)
+        for fsmonitor in self.fsmonitors.values():
+            fsmonitor.close()
+        self.notifications.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        if self.control_server is not None:
+            self.control_server.close()
+        self.release_instance_locks()
+        self._shutdown.set()
+        if self.icon is not None:
+            self.icon.stop()
     
     def run(self):
         """Run the system tray application"""
+        self.start_control_server()
+        
         # Auto-start sync on launch
         self.start_sync()
         
+        if self.headless:
+            self.run_headless()
+            return
+        
         # Run the icon
         self.icon.run()
+    
+    def run_headless(self):
+        """Block until SIGINT/SIGTERM (or quit_app), then shut down cleanly"""
+        import signal
+        
+        def request_shutdown(signum, frame):
+            print(f"\nReceived signal {signum}, shutting down...")
+            self._shutdown.set()
+        
+        signal.signal(signal.SIGINT, request_shutdown)
+        signal.signal(signal.SIGTERM, request_shutdown)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, request_shutdown)
+        
+        # Wake up regularly so signals are handled promptly on every platform
+        while not self._shutdown.wait(1):
+            pass
+        self.quit_app()
+
+def application_dirs():
+    """(script_dir, base_dir): where the sync scripts and the databases live"""
+    # Handle both development and PyInstaller bundled execution
+    if getattr(sys, 'frozen', False):
+        # Running as PyInstaller bundle
+        # Scripts are bundled in temp dir, database stays in exe directory
+        return Path(sys._MEIPASS), Path(sys.executable).parent
+    # Running as Python script - everything in same directory
+    return Path(__file__).parent, Path(__file__).parent
+
+def database_entries(config, base_dir):
+    """(name, repo_dir, db_file) of every configured database.
+    
+    "databases" is an optional list of {"filename", "repo", "name"} entries;
+    without it the single database.filename in the base directory is used.
+    """
+    entries = config.get('databases') or [{"filename": config['database']['filename']}]
+    for entry in entries:
+        repo_dir = (base_dir / entry.get('repo', '.')).resolve()
+        db_file = repo_dir / entry['filename']
+        yield entry.get('name', db_file.stem), repo_dir, db_file
+
+def send_control_command(command, config_file=None):
+    """Send a command to the instance syncing the configured repositories.
+    
+    Only reads the config file and talks to the control endpoint, so it
+    returns in milliseconds and never loads the GUI stack. Returns the exit
+    code: 0 on success, 1 if the command failed or no instance is running.
+    """
+    _, base_dir = application_dirs()
+    config_file = Path(config_file) if config_file else base_dir / "config.json"
+    config = load_default_config()
+    if config_file.exists():
+        try:
+            config = load_config_file(config_file)
+        except (ConfigError, OSError) as e:
+            print(f"Error in config file {config_file}: {e}")
+            return 1
+    
+    from multiprocessing.connection import Client
+    for _, repo_dir, db_file in database_entries(config, base_dir):
+        lock = InstanceLock(GitSyncEngine(repo_dir, db_file, config))
+        endpoint = lock.endpoint()
+        if endpoint is None or not lock.held_elsewhere():
+            continue
+        address, authkey = endpoint
+        try:
+            with Client(address, control_family(), authkey=authkey) as conn:
+                conn.send_bytes(json.dumps({"command": command}).encode('utf-8'))
+                reply = json.loads(conn.recv_bytes())
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Could not reach the running instance: {e}")
+            return 1
+        print(reply.get('message', ''))
+        return 0 if reply.get('ok') else 1
+    print("No running KeePass Sync instance found")
+    return 1
+
+def show_history(config_file=None, limit=20, failures_only=False, per_day=False):
+    """Print the sync history without starting the application; returns the exit code"""
+    import sqlite3
+    _, base_dir = application_dirs()
+    config_file = Path(config_file) if config_file else base_dir / "config.json"
+    config = load_default_config()
+    if config_file.exists():
+        try:
+            config = load_config_file(config_file)
+        except (ConfigError, OSError) as e:
+            print(f"Error in config file {config_file}: {e}")
+            return 1
+    history_file = config['history']['file']
+    path = base_dir / history_file if history_file else None
+    if path is None or not path.exists():
+        print("No sync history recorded yet")
+        return 1
+    
+    try:
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, timeout=5)
+        try:
+            if per_day:
+                rows = SyncJournal.per_day(conn, limit)
+            else:
+                rows = SyncJournal.recent(conn, limit, failures_only)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Cannot read sync history {path}: {e}")
+        return 1
+    
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "-"
+    
+    if per_day:
+        print(f"{'Day':<10}  {'Runs':>5}  {'Failed':>6}  {'p50':>7}  {'p95':>7}  {'max':>7}  Pushed")
+        for day, runs, failures, p50, p95, slowest, pushed in rows:
+            print(f"{day:<10}  {runs:>5}  {failures:>6}  {seconds(p50):>7}  {seconds(p95):>7}  "
+                  f"{seconds(slowest):>7}  {format_size(pushed)}")
+        return 0
+    for when, database, sources, outcome, sha, pushed, duration, phases in rows:
+        line = (f"{datetime.fromtimestamp(when):%Y-%m-%d %H:%M:%S}  {database}  {outcome:<9}  "
+                f"{(sha or '-')[:7]:<7}  {seconds(duration):>7}  [{sources}]")
+        if pushed:
+            line += f"  pushed {format_size(pushed)}"
+        timings = ", ".join(f"{phase} {value:.2f}s" for phase, value in json.loads(phases).items()
+                            if phase != "total")
+        if timings:
+            line += f"  ({timings})"
+        print(line)
+    if not rows:
+        print("No failed syncs recorded" if failures_only else "No syncs recorded")
+    return 0
 
 def create_config_file():
     """Create a default config.json file"""
@@ -411,28 +3882,9 @@ def create_config_file():
         print(f"Configuration file {config_path} already exists!")
         return False
     
-    default_config = {
-        "database": {
-            "filename": "Passwords.kdbx",
-            "monitor_interval": 2
-        },
-        "git": {
-            "auto_pull": True,
-            "auto_push": True,
-            "commit_message_format": "Update from {hostname} at {timestamp}"
-        },
-        "notifications": {
-            "enabled": True,
-            "timeout": 3
-        },
-        "sync": {
-            "timeout": 30
-        }
-    }
-    
     try:
         with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, indent=4)
+            json.dump(DEFAULT_CONFIG, f, indent=4)
         print(f"✓ Created default configuration file: {config_path}")
         return True
     except Exception as e:
@@ -475,6 +3927,8 @@ def setup_directory():
         "KeePassSyncTray.exe",
         "KeePassSyncTray-Debug.exe",
         "keepass-sync-tray.py",
+        "benchmark-sync.py",
+        "stress-sync.py",
         "sync-keepass.sh",
         "sync-keepass.bat",
         "build-*.sh",
@@ -484,7 +3938,9 @@ def setup_directory():
         "__pycache__/",
         "*.py[cod]",
         "build/",
-        "dist/"
+        "dist/",
+        "keepass-sync.log*",
+        "keepass-sync-history.db*"
     ]
     
     try:
@@ -515,19 +3971,60 @@ def setup_directory():
     except Exception as e:
         print(f"✗ Error updating .gitignore: {e}")
     
-    # 4. Check for KeePass database
-    total_steps += 1
+    # The databases of config.json, or the default one
     config = load_default_config()
-    db_filename = config['database']['filename']
-    db_path = Path(db_filename)
+    config_path = Path('config.json')
+    if config_path.exists():
+        try:
+            config = load_config_file(config_path)
+        except (ConfigError, OSError) as e:
+            print(f"⚠ Error in config file {config_path}: {e}")
+            print(f"  Using the default database {config['database']['filename']}.")
+    databases = [(repo_dir, db_file) for _, repo_dir, db_file in database_entries(config, Path.cwd())]
     
-    if db_path.exists():
-        print(f"✓ Found KeePass database: {db_filename}")
+    # 4. Update .gitattributes so the encrypted databases are never delta-compressed
+    total_steps += 1
+    try:
+        for repo_dir in dict.fromkeys(repo_dir for repo_dir, _ in databases):
+            gitattributes_path = repo_dir / '.gitattributes'
+            # Patterns are relative to the repository; a space would end the pattern
+            patterns = [os.path.relpath(db_file, repo_dir).replace(os.sep, '/').replace(' ', '[[:space:]]')
+                        for db_repo, db_file in databases if db_repo == repo_dir]
+            existing_content = ""
+            if gitattributes_path.exists():
+                with open(gitattributes_path, 'r', encoding='utf-8') as f:
+                    existing_content = f.read()
+            
+            missing_entries = [f"{pattern} binary -delta" for pattern in patterns
+                               if f"{pattern} binary -delta" not in existing_content.splitlines()]
+            if missing_entries:
+                with open(gitattributes_path, 'a', encoding='utf-8') as f:
+                    if existing_content and not existing_content.endswith('\n'):
+                        f.write('\n')
+                    f.write('# KeePass databases are encrypted: skip delta compression and text diffs\n')
+                    for entry in missing_entries:
+                        f.write(f'{entry}\n')
+                print(f"✓ Updated {gitattributes_path} with {len(missing_entries)} new entries")
+            else:
+                print(f"✓ {gitattributes_path} already contains necessary entries")
         success_count += 1
-    else:
-        print(f"⚠ KeePass database not found: {db_filename}")
-        print(f"  Please copy your KeePass database file to this directory.")
+    except Exception as e:
+        print(f"✗ Error updating .gitattributes: {e}")
+    
+    # 5. Check for the KeePass databases
+    total_steps += 1
+    
+    missing_databases = [db_file for _, db_file in databases if not db_file.exists()]
+    for _, db_file in databases:
+        if db_file.exists():
+            print(f"✓ Found KeePass database: {db_file}")
+        else:
+            print(f"⚠ KeePass database not found: {db_file}")
+    if missing_databases:
+        print(f"  Please copy your KeePass database files into place.")
         print(f"  Or update the filename in config.json if it has a different name.")
+    else:
+        success_count += 1
     
     # Summary
     print()
@@ -542,26 +4039,205 @@ def setup_directory():
     else:
         print("⚠ Some setup steps need attention. Please review the messages above.")
 
+# Every setting and its default. config.json only needs the settings it
+# changes; the type of each default is the type the setting must have.
+DEFAULT_CONFIG = {
+    "database": {
+        "filename": "Passwords.kdbx",
+        "monitor_interval": 1,
+        "poll_max_interval": 15,
+        "watcher": "auto"
+    },
+    "git": {
+        "auto_pull": True,
+        "auto_push": True,
+        "commit_message_format": "Update from {hostname} at {timestamp}",
+        "push_window": 10,
+        "push_retry_base": 5,
+        "push_retry_max": 600,
+        "merge_strategy": "auto",
+        "merge_keyfile": "",
+        "merge_password_env": "KEEPASS_SYNC_PASSWORD",
+        "fsmonitor": True
+    },
+    "notifications": {
+        "enabled": True,
+        "timeout": 3,
+        "coalesce_window": 5,
+        "error_interval": 300,
+        "queue_size": 20
+    },
+    "sync": {
+        "timeout": 30,
+        "engine": "builtin",
+        "max_workers": 4,
+        "settle_time": 1.0,
+        "max_settle_wait": 30,
+        "verify_database": True
+    },
+    "maintenance": {
+        "enabled": True,
+        "idle_time": 600,
+        "interval_hours": 24,
+        "timeout": 600,
+        "compact_history": False,
+        "keep_all_days": 30
+    },
+    "remote_poll": {
+        "enabled": True,
+        "active_interval": 60,
+        "max_interval": 900,
+        "active_window": 600
+    },
+    "metrics": {
+        "port": 0,
+        "textfile": ""
+    },
+    "history": {
+        "file": "keepass-sync-history.db",
+        "flush_interval": 5
+    },
+    "log": {
+        "file": "keepass-sync.log",
+        "max_bytes": 1048576,
+        "backup_count": 3,
+        "buffer_size": 200,
+        "output_limit": 65536
+    }
+}
+
+# Settings limited to a fixed set of values
+CONFIG_CHOICES = {
+    "database.watcher": ("auto", "poll"),
+    "sync.engine": ("builtin", "script"),
+    "git.merge_strategy": ("auto", "keep-both"),
+}
+
+# Numeric settings that must be whole numbers; the others may be fractional
+CONFIG_INTEGERS = {
+    "sync.max_workers", "maintenance.keep_all_days", "metrics.port", "notifications.queue_size",
+    "log.max_bytes", "log.backup_count", "log.buffer_size", "log.output_limit",
+}
+
+# Numeric settings where 0 would stall or busy-loop the application
+CONFIG_POSITIVE = {
+    "database.monitor_interval", "database.poll_max_interval", "git.push_retry_base", "git.push_retry_max",
+    "sync.timeout", "sync.max_workers", "maintenance.timeout", "remote_poll.active_interval",
+    "remote_poll.max_interval", "notifications.queue_size", "log.buffer_size", "log.output_limit",
+}
+
+# Keys of the optional "databases" list entries
+DATABASE_ENTRY_KEYS = ("filename", "repo", "name")
+
+# Settings that are read once at startup; changing them needs a restart
+RESTART_SETTINGS = (
+    "databases", "database.filename", "database.watcher", "sync.max_workers",
+    "git.fsmonitor", "metrics.port", "history.file", "log.file", "log.max_bytes", "log.backup_count",
+    "log.buffer_size",
+)
+
+
+class ConfigError(ValueError):
+    """The configuration file is not valid JSON or has a setting of the wrong type"""
+
+
+def merge_config(defaults, user, prefix=""):
+    """Deep-merge user settings over the defaults, validating every value.
+    
+    Sections are merged key by key, so a config.json that only sets
+    git.auto_push keeps every other git default. Unknown keys are reported
+    and ignored; values of the wrong type raise ConfigError naming the setting.
+    """
+    if not isinstance(user, dict):
+        raise ConfigError(f"'{prefix.rstrip('.') or 'config'}' must be an object, got {json.dumps(user)}")
+    merged = copy.deepcopy(defaults)
+    for key, value in user.items():
+        name = f"{prefix}{key}"
+        if name == "databases":
+            merged[key] = validate_databases(value)
+            continue
+        if key not in defaults:
+            print(f"Warning: unknown setting '{name}' in config file, ignored")
+            continue
+        default = defaults[key]
+        if isinstance(default, dict):
+            merged[key] = merge_config(default, value, f"{name}.")
+            continue
+        
+        if isinstance(default, bool):
+            valid, expected = isinstance(value, bool), "true or false"
+        elif isinstance(default, (int, float)):
+            if name in CONFIG_INTEGERS:
+                valid, expected = isinstance(value, int), "a whole number"
+            else:
+                valid, expected = isinstance(value, (int, float)), "a number"
+            # bool is an int subclass, but "timeout": true is a mistake
+            valid = valid and not isinstance(value, bool)
+            if name in CONFIG_POSITIVE:
+                valid = valid and value > 0
+                expected += " of at least 1" if name in CONFIG_INTEGERS else " greater than 0"
+            else:
+                valid = valid and value >= 0
+                expected += " of at least 0"
+        else:
+            valid, expected = isinstance(value, str), "a string"
+        if not valid:
+            raise ConfigError(f"'{name}' must be {expected}, got {json.dumps(value)}")
+        
+        choices = CONFIG_CHOICES.get(name)
+        if choices and value not in choices:
+            raise ConfigError(f"'{name}' must be one of {', '.join(choices)}, got {json.dumps(value)}")
+        if name == "metrics.port" and value > 65535:
+            raise ConfigError(f"'{name}' must be a port number up to 65535, got {value}")
+        merged[key] = value
+    return merged
+
+
+def validate_databases(entries):
+    """Check the optional "databases" list of {"filename", "repo", "name"} entries"""
+    if not isinstance(entries, list):
+        raise ConfigError(f"'databases' must be a list, got {json.dumps(entries)}")
+    for index, entry in enumerate(entries):
+        name = f"databases[{index}]"
+        if not isinstance(entry, dict):
+            raise ConfigError(f"'{name}' must be an object, got {json.dumps(entry)}")
+        if 'filename' not in entry:
+            raise ConfigError(f"'{name}' needs a \"filename\"")
+        for key, value in entry.items():
+            if key not in DATABASE_ENTRY_KEYS:
+                print(f"Warning: unknown setting '{name}.{key}' in config file, ignored")
+            elif not isinstance(value, str) or not value:
+                raise ConfigError(f"'{name}.{key}' must be a non-empty string, got {json.dumps(value)}")
+    return copy.deepcopy(entries)
+
+
+def load_config_file(path):
+    """Read a config.json and merge it over DEFAULT_CONFIG"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        user_config = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"invalid JSON at line {e.lineno} column {e.colno}: {e.msg}") from None
+    return merge_config(DEFAULT_CONFIG, user_config)
+
+
+def changed_settings(old, new, prefix=""):
+    """Dotted names of the settings that differ between two configurations"""
+    changed = []
+    for key in sorted(set(old) | set(new)):
+        name = f"{prefix}{key}"
+        before, after = old.get(key), new.get(key)
+        if isinstance(before, dict) and isinstance(after, dict):
+            changed.extend(changed_settings(before, after, f"{name}."))
+        elif before != after:
+            changed.append(name)
+    return changed
+
+
 def load_default_config():
     """Load default configuration"""
-    return {
-        "database": {
-            "filename": "Passwords.kdbx",
-            "monitor_interval": 2
-        },
-        "git": {
-            "auto_pull": True,
-            "auto_push": True,
-            "commit_message_format": "Update from {hostname} at {timestamp}"
-        },
-        "notifications": {
-            "enabled": True,
-            "timeout": 3
-        },
-        "sync": {
-            "timeout": 30
-        }
-    }
+    return copy.deepcopy(DEFAULT_CONFIG)
 
 def main():
     """Main entry point"""
@@ -571,8 +4247,28 @@ def main():
     parser.add_argument('--config', type=str, help='Path to configuration file (default: config.json)')
     parser.add_argument('--create-config', action='store_true', help='Create a default config.json file')
     parser.add_argument('--setup', action='store_true', help='Setup the current directory for KeePass sync (create config, gitignore)')
+    parser.add_argument('--headless', action='store_true', help='Run without tray icon or desktop notifications (for servers)')
+    control = parser.add_mutually_exclusive_group()
+    control.add_argument('--sync-now', dest='command', action='store_const', const='sync-now',
+                         help='Ask the running instance to sync immediately')
+    control.add_argument('--status', dest='command', action='store_const', const='status',
+                         help='Print the status of the running instance')
+    control.add_argument('--pause', dest='command', action='store_const', const='pause',
+                         help='Pause monitoring in the running instance')
+    control.add_argument('--resume', dest='command', action='store_const', const='resume',
+                         help='Resume monitoring in the running instance')
+    parser.add_argument('--history', type=int, nargs='?', const=20, metavar='N',
+                        help='Show the last N sync attempts (default 20), or with --per-day the last N days')
+    parser.add_argument('--failures', action='store_true', help='With --history: only failed syncs')
+    parser.add_argument('--per-day', action='store_true', help='With --history: runs, failures and latency per day')
     args = parser.parse_args()
     
+    if args.history is not None:
+        sys.exit(show_history(args.config, args.history, args.failures, args.per_day))
+    
+    if args.command:
+        sys.exit(send_control_command(args.command, args.config))
+    
     if args.create_config:
         create_config_file()
         sys.exit(0)
@@ -581,12 +4277,29 @@ def main():
         setup_directory()
         sys.exit(0)
     
-    app = KeePassSyncTray(args.config)
+    try:
+        app = KeePassSyncTray(args.config, headless=args.headless)
+    except InstanceRunningError as e:
+        print(f"{e}; use --status, --sync-now, --pause or --resume to control it")
+        sys.exit(1)
+    except ConfigError as e:
+        print(f"{e}\nFix the file and start again; nothing is synced with a broken configuration.")
+        if not args.headless:
+            # Started from the desktop there may be no console to read the message
+            try:
+                from plyer import notification
+                notification.notify(title="KeePass Sync Config Error", message=str(e), app_name='KeePass Sync')
+            except Exception:
+                pass
+        sys.exit(1)
     
     print("KeePass Auto-Sync Tray Application")
     print("===================================")
-    print("The app is running in the system tray.")
-    print("Right-click the tray icon for options.")
+    if args.headless:
+        print("Running headless. Press Ctrl+C or send SIGTERM to stop.")
+    else:
+        print("The app is running in the system tray.")
+        print("Right-click the tray icon for options.")
     print()
     
     try:
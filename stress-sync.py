@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+KeePass Git Sync multi-host stress test
+
+Starts N instances of the application, each syncing its own clone of one
+shared local bare remote, and saves their databases in a randomized pattern
+at the same time. It measures how the fleet converges: the time until every
+machine has a save, how often pushes are rejected because another machine
+pushed first, how many push retries a save costs and how often two machines
+changed the database at once and had to merge.
+
+Every instance is a separate process running the real application (headless),
+so scheduling, push batching and retry settings can be compared objectively
+with --set on one machine and without network access:
+
+    python stress-sync.py --hosts 8 --duration 60 --set git.push_window=5
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import platform
+import tempfile
+import threading
+import subprocess
+import importlib.util
+from datetime import datetime
+from pathlib import Path
+
+
+def load_benchmark():
+    """Import benchmark-sync.py for its repository and synthetic database helpers"""
+    script = Path(__file__).resolve().with_name("benchmark-sync.py")
+    spec = importlib.util.spec_from_file_location("benchmark_sync", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_head(git_dir):
+    """Commit at HEAD, read from the ref files without starting git"""
+    git_dir = Path(git_dir)
+    try:
+        head = (git_dir / "HEAD").read_text(encoding='utf-8').strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head[5:]
+        try:
+            return (git_dir / ref).read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            for line in (git_dir / "packed-refs").read_text(encoding='utf-8').splitlines():
+                if line.endswith(" " + ref):
+                    return line.split(" ", 1)[0]
+    except OSError:
+        pass
+    return None
+
+
+def parse_setting(text, defaults):
+    """'section.key=value' from --set, as a nested config dict; the value is
+    parsed as JSON and taken as a plain string otherwise"""
+    name, sep, value = text.partition('=')
+    section, _, key = name.partition('.')
+    if not sep or not key or key not in defaults.get(section, {}):
+        raise ValueError(f"unknown setting '{name}' (expected section.key=value)")
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return {section: {key: value}}
+
+
+class EventLog:
+    """JSON lines written by a worker and read back by the coordinator"""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, event, **fields):
+        line = json.dumps(dict(fields, t=time.time(), event=event))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    @staticmethod
+    def read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.endswith("\n")]
+        except OSError:
+            return []
+
+
+def instrument(target, events):
+    """Report saves turned into commits, push outcomes and merges of one
+    database by wrapping its engine; returns the list pending saves go to"""
+    engine = target.engine
+    pending = []  # times of saves not committed yet
+    lock = threading.Lock()
+    commit, pull, run_git = engine.commit, engine.pull, engine.run_git
+
+    def commit_saves(result, remaining):
+        with lock:
+            included = list(pending)
+        commit(result, remaining)
+        if result.committed:
+            with lock:
+                del pending[:len(included)]
+            # Syncs of one repository never overlap, so HEAD is still this commit
+            events.write("commit", sha=read_head(engine.repo_dir / ".git"), saves=included)
+
+    def pull_merges(result, remaining, fast_forward_only=False):
+        try:
+            return pull(result, remaining, fast_forward_only=fast_forward_only)
+        finally:
+            if result.merge:
+                events.write("merge", kind=result.merge, update=fast_forward_only)
+
+    def run_git_pushes(args, *rest, **kwargs):
+        try:
+            completed = run_git(args, *rest, **kwargs)
+        except subprocess.TimeoutExpired:
+            if args[0] == "push":
+                events.write("push", status="timeout")
+            raise
+        if args[0] == "push":
+            output = completed.stdout + completed.stderr
+            if completed.returncode == 0:
+                status = "ok"
+            elif "rejected" in output:
+                status = "rejected"
+            else:
+                status = "error"
+            events.write("push", status=status)
+        return completed
+
+    engine.commit, engine.pull, engine.run_git = commit_saves, pull_merges, run_git_pushes
+    return pending, lock
+
+
+def run_worker(spec_file):
+    """One simulated machine: the headless application plus a user saving"""
+    with open(spec_file, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    bench = load_benchmark()
+    app = bench.load_app()
+    tray = app.KeePassSyncTray(spec['config'], headless=True)
+    events = EventLog(spec['events'])
+    target = tray.targets[0]
+    pending, lock = instrument(target, events)
+    rng = random.Random(spec['seed'])
+
+    def save():
+        bench.save_database(target.db_file, spec['size'])
+        now = time.time()
+        with lock:
+            pending.append(now)
+        events.write("save")
+
+    def saver():
+        time.sleep(max(0, spec['start_at'] - time.time()))
+        end = spec['start_at'] + spec['duration']
+        while True:
+            delay = rng.expovariate(1 / spec['save_interval'])
+            if time.time() + delay >= end:
+                break
+            time.sleep(delay)
+            save()
+            # KeePass saves again right away when auto-save follows an edit
+            if rng.random() < spec['burst']:
+                for _ in range(rng.randint(1, 3)):
+                    time.sleep(rng.uniform(0.1, 1.0))
+                    save()
+        events.write("done")
+
+    threading.Thread(target=saver, daemon=True).start()
+    events.write("ready")
+    tray.run()
+
+
+def analyze(bench, hosts, timeline, saves_end, settled_at):
+    """Turn the event logs and the sampled HEADs into fleet metrics"""
+    ancestors = {}
+
+    def reachable(host, head):
+        if head not in ancestors:
+            ancestors[head] = set(bench.git(["rev-list", head], host['repo']).split())
+        return ancestors[head]
+
+    def first_seen(host, sha):
+        for t, head in timeline[host['name']]:
+            if head and sha in reachable(host, head):
+                return t
+        return None
+
+    latencies = []
+    unconverged = 0
+    saves = commits = 0
+    pushes = {"ok": 0, "rejected": 0, "error": 0, "timeout": 0}
+    merges = {}
+    per_host = []
+    for host in hosts:
+        events = EventLog.read(host['events'])
+        host_saves = sum(1 for e in events if e['event'] == "save")
+        host_commits = [e for e in events if e['event'] == "commit"]
+        host_pushes = [e['status'] for e in events if e['event'] == "push"]
+        committed = 0
+        for commit in host_commits:
+            committed += len(commit['saves'])
+            seen = [first_seen(other, commit['sha']) for other in hosts] if commit['sha'] else [None]
+            if None in seen:
+                unconverged += len(commit['saves'])
+                continue
+            latencies.extend(max(seen) - saved for saved in commit['saves'])
+        unconverged += host_saves - committed
+        for status in host_pushes:
+            pushes[status] += 1
+        for event in events:
+            if event['event'] == "merge" and not event['update']:
+                merges[event['kind']] = merges.get(event['kind'], 0) + 1
+        saves += host_saves
+        commits += len(host_commits)
+        per_host.append({"host": host['name'], "saves": host_saves, "commits": len(host_commits),
+                         "pushes": len(host_pushes), "rejected_pushes": host_pushes.count("rejected")})
+
+    attempts = sum(pushes.values())
+    conflicts = merges.get("kdbx", 0) + merges.get("keep-both", 0)
+    return {
+        "saves": saves,
+        "commits": commits,
+        "converged": settled_at is not None,
+        "convergence_seconds": settled_at - saves_end if settled_at is not None else None,
+        "time_to_convergence": bench.summarize(latencies),
+        "unconverged_saves": unconverged,
+        "pushes": dict(pushes, attempts=attempts),
+        "rejected_push_rate": pushes["rejected"] / attempts if attempts else None,
+        "retries_per_save": (attempts - pushes["ok"]) / saves if saves else None,
+        # Diverged pulls: "git" merged without touching the database, the others had to merge it
+        "merges": merges,
+        "conflicts": conflicts,
+        "conflict_rate": conflicts / commits if commits else None,
+        "hosts": per_host,
+    }
+
+
+def main():
+    """Main entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Stress test several KeePass Git Sync instances sharing one '
+                                                 'local bare remote')
+    parser.add_argument('--hosts', type=int, default=4, help='Simulated machines (default: 4)')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds during which the machines save')
+    parser.add_argument('--save-interval', type=float, default=15,
+                        help='Mean seconds between saves on each machine (randomized)')
+    parser.add_argument('--burst', type=float, default=0.2,
+                        help='Probability that a save is followed by 1-3 more within a second')
+    parser.add_argument('--size', type=float, default=0.1, help='Database size in MB')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the save pattern')
+    parser.add_argument('--set', action='append', default=[], metavar='SECTION.KEY=VALUE',
+                        help='Application setting for every machine, e.g. git.push_window=5 (repeatable)')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds for the instances to start')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='Seconds to wait for convergence after the last save')
+    parser.add_argument('--sample', type=float, default=0.1, help='Seconds between HEAD samples')
+    parser.add_argument('--keep', type=str, default=None, help='Keep repositories and logs in this directory')
+    parser.add_argument('--output', type=str, default='stress-results.json', help='JSON results file')
+    parser.add_argument('--worker', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+        return
+
+    bench = load_benchmark()
+    app = bench.load_app()
+    config = app.load_default_config()
+    try:
+        for setting in args.set:
+            config = app.merge_config(config, parse_setting(setting, config))
+    except (ValueError, app.ConfigError) as e:
+        parser.error(str(e))
+    config['notifications']['enabled'] = False
+
+    if args.keep:
+        root = Path(args.keep).absolute()
+        root.mkdir(parents=True, exist_ok=True)
+        tmp = None
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="keepass-sync-stress-")
+        root = Path(tmp.name)
+    size = int(args.size * bench.MB)
+    bench.make_repository(root, size)
+    remote = root / "remote.git"
+
+    hosts = []
+    for index in range(args.hosts):
+        name = f"host-{index + 1}"
+        repo = root / name
+        bench.git(["clone", "--quiet", str(remote), str(repo)], root)
+        bench.git(["config", "user.name", name], repo)
+        bench.git(["config", "user.email", f"{name}@localhost"], repo)
+        host_config = json.loads(json.dumps(config))
+        host_config['databases'] = [{"filename": bench.DB_FILENAME, "repo": str(repo), "name": name}]
+        host_config['git']['commit_message_format'] = f"Update from {name} at {{timestamp}}"
+        host_config['log']['file'] = str(root / f"{name}.log")
+        host_config['history']['file'] = str(root / f"{name}-history.db")
+        host = {"name": name, "repo": repo, "events": root / f"{name}.events",
+                "config": root / f"{name}.json"}
+        with open(host['config'], 'w', encoding='utf-8') as f:
+            json.dump(host_config, f, indent=4)
+        hosts.append(host)
+
+    start_at = time.time() + args.warmup
+    saves_end = start_at + args.duration
+    processes = []
+    for index, host in enumerate(hosts):
+        spec = {"config": str(host['config']), "events": str(host['events']), "size": size,
+                "start_at": start_at, "duration": args.duration, "save_interval": args.save_interval,
+                "burst": args.burst, "seed": args.seed * 1000 + index}
+        spec_file = root / f"{host['name']}-spec.json"
+        with open(spec_file, 'w', encoding='utf-8') as f:
+            json.dump(spec, f)
+        with open(root / f"{host['name']}.out", 'w', encoding='utf-8') as out:
+            processes.append(subprocess.Popen([sys.executable, str(Path(__file__).resolve()),
+                                               "--worker", str(spec_file)],
+                                              stdout=out, stderr=subprocess.STDOUT))
+    print(f"{args.hosts} machines saving for {args.duration:g}s (mean interval {args.save_interval:g}s) "
+          f"in {root}")
+
+    # Sample every HEAD until all machines and the remote agree and every save is committed
+    timeline = {host['name']: [] for host in hosts}
+    settled_at = None
+    deadline = saves_end + args.timeout
+    try:
+        while time.time() < deadline:
+            now = time.time()
+            heads = []
+            for host in hosts:
+                head = read_head(host['repo'] / ".git")
+                samples = timeline[host['name']]
+                if not samples or samples[-1][1] != head:
+                    samples.append((now, head))
+                heads.append(head)
+            if now > saves_end and len(set(heads)) == 1 and heads[0] == read_head(remote):
+                done = True
+                for host in hosts:
+                    events = EventLog.read(host['events'])
+                    kinds = [e['event'] for e in events]
+                    committed = sum(len(e['saves']) for e in events if e['event'] == "commit")
+                    if "done" not in kinds or committed < kinds.count("save"):
+                        done = False
+                        break
+                if done:
+                    settled_at = now
+                    break
+            if any(process.poll() is not None for process in processes):
+                print("A machine exited early; see its .out file")
+                break
+            time.sleep(args.sample)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=config['sync']['timeout'] + 15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    summary = analyze(bench, hosts, timeline, saves_end, settled_at)
+    results = {
+        "benchmark": "keepass-git-sync-stress",
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git": subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": vars(args),
+        "results": summary,
+    }
+    if tmp is not None:
+        tmp.cleanup()
+
+    latency = summary['time_to_convergence']
+    print(f"  saves: {summary['saves']} -> {summary['commits']} commits, "
+          f"{summary['unconverged_saves']} not on every machine")
+    if summary['converged']:
+        print(f"  converged {summary['convergence_seconds']:.1f}s after the last save")
+    else:
+        print(f"  did not converge within {args.timeout:g}s")
+    if latency['count']:
+        print(f"  time to convergence per save: p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s, "
+              f"max {latency['max']:.2f}s")
+    pushes = summary['pushes']
+    print(f"  pushes: {pushes['attempts']} attempts, {pushes['rejected']} rejected, "
+          f"{summary['retries_per_save'] or 0:.2f} retries per save")
+    print(f"  merges: {summary['merges'] or 'none'}, conflict rate {summary['conflict_rate'] or 0:.2f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, default=str)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
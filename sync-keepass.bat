@@ -14,11 +14,19 @@ set "COMMIT_FORMAT=Update from {hostname} at {timestamp}"
 set "AUTO_PULL=true"
 set "AUTO_PUSH=true"
 
-if exist "config.json" (
+REM The tray application passes the repository, the database and its settings
+REM in the environment; run by hand, the script reads config.json
+if defined KEEPASS_SYNC_REPO (
+    cd /d "%KEEPASS_SYNC_REPO%" || exit /b 1
+    set "DB=%KEEPASS_SYNC_DB%"
+    set "COMMIT_FORMAT=%KEEPASS_SYNC_COMMIT_FORMAT%"
+    set "AUTO_PULL=%KEEPASS_SYNC_AUTO_PULL%"
+    set "AUTO_PUSH=%KEEPASS_SYNC_AUTO_PUSH%"
+) else if exist "config.json" (
     echo Loading configuration from config.json...
     REM Simple config parsing for Windows - check if PowerShell is available
     powershell -Command "Get-Command Get-Content" >nul 2>&1
-    if %errorlevel% equ 0 (
+    if not errorlevel 1 (
         for /f "delims=" %%i in ('powershell -Command "try { $c = Get-Content 'config.json' | ConvertFrom-Json; $c.database.filename } catch { 'Passwords.kdbx' }"') do set "DB=%%i"
         for /f "delims=" %%i in ('powershell -Command "try { $c = Get-Content 'config.json' | ConvertFrom-Json; $c.git.commit_message_format } catch { 'Update from {hostname} at {timestamp}' }"') do set "COMMIT_FORMAT=%%i"
         for /f "delims=" %%i in ('powershell -Command "try { $c = Get-Content 'config.json' | ConvertFrom-Json; $c.git.auto_pull } catch { 'true' }"') do set "AUTO_PULL=%%i"
@@ -36,15 +44,23 @@ REM Pull latest changes first (if enabled)
 if "%AUTO_PULL%"=="true" (
     echo Pulling latest changes...
     git pull origin main
-    if %errorlevel% neq 0 (
+    REM Inside a parenthesised block %errorlevel% is expanded when the block is
+    REM read, before git runs; "if errorlevel" tests the current exit code
+    if errorlevel 1 (
+        REM Never leave a half-merged repository behind
+        git merge --abort >nul 2>&1
         echo Warning: Failed to pull latest changes, continuing anyway...
     )
 ) else (
     echo Auto-pull disabled, skipping pull
 )
 
-REM Check if there are any changes to commit
-git diff-index --quiet HEAD --
+REM Add database changes
+git add -- "%DB%"
+
+REM Commit only if the database changed; limiting both checks to its path keeps
+REM git from rescanning the rest of the working tree
+git diff --cached --quiet -- "%DB%"
 if %errorlevel% equ 0 (
     echo No changes to commit
     exit /b 0
@@ -56,15 +72,12 @@ set "YY=%dt:~2,2%" & set "YYYY=%dt:~0,4%" & set "MM=%dt:~4,2%" & set "DD=%dt:~6,
 set "HH=%dt:~8,2%" & set "MIN=%dt:~10,2%" & set "SS=%dt:~12,2%"
 set "timestamp=%YYYY%-%MM%-%DD% %HH%:%MIN%:%SS%"
 
-REM Add database changes
-git add "%DB%"
-
 REM Format commit message
 set "formatted_msg=%COMMIT_FORMAT:{hostname}=%COMPUTERNAME%"
 set "formatted_msg=%formatted_msg:{timestamp}=%timestamp%"
 
 REM Commit with formatted message
-git commit -m "%formatted_msg%"
+git commit -m "%formatted_msg%" -- "%DB%"
 if %errorlevel% neq 0 (
     echo Error: Failed to commit changes
     exit /b 1
@@ -74,7 +87,7 @@ REM Push to remote repository (if enabled)
 if "%AUTO_PUSH%"=="true" (
     echo Pushing changes to remote...
     git push origin main
-    if %errorlevel% neq 0 (
+    if errorlevel 1 (
         echo Error: Failed to push changes
         exit /b 1
     )
@@ -2,11 +2,22 @@
 # sync-keepass.sh
 # Works on Linux and Windows (Git Bash)
 
-cd "$(dirname "$0")" || exit 1
+# The tray application passes the repository, the database and its settings
+# in the environment; run by hand, the script syncs its own directory
+if [ -n "$KEEPASS_SYNC_REPO" ]; then
+    cd "$KEEPASS_SYNC_REPO" || exit 1
+else
+    cd "$(dirname "$0")" || exit 1
+fi
 
 # Load configuration or use defaults
 CONFIG_FILE="config.json"
-if [ -f "$CONFIG_FILE" ]; then
+if [ -n "$KEEPASS_SYNC_REPO" ]; then
+    DB="$KEEPASS_SYNC_DB"
+    COMMIT_FORMAT="$KEEPASS_SYNC_COMMIT_FORMAT"
+    AUTO_PULL="$KEEPASS_SYNC_AUTO_PULL"
+    AUTO_PUSH="$KEEPASS_SYNC_AUTO_PUSH"
+elif [ -f "$CONFIG_FILE" ]; then
     # Extract database filename from config if jq is available
     if command -v jq >/dev/null 2>&1; then
         DB=$(jq -r '.database.filename // "Passwords.kdbx"' "$CONFIG_FILE")
@@ -33,23 +44,29 @@ echo "Using database: $DB"
 # Pull latest from remote (if enabled)
 if [ "$AUTO_PULL" = "true" ]; then
     echo "Pulling latest changes..."
-    git pull --no-edit
+    if ! git pull --no-edit; then
+        # Never leave a half-merged repository behind; the tray application
+        # resolves diverged databases itself (see "Diverged Databases" in README.md)
+        git merge --abort >/dev/null 2>&1
+        echo "Warning: Failed to pull latest changes, continuing anyway..."
+    fi
 else
     echo "Auto-pull disabled, skipping pull"
 fi
 
 # Stage database
-git add "$DB"
+git add -- "$DB"
 
-# Commit only if changes exist
-if ! git diff --cached --quiet; then
+# Commit only if the database changed; limiting both checks to its path keeps
+# git from rescanning the rest of the working tree
+if ! git diff --cached --quiet -- "$DB"; then
     # Format commit message
     HOSTNAME=$(hostname)
     TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
     COMMIT_MSG="${COMMIT_FORMAT/{hostname}/$HOSTNAME}"
     COMMIT_MSG="${COMMIT_MSG/{timestamp}/$TIMESTAMP}"
     
-    git commit -m "$COMMIT_MSG"
+    git commit -m "$COMMIT_MSG" -- "$DB"
     
     if [ "$AUTO_PUSH" = "true" ]; then
         echo "Pushing changes..."
@@ -0,0 +1,73 @@
+"""Shared fixtures: the application module and small git repositories"""
+
+import os
+import hashlib
+import subprocess
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app():
+    """keepass-sync-tray.py, imported by path (the hyphen keeps it from being importable by name)"""
+    script = Path(__file__).resolve().parent.parent / "keepass-sync-tray.py"
+    spec = importlib.util.spec_from_file_location("keepass_sync_tray", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def config(app):
+    return app.load_default_config()
+
+
+def git(args, cwd, **env):
+    return subprocess.run(["git"] + args, cwd=str(cwd), check=True, capture_output=True, text=True,
+                          env=dict(os.environ, LC_ALL='C', GIT_TERMINAL_PROMPT='0', **env)).stdout
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A git repository with Passwords.kdbx committed"""
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    git(["init", "--quiet"], repo_dir)
+    git(["config", "user.name", "Test"], repo_dir)
+    git(["config", "user.email", "test@example.com"], repo_dir)
+    (repo_dir / "Passwords.kdbx").write_bytes(kdbx4(os.urandom(1000)))
+    git(["add", "Passwords.kdbx"], repo_dir)
+    git(["commit", "--quiet", "-m", "Initial database"], repo_dir)
+    return repo_dir
+
+
+@pytest.fixture
+def engine(app, config, repo):
+    return app.GitSyncEngine(repo, repo / "Passwords.kdbx", config)
+
+
+def header_field(field_id, data, length_size=4):
+    return bytes([field_id]) + len(data).to_bytes(length_size, 'little') + data
+
+
+AES_UUID = bytes.fromhex("31c1f2e6bf714350be5805216afc5aff")
+
+
+def kdbx4(payload, block_size=256):
+    """A structurally complete KDBX 4 file around a (random) payload"""
+    header = bytes.fromhex("03d9a29a67fb4bb5") + (0).to_bytes(2, 'little') + (4).to_bytes(2, 'little')
+    header += header_field(2, AES_UUID) + header_field(0, b"\r\n\r\n")
+    data = header + hashlib.sha256(header).digest() + os.urandom(32)
+    for start in range(0, len(payload), block_size):
+        block = payload[start:start + block_size]
+        data += os.urandom(32) + len(block).to_bytes(4, 'little', signed=True) + block
+    return data + os.urandom(32) + (0).to_bytes(4, 'little')
+
+
+def kdbx3(payload):
+    """A KDBX 3.1 file: 2-byte header field lengths, payload checked by size only"""
+    header = bytes.fromhex("03d9a29a67fb4bb5") + (1).to_bytes(2, 'little') + (3).to_bytes(2, 'little')
+    header += header_field(2, AES_UUID, 2) + header_field(0, b"\r\n\r\n", 2)
+    return header + payload
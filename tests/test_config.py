@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+
+def test_empty_config_is_the_defaults(app):
+    assert app.merge_config(app.DEFAULT_CONFIG, {}) == app.DEFAULT_CONFIG
+
+
+def test_sections_merge_key_by_key(app):
+    merged = app.merge_config(app.DEFAULT_CONFIG, {"git": {"auto_push": False}})
+    assert merged['git']['auto_push'] is False
+    assert merged['git']['auto_pull'] == app.DEFAULT_CONFIG['git']['auto_pull']
+
+
+def test_unknown_settings_are_ignored(app, capsys):
+    merged = app.merge_config(app.DEFAULT_CONFIG, {"git": {"no_such_setting": 1}})
+    assert "no_such_setting" not in merged['git']
+    assert "git.no_such_setting" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("user, message", [
+    ({"git": {"auto_push": "yes"}}, "'git.auto_push' must be true or false"),
+    ({"sync": {"timeout": True}}, "'sync.timeout' must be a number"),
+    ({"sync": {"max_workers": 1.5}}, "'sync.max_workers' must be a whole number"),
+    ({"sync": {"engine": "rsync"}}, "'sync.engine' must be one of builtin, script"),
+    ({"git": "main"}, "'git' must be an object"),
+    ({"metrics": {"port": 70000}}, "'metrics.port' must be a port number"),
+    ({"sync": {"settle_time": -1}}, "'sync.settle_time' must be a number of at least 0"),
+])
+def test_invalid_values_name_the_setting(app, user, message):
+    with pytest.raises(app.ConfigError, match=message):
+        app.merge_config(app.DEFAULT_CONFIG, user)
+
+
+@pytest.mark.parametrize("name", sorted({
+    "database.monitor_interval", "git.push_retry_base", "sync.timeout", "sync.max_workers",
+    "remote_poll.active_interval", "log.output_limit",
+}))
+def test_zero_is_rejected_where_it_would_stall(app, name):
+    section, key = name.split('.')
+    with pytest.raises(app.ConfigError, match=f"'{name}' must be"):
+        app.merge_config(app.DEFAULT_CONFIG, {section: {key: 0}})
+
+
+def test_positive_settings_are_known(app):
+    for name in app.CONFIG_POSITIVE | app.CONFIG_INTEGERS:
+        section, key = name.split('.')
+        assert key in app.DEFAULT_CONFIG[section], name
+
+
+@pytest.mark.parametrize("databases, message", [
+    ({"filename": "a.kdbx"}, "'databases' must be a list"),
+    ([{"repo": "vault"}], "'databases\\[0\\]' needs a \"filename\""),
+    ([{"filename": ""}], "'databases\\[0\\].filename' must be a non-empty string"),
+])
+def test_invalid_databases(app, databases, message):
+    with pytest.raises(app.ConfigError, match=message):
+        app.merge_config(app.DEFAULT_CONFIG, {"databases": databases})
+
+
+def test_database_entries(app, tmp_path):
+    config = app.merge_config(app.DEFAULT_CONFIG, {"databases": [
+        {"filename": "Passwords.kdbx"},
+        {"filename": "work.kdbx", "repo": "work", "name": "Work"},
+    ]})
+    entries = list(app.database_entries(config, tmp_path))
+    assert entries == [
+        ("Passwords", tmp_path.resolve(), tmp_path.resolve() / "Passwords.kdbx"),
+        ("Work", (tmp_path / "work").resolve(), (tmp_path / "work").resolve() / "work.kdbx"),
+    ]
+
+
+def test_load_config_file_reports_the_json_error(app, tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text('{"git": {"auto_push": false,}}', encoding='utf-8')
+    with pytest.raises(app.ConfigError, match="invalid JSON at line 1"):
+        app.load_config_file(path)
+
+
+def test_load_config_file(app, tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"database": {"filename": "Vault.kdbx"}}), encoding='utf-8')
+    assert app.load_config_file(path)['database']['filename'] == "Vault.kdbx"
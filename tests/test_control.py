@@ -0,0 +1,55 @@
+import os
+import json
+import socket
+import threading
+
+import pytest
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason="connects to the Unix domain socket directly")
+
+
+@pytest.fixture
+def server(app, tmp_path):
+    server = app.ControlServer(str(tmp_path / "control.sock"),
+                               lambda request: {"ok": True, "message": request["command"]})
+    server.start()
+    yield server
+    server.close()
+
+
+def send(app, server, command):
+    from multiprocessing.connection import Client
+    with Client(server.address, app.control_family(), authkey=server.authkey) as conn:
+        conn.send_bytes(json.dumps({"command": command}).encode('utf-8'))
+        return json.loads(conn.recv_bytes())
+
+
+def test_request_and_reply(app, server):
+    assert send(app, server, "status") == {"ok": True, "message": "status"}
+
+
+def test_wrong_key_is_refused(app, server):
+    from multiprocessing.connection import Client, AuthenticationError
+    with pytest.raises((AuthenticationError, EOFError, OSError)):
+        Client(server.address, app.control_family(), authkey=os.urandom(32))
+    assert send(app, server, "status")["ok"]
+
+
+def test_silent_client_does_not_block_others(app, server):
+    silent = socket.socket(socket.AF_UNIX)
+    silent.connect(server.address)
+    try:
+        replies = []
+        client = threading.Thread(target=lambda: replies.append(send(app, server, "status")), daemon=True)
+        client.start()
+        client.join(5)
+        assert replies == [{"ok": True, "message": "status"}]
+    finally:
+        silent.close()
+
+
+def test_invalid_request_gets_an_error(app, server):
+    from multiprocessing.connection import Client
+    with Client(server.address, app.control_family(), authkey=server.authkey) as conn:
+        conn.send_bytes(b"not json")
+        assert json.loads(conn.recv_bytes())["ok"] is False
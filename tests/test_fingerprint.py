@@ -0,0 +1,59 @@
+import json
+
+from conftest import git
+
+
+def test_fingerprint_committed_database_needs_no_sync(app, engine):
+    fingerprint = app.DatabaseFingerprint(engine)
+    assert not fingerprint.needs_sync()
+
+
+def test_fingerprint_detects_changed_content(app, engine):
+    fingerprint = app.DatabaseFingerprint(engine)
+    with open(engine.db_file, 'ab') as f:
+        f.write(b"changed")
+    assert fingerprint.needs_sync()
+
+
+def test_fingerprint_ignores_identical_rewrite(app, engine):
+    fingerprint = app.DatabaseFingerprint(engine)
+    data = engine.db_file.read_bytes()
+    engine.db_file.unlink()
+    engine.db_file.write_bytes(data)
+    assert not fingerprint.needs_sync()
+    # The new stat key was remembered, so the next check does not hash the file
+    state = json.loads(fingerprint.state_file.read_text(encoding='utf-8'))
+    assert state["Passwords.kdbx"]["stat"] == fingerprint.stat_key()
+
+
+def test_fingerprint_record_synced(app, engine, repo):
+    fingerprint = app.DatabaseFingerprint(engine)
+    with open(engine.db_file, 'ab') as f:
+        f.write(b"changed")
+    git(["commit", "--quiet", "-am", "Update"], repo)
+    fingerprint.record_synced()
+    assert not app.DatabaseFingerprint(engine).needs_sync()
+
+
+def test_fingerprint_record_synced_after_commit_reuses_the_hash(app, engine, repo, monkeypatch):
+    fingerprint = app.DatabaseFingerprint(engine)
+    with open(engine.db_file, 'ab') as f:
+        f.write(b"changed")
+    assert fingerprint.needs_sync()
+    git(["commit", "--quiet", "-am", "Update"], repo)
+
+    def run_git(*args, **kwargs):
+        raise AssertionError("git was asked for the blob at HEAD")
+    monkeypatch.setattr(engine, "run_git", run_git)
+    fingerprint.record_synced(committed=True)
+    assert not fingerprint.needs_sync()
+
+
+def test_fingerprint_blob_id_matches_git(app, engine, repo):
+    fingerprint = app.DatabaseFingerprint(engine)
+    assert fingerprint.blob_id() == git(["hash-object", "Passwords.kdbx"], repo).strip()
+
+
+def test_fingerprint_missing_database(app, engine):
+    engine.db_file.unlink()
+    assert not app.DatabaseFingerprint(engine).needs_sync()
@@ -0,0 +1,84 @@
+import sys
+import subprocess
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.platform != "linux", reason="fsmonitor provider uses inotify")
+
+
+@pytest.fixture
+def provider(app, engine):
+    provider = app.FsmonitorProvider(engine)
+    yield provider
+    provider.close()
+
+
+def query(provider, token):
+    """Ask the hook as git would; returns (new token, changed paths)"""
+    output = subprocess.run(["sh", str(provider.hook), "2", token], capture_output=True, check=True).stdout
+    fields = output.decode('utf-8').split('\0')
+    return fields[0], [path for path in fields[1:] if path]
+
+
+def test_unknown_token_rescans_everything(provider):
+    token = provider.prepare()
+    assert query(provider, "other:1") == (token, ["/"])
+
+
+def test_changes_since_acknowledged_token(provider, repo):
+    first = provider.prepare()
+    provider.acknowledge(first)
+    (repo / "Passwords.kdbx").write_bytes(b"changed")
+    (repo / "notes").mkdir()
+    (repo / "notes" / "todo.txt").write_text("x", encoding='utf-8')
+    second = provider.prepare()
+    token, paths = query(provider, first)
+    assert token == second
+    assert "Passwords.kdbx" in paths
+    assert "notes/" in paths
+    # The new directory is watched as well
+    provider.acknowledge(second)
+    (repo / "notes" / "todo.txt").write_text("y", encoding='utf-8')
+    third = provider.prepare()
+    assert query(provider, second) == (third, ["notes/todo.txt"])
+
+
+def test_unacknowledged_token_keeps_changes(provider, repo):
+    first = provider.prepare()
+    provider.acknowledge(first)
+    (repo / "Passwords.kdbx").write_bytes(b"changed")
+    provider.prepare()  # git failed: not acknowledged
+    provider.prepare()
+    assert query(provider, first)[1] == ["Passwords.kdbx"]
+
+
+def test_stale_acknowledge_is_ignored(provider, repo):
+    first = provider.prepare()
+    provider.acknowledge(first)
+    (repo / "Passwords.kdbx").write_bytes(b"changed")
+    second = provider.prepare()
+    provider.prepare()
+    provider.acknowledge(second)  # a later prepare() already handed out a newer token
+    assert query(provider, first)[1] == ["Passwords.kdbx"]
+
+
+def test_git_dir_changes_are_ignored(provider, repo):
+    first = provider.prepare()
+    provider.acknowledge(first)
+    (repo / ".git" / "scratch").write_text("x", encoding='utf-8')
+    provider.prepare()
+    assert query(provider, first)[1] == []
+
+
+def test_closed_provider_rescans(provider):
+    provider.prepare()
+    provider.close()
+    assert query(provider, "any:1")[1] == ["/"]
+
+
+def test_git_uses_the_hook(provider, engine, repo):
+    (repo / "Passwords.kdbx").write_bytes(b"changed")
+    status = engine.run_git(["status", "--porcelain"])
+    assert status.stdout.strip() == "M Passwords.kdbx"
+    status = engine.run_git(["status", "--porcelain"])
+    assert status.stdout.strip() == "M Passwords.kdbx"
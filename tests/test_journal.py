@@ -0,0 +1,30 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def history(app, config, tmp_path):
+    """A journal with one attempt of every kind, closed so the batch is written"""
+    config['history']['flush_interval'] = 0.01
+    journal = app.SyncJournal(tmp_path / "history.db", config)
+    for outcome in ("success", "skipped", "postponed", "failure", "timeout", "success"):
+        result = app.SyncResult()
+        result.phases["total"] = 0.5
+        journal.record("Passwords", ["change"], outcome, result)
+    journal.close()
+    conn = sqlite3.connect(str(tmp_path / "history.db"))
+    yield conn
+    conn.close()
+
+
+def test_every_attempt_is_recorded(app, history):
+    rows = app.SyncJournal.recent(history, 20)
+    assert sorted(row[3] for row in rows) == ["failure", "postponed", "skipped", "success", "success", "timeout"]
+
+
+def test_skipped_is_not_a_failure(app, history):
+    assert sorted(row[3] for row in app.SyncJournal.recent(history, 20, failures_only=True)) == ["failure", "timeout"]
+    (day, runs, failures, *_), = app.SyncJournal.per_day(history, 1)
+    assert (runs, failures) == (6, 2)
+    assert app.SyncJournal.totals(history)["Passwords"][0] == 2
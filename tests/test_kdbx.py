@@ -0,0 +1,51 @@
+import os
+
+from conftest import kdbx3, kdbx4
+
+
+def write(tmp_path, data):
+    path = tmp_path / "Passwords.kdbx"
+    path.write_bytes(data)
+    return path
+
+
+def test_complete_kdbx4(app, tmp_path):
+    assert app.check_kdbx(write(tmp_path, kdbx4(os.urandom(5000)))) is None
+
+
+def test_truncated_kdbx4(app, tmp_path):
+    data = kdbx4(os.urandom(5000))
+    assert app.check_kdbx(write(tmp_path, data[:-10])) == "truncated payload"
+    assert app.check_kdbx(write(tmp_path, data[:20])) == "truncated header"
+    assert app.check_kdbx(write(tmp_path, data[:8])) == "only 8 bytes"
+
+
+def test_kdbx4_with_trailing_data(app, tmp_path):
+    data = kdbx4(os.urandom(500)) + b"\0" * 16
+    assert app.check_kdbx(write(tmp_path, data)) == "data after the end of the payload"
+
+
+def test_kdbx4_header_hash(app, tmp_path):
+    data = bytearray(kdbx4(os.urandom(500)))
+    data[20] ^= 0xFF  # inside the cipher field
+    assert app.check_kdbx(write(tmp_path, bytes(data))) == "header hash mismatch"
+
+
+def test_kdbx3_payload_size(app, tmp_path):
+    assert app.check_kdbx(write(tmp_path, kdbx3(os.urandom(64)))) is None
+    assert app.check_kdbx(write(tmp_path, kdbx3(os.urandom(70)))) == \
+        "payload is not a whole number of cipher blocks"
+    assert app.check_kdbx(write(tmp_path, kdbx3(os.urandom(16)))) == "truncated payload"
+
+
+def test_not_a_database(app, tmp_path):
+    assert app.check_kdbx(write(tmp_path, b"PK\x03\x04" + os.urandom(100))) == "no KDBX signature"
+
+
+def test_keepass1_is_accepted(app, tmp_path):
+    data = bytes.fromhex("03d9a29a65fb4bb5") + os.urandom(200)
+    assert app.check_kdbx(write(tmp_path, data)) is None
+
+
+def test_missing_file(app, tmp_path):
+    assert app.check_kdbx(tmp_path / "missing.kdbx").startswith("cannot read")
@@ -0,0 +1,270 @@
+import os
+import time
+import subprocess
+
+import pytest
+
+from conftest import git, kdbx4
+
+
+def commit_file(repo, name, data, message="Update", **env):
+    (repo / name).write_bytes(data)
+    git(["add", name], repo)
+    git(["commit", "--quiet", "-m", message], repo, **env)
+
+
+@pytest.fixture
+def remote(tmp_path, repo):
+    """A bare remote holding the repo fixture's history, with the repo tracking it"""
+    remote_dir = tmp_path / "remote.git"
+    git(["init", "--quiet", "--bare", str(remote_dir)], tmp_path)
+    git(["remote", "add", "origin", str(remote_dir)], repo)
+    git(["push", "--quiet", "-u", "origin", "HEAD"], repo)
+    return remote_dir
+
+
+@pytest.fixture
+def clone(app, config, tmp_path, remote, repo):
+    """Engine of a second machine's clone of the remote"""
+    branch = git(["symbolic-ref", "--short", "HEAD"], repo).strip()
+    clone_dir = tmp_path / "clone"
+    git(["clone", "--quiet", "-b", branch, str(remote), str(clone_dir)], tmp_path)
+    git(["config", "user.name", "Other"], clone_dir)
+    git(["config", "user.email", "other@example.com"], clone_dir)
+    return app.GitSyncEngine(clone_dir, clone_dir / "Passwords.kdbx", config)
+
+
+@pytest.fixture(autouse=True)
+def no_merge_password(monkeypatch):
+    monkeypatch.delenv("KEEPASS_SYNC_PASSWORD", raising=False)
+
+
+def test_fast_forward(engine, clone):
+    clone.db_file.write_bytes(kdbx4(os.urandom(500)))
+    clone.sync()
+    result = engine.sync()
+    assert engine.db_file.read_bytes() == clone.db_file.read_bytes()
+    assert result.merge == "fast-forward"
+
+
+def test_push_without_remote_changes_needs_no_pull(engine, remote):
+    engine.db_file.write_bytes(kdbx4(os.urandom(500)))
+    result = engine.sync()
+    assert result.committed and result.pushed
+    assert "pull" not in result.phases
+    assert git(["rev-parse", "HEAD"], remote) == git(["rev-parse", "HEAD"], engine.repo_dir)
+
+
+def test_untracked_database_is_added(app, config, engine, remote):
+    other = engine.repo_dir / "Other.kdbx"
+    other.write_bytes(kdbx4(os.urandom(500)))
+    result = app.GitSyncEngine(engine.repo_dir, other, config).sync()
+    assert result.committed and result.pushed
+    assert git(["ls-tree", "--name-only", "HEAD"], remote).split() == ["Other.kdbx", "Passwords.kdbx"]
+
+
+def test_diverged_database_keeps_both_versions(app, engine, clone):
+    clone.db_file.write_bytes(kdbx4(os.urandom(500)))
+    clone.sync()
+    ours = kdbx4(os.urandom(500))
+    engine.db_file.write_bytes(ours)
+    result = engine.sync()
+
+    assert result.merge == "keep-both"
+    assert len(result.conflict_copies) == 1
+    conflict_copy = engine.repo_dir / result.conflict_copies[0]
+    assert conflict_copy.read_bytes() == clone.db_file.read_bytes()
+    assert engine.db_file.read_bytes() == ours
+    tracked = git(["ls-files"], engine.repo_dir).splitlines()
+    assert result.conflict_copies[0] in tracked
+    assert not engine.git_path("MERGE_HEAD").exists()
+    assert git(["status", "--porcelain"], engine.repo_dir) == ""
+    # The merge commit reached the remote, and the other machine gets both files
+    assert result.pushed
+    clone.sync()
+    assert (clone.repo_dir / result.conflict_copies[0]).exists()
+
+
+def test_conflict_on_another_file_aborts_the_merge(app, engine, clone):
+    commit_file(clone.repo_dir, "notes.txt", b"theirs\n")
+    git(["push", "--quiet"], clone.repo_dir)
+    commit_file(engine.repo_dir, "notes.txt", b"ours\n")
+    head = git(["rev-parse", "HEAD"], engine.repo_dir)
+
+    with pytest.raises(app.GitCommandError) as error:
+        engine.sync()
+    assert error.value.phase == "conflict"
+    assert "notes.txt" in error.value.output
+    assert not engine.git_path("MERGE_HEAD").exists()
+    assert git(["rev-parse", "HEAD"], engine.repo_dir) == head
+    assert (engine.repo_dir / "notes.txt").read_bytes() == b"ours\n"
+
+
+def test_every_database_of_the_repository_is_resolved(app, engine, clone):
+    for side in (engine, clone):
+        side.databases = [side.db_file, side.repo_dir / "Work.kdbx"]
+    commit_file(engine.repo_dir, "Work.kdbx", kdbx4(os.urandom(500)))
+    engine.sync()
+    clone.sync()
+    for name in ("Passwords.kdbx", "Work.kdbx"):
+        commit_file(clone.repo_dir, name, kdbx4(os.urandom(500)))
+        commit_file(engine.repo_dir, name, kdbx4(os.urandom(500)))
+    clone.sync()
+    result = engine.sync()
+    assert result.merge == "keep-both"
+    assert sorted(path.split(' ')[0] for path in result.conflict_copies) == ["Passwords", "Work"]
+    assert not engine.git_path("MERGE_HEAD").exists()
+
+
+def old_history(repo, commits):
+    """Commits a day-old database several times within one hour"""
+    day_old = int(time.time()) - 3 * 86400
+    for i in range(commits):
+        date = f"{day_old + i * 60} +0000"
+        commit_file(repo, "Passwords.kdbx", kdbx4(os.urandom(500)), f"Save {i}",
+                    GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+
+
+@pytest.fixture
+def compacted(app, config, engine, clone):
+    """The first machine compacts history the clone already has"""
+    old_history(engine.repo_dir, 4)
+    engine.sync()
+    clone.sync()
+    maintenance = app.RepositoryMaintenance(engine, lambda: None, config)
+    assert maintenance.compact_history(1, 30) > 0
+    return engine
+
+
+def test_clone_moves_to_the_compacted_history(compacted, clone):
+    result = clone.sync()
+    upstream = git(["rev-parse", "@{upstream}"], clone.repo_dir)
+    assert git(["rev-parse", "HEAD"], clone.repo_dir) == upstream
+    assert any("compacted on another machine" in output for _, output in result.log)
+    assert clone.db_file.read_bytes() == compacted.db_file.read_bytes()
+
+
+def test_clone_carries_its_save_over_the_compaction(compacted, clone):
+    ours = kdbx4(os.urandom(500))
+    clone.db_file.write_bytes(ours)
+    result = clone.sync()
+    assert result.pushed
+    assert clone.db_file.read_bytes() == ours
+    # Built on the new history: the dropped commits did not come back
+    log = git(["log", "--format=%s", "HEAD"], clone.repo_dir).splitlines()
+    assert len(log) == len(git(["log", "--format=%s", "HEAD"], compacted.repo_dir).splitlines()) + 1
+    compacted.sync()
+    assert compacted.db_file.read_bytes() == ours
+
+
+def test_compacted_history_is_kept_until_the_next_run(app, config, compacted):
+    maintenance = app.RepositoryMaintenance(compacted, lambda: None, config)
+    old_head = git(["rev-parse", maintenance.BACKUP_REF], compacted.repo_dir).strip()
+    assert old_head != git(["rev-parse", "HEAD"], compacted.repo_dir).strip()
+    assert git(["cat-file", "-t", old_head], compacted.repo_dir) == "commit\n"
+    maintenance.run()
+    assert not git(["for-each-ref", maintenance.BACKUP_REF], compacted.repo_dir)
+    with pytest.raises(subprocess.CalledProcessError):
+        git(["cat-file", "-e", old_head], compacted.repo_dir)
+
+
+class TestKdbxMerger:
+    """Entry-level merge of real databases; needs pykeepass"""
+
+    PASSWORD = "correct horse battery staple"
+
+    @pytest.fixture(autouse=True)
+    def pykeepass(self):
+        return pytest.importorskip("pykeepass")
+
+    @pytest.fixture
+    def base(self, pykeepass, tmp_path):
+        from datetime import datetime, timezone
+        kp = pykeepass.create_database(str(tmp_path / "base.kdbx"), password=self.PASSWORD)
+        # A cheap Argon2 setting keeps every later open and save fast
+        kdf = kp.kdbx.header.value.dynamic_header.kdf_parameters.data.dict
+        kdf['I'].value, kdf['M'].value = 1, 1024 * 1024
+        group = kp.add_group(kp.root_group, "Web")
+        for title in ("keep", "edit-here", "edit-there", "edit-both", "delete-here", "delete-there"):
+            entry = kp.add_entry(group, title, "user", "base")
+            entry.mtime = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        kp.save()
+        return tmp_path / "base.kdbx"
+
+    def edit(self, pykeepass, base, path, changes):
+        from datetime import datetime, timezone
+        path.write_bytes(base.read_bytes())
+        kp = pykeepass.PyKeePass(str(path), password=self.PASSWORD)
+        changes(kp, lambda title: kp.find_entries(title=title, first=True),
+                lambda year: datetime(year, 1, 1, tzinfo=timezone.utc))
+        kp.save()
+        return path
+
+    def test_three_way_merge(self, app, pykeepass, base, tmp_path):
+        def here(kp, entry, when):
+            entry("edit-here").password = "here"
+            entry("edit-both").password = "here"
+            entry("edit-both").mtime = when(2021)
+            kp.delete_entry(entry("delete-here"))
+            kp.add_entry(kp.root_group, "added-here", "user", "here")
+
+        def there(kp, entry, when):
+            entry("edit-there").password = "there"
+            entry("edit-both").password = "there"
+            entry("edit-both").mtime = when(2022)
+            kp.delete_entry(entry("delete-there"))
+            kp.add_entry(kp.find_groups(name="Web", first=True), "added-there", "user", "there")
+
+        ours = self.edit(pykeepass, base, tmp_path / "ours.kdbx", here)
+        theirs = self.edit(pykeepass, base, tmp_path / "theirs.kdbx", there)
+        merged = tmp_path / "merged.kdbx"
+        stats = app.KdbxMerger(self.PASSWORD).merge(base, ours, theirs, merged)
+
+        kp = pykeepass.PyKeePass(str(merged), password=self.PASSWORD)
+        passwords = {entry.title: entry.password for entry in kp.entries}
+        assert passwords == {
+            "keep": "base", "edit-here": "here", "edit-there": "there", "edit-both": "there",
+            "added-here": "here", "added-there": "there",
+        }
+        assert kp.find_entries(title="added-there", first=True).group.name == "Web"
+        # The losing edit of the entry changed on both sides is kept in its history
+        assert [item.password for item in kp.find_entries(title="edit-both", first=True).history] == ["here"]
+        assert stats == {"added": 1, "updated": 2, "deleted": 1, "conflicts": 1}
+
+    def test_newer_local_edit_wins(self, app, pykeepass, base, tmp_path):
+        def edit_both(password, year):
+            def changes(kp, entry, when):
+                entry("edit-both").password = password
+                entry("edit-both").mtime = when(year)
+            return changes
+
+        ours = self.edit(pykeepass, base, tmp_path / "ours.kdbx", edit_both("here", 2023))
+        theirs = self.edit(pykeepass, base, tmp_path / "theirs.kdbx", edit_both("there", 2022))
+        merged = tmp_path / "merged.kdbx"
+        app.KdbxMerger(self.PASSWORD).merge(base, ours, theirs, merged)
+
+        entry = pykeepass.PyKeePass(str(merged), password=self.PASSWORD).find_entries(title="edit-both", first=True)
+        assert entry.password == "here"
+        assert [item.password for item in entry.history] == ["there"]
+
+    def test_sync_merges_entries(self, app, pykeepass, base, engine, clone, monkeypatch):
+        monkeypatch.setenv("KEEPASS_SYNC_PASSWORD", self.PASSWORD)
+        commit_file(engine.repo_dir, "Passwords.kdbx", base.read_bytes())
+        engine.sync()
+        clone.sync()
+
+        def add(title):
+            def changes(kp, entry, when):
+                kp.add_entry(kp.root_group, title, "user", title)
+            return changes
+
+        self.edit(pykeepass, base, clone.db_file, add("from-clone"))
+        clone.sync()
+        self.edit(pykeepass, base, engine.db_file, add("from-engine"))
+        result = engine.sync()
+
+        assert result.merge == "kdbx"
+        assert result.conflict_copies == []
+        assert not engine.git_path("MERGE_HEAD").exists()
+        titles = {entry.title for entry in pykeepass.PyKeePass(str(engine.db_file), password=self.PASSWORD).entries}
+        assert {"from-clone", "from-engine"} <= titles
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+
+import pytest
+
+
+def test_bounded_output_keeps_everything_without_limit(app):
+    output = app.BoundedOutput()
+    for chunk in (b"abc", b"def\r\n"):
+        output.append(chunk)
+    assert output.text() == "abcdef\n"
+
+
+def test_bounded_output_keeps_head_and_tail(app):
+    output = app.BoundedOutput(limit=10)
+    output.append(b"0123456789")
+    assert output.text() == "0123456789"
+    output.append(b"abcdefghij")
+    assert output.head == b"01234"
+    assert output.tail == b"fghij"
+    assert output.dropped == 10
+    assert output.text() == "01234\n... [10 bytes of output truncated] ...\nfghij"
+
+
+def test_bounded_output_replaces_invalid_utf8(app):
+    output = app.BoundedOutput()
+    output.append(b"caf\xc3")
+    assert output.text() == "caf�"
+
+
+def test_run_bounded_limits_output(app):
+    result = app.run_bounded([sys.executable, "-c", "print('x' * 1000, end='')"], limit=100)
+    assert result.returncode == 0
+    assert result.stdout.startswith('x' * 50 + "\n... [900 bytes")
+
+
+def test_run_bounded_kills_on_timeout(app):
+    with pytest.raises(subprocess.TimeoutExpired):
+        app.run_bounded([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.5)
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="checks the process group with os.kill")
+def test_timeout_kills_the_whole_process_group(app, tmp_path):
+    pid_file = tmp_path / "grandchild.pid"
+    script = ("import subprocess, sys, time; "
+              "p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']); "
+              f"open({str(pid_file)!r}, 'w').write(str(p.pid)); time.sleep(30)")
+    with pytest.raises(subprocess.TimeoutExpired):
+        app.run_bounded([sys.executable, "-c", script], timeout=1)
+    grandchild = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            os.kill(grandchild, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.05)
+    pytest.fail("the grandchild survived the timeout")
+
+
+def test_shutdown_cancels_running_children(app):
+    runtime = app.AsyncRuntime()
+    outcome = []
+
+    def run():
+        try:
+            runtime.run_process([sys.executable, "-c", "import time; time.sleep(30)"])
+        except app.ProcessCancelled:
+            outcome.append("cancelled")
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    time.sleep(0.5)
+    runtime.shutdown(0.2)
+    worker.join(5)
+    assert outcome == ["cancelled"]
+    with pytest.raises(app.ProcessCancelled):
+        runtime.run_process([sys.executable, "-c", "pass"])
+
+
+def test_run_bounded_writes_stdout_to_a_file(app, tmp_path):
+    with open(tmp_path / "out", 'wb') as f:
+        result = app.run_bounded([sys.executable, "-c", "print('hello')"], stdout=f)
+    assert result.stdout == ""
+    assert (tmp_path / "out").read_bytes().strip() == b"hello"
@@ -0,0 +1,87 @@
+import json
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def pushes():
+    """Records trigger calls of a PushQueue"""
+    fired = threading.Event()
+    fired.count = 0
+
+    def trigger():
+        fired.count += 1
+        fired.set()
+    fired.trigger = trigger
+    return fired
+
+
+@pytest.fixture
+def queue(app, engine, pushes):
+    queue = app.PushQueue(engine, pushes.trigger, window=0.1, retry_base=5, retry_max=60)
+    yield queue
+    queue.cancel()
+
+
+def saved(queue):
+    return json.loads(queue.state_file.read_text(encoding='utf-8'))
+
+
+def test_commit_pushes_at_the_end_of_the_window(queue, pushes):
+    queue.committed()
+    assert saved(queue)["pending"] is True
+    assert pushes.wait(5)
+    queue.succeeded()
+    assert saved(queue) == {"pending": False, "attempts": 0, "next_attempt": 0}
+
+
+def test_commits_in_one_window_share_a_push(queue, pushes):
+    queue.committed()
+    queue.committed()
+    assert pushes.wait(5)
+    assert pushes.count == 1
+
+
+def test_failed_pushes_back_off(queue, monkeypatch):
+    delays = []
+    monkeypatch.setattr(queue, "_arm", delays.append)
+    for _ in range(6):
+        queue.failed()
+    assert queue.attempts == 6
+    for attempt, delay in enumerate(delays):
+        limit = min(60, 5 * 2 ** attempt)
+        assert limit / 2 <= delay <= limit
+
+
+def test_pending_push_survives_a_restart(app, engine, queue, pushes):
+    queue.failed()
+    queue.cancel()
+    restarted = app.PushQueue(engine, pushes.trigger, window=0.1)
+    restarted._state["next_attempt"] = 0  # due now
+    restarted.resume()
+    try:
+        assert restarted.attempts == 1
+        assert pushes.wait(5)
+    finally:
+        restarted.cancel()
+
+
+def test_held_push_waits_for_the_next_commit(queue, pushes):
+    queue.failed()
+    queue.hold()
+    queue.resume()
+    assert not pushes.wait(0.3)
+    queue.committed()
+    assert pushes.wait(5)
+
+
+@pytest.mark.parametrize("output, network", [
+    ("fatal: unable to access 'https://example.com/repo.git/': Could not resolve host: example.com", True),
+    ("ssh: connect to host example.com port 22: Connection refused\n"
+     "fatal: Could not read from remote repository.", True),
+    ("error: failed to push some refs to 'origin'\nhint: Updates were rejected", False),
+    ("fatal: not a git repository (or any of the parent directories): .git", False),
+])
+def test_git_command_error_network(app, output, network):
+    assert app.GitCommandError("push", 128, output).is_network_error is network
@@ -0,0 +1,53 @@
+class Engine:
+    def __init__(self, error=None):
+        self.error = error
+
+    def remote_moved(self):
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class Log:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message, **fields):
+        self.errors.append(message)
+
+
+def started(app, config, engine, log):
+    triggered = []
+    poller = app.RemotePoller(engine, lambda: triggered.append(True), config, log=log)
+    poller.start()
+    return poller, triggered
+
+
+def test_moved_remote_triggers_an_update(app, config):
+    poller, triggered = started(app, config, Engine(), Log())
+    try:
+        poller.check()
+        assert triggered == [True]
+        assert poller._timer is not None
+    finally:
+        poller.cancel()
+
+
+def test_unexpected_error_is_logged_and_checks_continue(app, config):
+    log = Log()
+    poller, triggered = started(app, config, Engine(KeyError("HEAD")), log)
+    try:
+        first = poller._timer
+        poller.check()
+        assert triggered == []
+        assert log.errors == ["Remote check failed: 'HEAD'"]
+        assert poller._timer is not None and poller._timer is not first
+    finally:
+        poller.cancel()
+
+
+def test_cancelled_poller_is_not_rearmed(app, config):
+    poller, _ = started(app, config, Engine(KeyError("HEAD")), Log())
+    poller.cancel()
+    poller.check()
+    assert poller._timer is None
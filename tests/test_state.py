@@ -0,0 +1,35 @@
+import os
+import json
+
+from conftest import git
+
+
+def test_write_json_atomic(app, tmp_path):
+    path = tmp_path / "state.json"
+    app.write_json_atomic(path, {"a": 1})
+    app.write_json_atomic(path, {"b": 2})
+    assert json.loads(path.read_text(encoding='utf-8')) == {"b": 2}
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_write_json_atomic_private(app, tmp_path):
+    path = tmp_path / "control.json"
+    app.write_json_atomic(path, {"key": "secret"}, private=True)
+    if os.name != 'nt':
+        assert path.stat().st_mode & 0o077 == 0
+
+
+def test_state_path_in_git_dir(engine, repo):
+    assert engine.state_path("keepass-sync-state.json") == repo.resolve() / ".git" / "keepass-sync-state.json"
+
+
+def test_state_path_in_linked_worktree(app, config, repo, tmp_path):
+    git(["worktree", "add", "--quiet", str(tmp_path / "worktree")], repo)
+    engine = app.GitSyncEngine(tmp_path / "worktree", tmp_path / "worktree" / "Passwords.kdbx", config)
+    state = engine.state_path("keepass-sync-state.json")
+    assert state.parent.parent == repo.resolve() / ".git" / "worktrees"
+
+
+def test_state_path_outside_git(app, config, tmp_path):
+    engine = app.GitSyncEngine(tmp_path, tmp_path / "Passwords.kdbx", config)
+    assert engine.state_path("keepass-sync-state.json") == tmp_path / "keepass-sync-state.json"